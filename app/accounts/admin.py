@@ -2,7 +2,7 @@ from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.utils.translation import gettext as _
 from profiles import models
-from .models import User
+from .models import User, OutboundEmail
 
 
 class UserAdmin(BaseUserAdmin):
@@ -26,5 +26,11 @@ class UserAdmin(BaseUserAdmin):
     )
 
 
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ('id', 'to', 'subject', 'status', 'attempts', 'created_at', 'sent_at')
+    list_filter = ('status',)
+
+
 admin.site.register(User, UserAdmin)
+admin.site.register(OutboundEmail, OutboundEmailAdmin)
 admin.site.register(models.Profile)
@@ -0,0 +1,89 @@
+"""
+JWT authentication with the user and their profile loaded together.
+
+The user is read with its profile in one query and the field values of
+both are kept in the shared cache for AUTH_USER_CACHE_TIMEOUT seconds, so
+most requests authenticate without touching the database and
+request.user.profile never costs a query. The password hash is not
+cached, the user is rebuilt with it deferred. Saving or deleting a user or
+a profile drops the cached copy, see accounts.signals.
+
+Writes that bypass the signals (queryset updates from tasks) leave the
+cached copy stale until it expires, views re-read the user or profile
+before saving them.
+"""
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from profiles.models import Profile
+
+AUTH_USER_CACHE_TIMEOUT = getattr(settings, 'AUTH_USER_CACHE_TIMEOUT', 60)
+# never written to the cache
+SECRET_USER_FIELDS = ('password',)
+
+
+def auth_user_key(user_id):
+    return 'auth:user:{}'.format(user_id)
+
+
+def invalidate_cached_user(user_id):
+    cache.delete(auth_user_key(user_id))
+
+
+def _field_names(model, exclude=()):
+    # in concrete field order, as Model.from_db expects them
+    return [field.attname for field in model._meta.concrete_fields if field.attname not in exclude]
+
+
+def load_user(user_id):
+    """
+        (user values, profile values or None) of the user, None when there
+        is no such user
+    """
+
+    user_fields = _field_names(get_user_model(), exclude=SECRET_USER_FIELDS)
+    profile_fields = _field_names(Profile)
+    row = get_user_model().objects.filter(**{api_settings.USER_ID_FIELD: user_id}) \
+        .values_list(*user_fields, *('profile__' + name for name in profile_fields)).first()
+    if row is None:
+        return None
+    user_values, profile_values = row[:len(user_fields)], row[len(user_fields):]
+    return user_values, profile_values if profile_values[0] is not None else None
+
+
+def build_user(user_values, profile_values):
+    user_model = get_user_model()
+    user = user_model.from_db('default', _field_names(user_model, exclude=SECRET_USER_FIELDS), user_values)
+    if profile_values is not None:
+        user.profile = Profile.from_db('default', _field_names(Profile), profile_values)
+    else:
+        user_model.profile.related.set_cached_value(user, None)
+    return user
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+
+        key = auth_user_key(user_id)
+        values = cache.get(key)
+        if values is None:
+            values = load_user(user_id)
+            if values is None:
+                raise AuthenticationFailed(_('User not found'), code='user_not_found')
+            cache.set(key, values, AUTH_USER_CACHE_TIMEOUT)
+        user = build_user(*values)
+
+        if not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+
+        return user
@@ -0,0 +1,96 @@
+"""
+Email address validation without blocking the request on DNS.
+
+Requests only check the syntax of an address, plus the cached MX verdict
+of its domain when one is known. The MX lookup itself runs in the
+check_email_deliverability task, which marks the user undeliverable when
+the domain does not accept mail. Verdicts are cached per domain, the
+negative ones for a shorter time.
+
+The resolver is a callable taking a domain and returning whether it has
+MX records, raising TemporaryResolutionError when that can not be told
+right now. It is picked by the EMAIL_MX_RESOLVER setting, so tests can
+point it at a local stub.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.utils.module_loading import import_string
+
+MX_CACHE_TIMEOUT = getattr(settings, 'EMAIL_MX_CACHE_TIMEOUT', 60 * 60 * 24)
+MX_NEGATIVE_CACHE_TIMEOUT = getattr(settings, 'EMAIL_MX_NEGATIVE_CACHE_TIMEOUT', 60 * 60)
+DNS_LIFETIME = 5
+
+
+class TemporaryResolutionError(Exception):
+    pass
+
+
+def dns_resolver(domain):
+    """
+        Looks the MX records of `domain` up with dnspython
+    """
+
+    import dns.exception
+    import dns.resolver
+
+    try:
+        return bool(dns.resolver.query(domain, 'MX', lifetime=DNS_LIFETIME))
+    except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer):
+        return False
+    except (dns.resolver.NoNameservers, dns.exception.Timeout) as error:
+        raise TemporaryResolutionError(str(error))
+
+
+def get_resolver():
+    resolver = getattr(settings, 'EMAIL_MX_RESOLVER', None)
+    if resolver is None:
+        return dns_resolver
+    return import_string(resolver) if isinstance(resolver, str) else resolver
+
+
+def email_domain(email):
+    return email.rpartition('@')[2].lower()
+
+
+def mx_key(domain):
+    return 'email:mx:{}'.format(domain)
+
+
+def cached_domain_accepts_mail(domain):
+    """
+        The cached MX verdict of `domain`, None when it is not known
+    """
+
+    return cache.get(mx_key(domain))
+
+
+def domain_accepts_mail(domain, resolver=None):
+    """
+        Whether `domain` has MX records, resolved at most once per cache
+        timeout
+    """
+
+    accepts_mail = cached_domain_accepts_mail(domain)
+    if accepts_mail is None:
+        accepts_mail = (resolver or get_resolver())(domain)
+        cache.set(mx_key(domain), accepts_mail, MX_CACHE_TIMEOUT if accepts_mail else MX_NEGATIVE_CACHE_TIMEOUT)
+    return accepts_mail
+
+
+def is_valid_syntax(email):
+    try:
+        validate_email(email)
+    except ValidationError:
+        return False
+    return True
+
+
+def is_acceptable_email(email):
+    """
+        The inline check: valid syntax and no known missing MX records
+    """
+
+    return is_valid_syntax(email) and cached_domain_accepts_mail(email_domain(email)) is not False
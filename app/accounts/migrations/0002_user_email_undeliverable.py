@@ -0,0 +1,18 @@
+# Generated by Django 3.0.8 on 2026-10-18 18:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='email_undeliverable',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,140 @@
+"""
+Outbox for the emails sent by the site.
+
+Views queue an OutboundEmail row in their transaction instead of talking
+to the SMTP server, and the send_outbound_emails task delivers the queue
+once it commits, plus every minute to pick up the retries. The task
+claims due emails in batches, with SKIP LOCKED where the database
+supports it so concurrent workers take disjoint batches, and sends every
+batch over one SMTP connection.
+
+A claim pushes next_attempt_at forward by CLAIM_TIMEOUT, so the emails of
+a worker that died are claimed again once it runs out. Failed deliveries
+are retried with exponential backoff until MAX_ATTEMPTS; recipients the
+server refuses are not retried. When the server can not be reached at
+all, every email of the batch counts a failed attempt. Delivery is at
+least once: a worker dying between sending and recording a batch sends
+it again.
+"""
+
+import smtplib
+from collections import Counter
+from datetime import timedelta
+
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import OutboundEmail
+
+CLAIM_TIMEOUT = timedelta(minutes=10)
+RETRY_DELAY = timedelta(minutes=1)
+MAX_ATTEMPTS = 6
+
+
+def queue_email(subject, body, to):
+    """
+        Adds an email to the outbox, sent once the current transaction
+        commits
+    """
+
+    from .tasks import send_outbound_emails
+
+    email = OutboundEmail.objects.create(subject=subject, body=body, to=to)
+    transaction.on_commit(lambda: send_outbound_emails.delay())
+    return email
+
+
+def claim_batch(batch_size, now=None):
+    now = now or timezone.now()
+    with transaction.atomic():
+        ids = list(OutboundEmail.objects.select_for_update(skip_locked=True)
+                   .filter(status=OutboundEmail.PENDING, next_attempt_at__lte=now)
+                   .order_by('next_attempt_at').values_list('id', flat=True)[:batch_size])
+        OutboundEmail.objects.filter(pk__in=ids).update(next_attempt_at=now + CLAIM_TIMEOUT)
+    return list(OutboundEmail.objects.filter(pk__in=ids).order_by('id'))
+
+
+def _record_failure(email, error, now):
+    email.attempts += 1
+    email.last_error = '{}: {}'.format(type(error).__name__, error)
+    if email.attempts >= MAX_ATTEMPTS or isinstance(error, smtplib.SMTPRecipientsRefused):
+        email.status = OutboundEmail.FAILED
+    else:
+        email.next_attempt_at = now + RETRY_DELAY * 2 ** (email.attempts - 1)
+    email.save(update_fields=['attempts', 'last_error', 'status', 'next_attempt_at'])
+    return email.status
+
+
+def record_failures(emails, error, now=None):
+    """
+        Records a failed delivery of every email in `emails`, returns a
+        Counter of the resulting statuses
+    """
+
+    now = now or timezone.now()
+    statuses = Counter()
+    for email in emails:
+        status = _record_failure(email, error, now)
+        statuses[status if status == OutboundEmail.FAILED else 'retried'] += 1
+    return statuses
+
+
+def send_batch(emails, connection):
+    """
+        Sends `emails` over the open `connection` and records the outcome
+        of every one, returns a Counter of the resulting statuses
+    """
+
+    statuses = Counter()
+    sent_ids = []
+    try:
+        for position, email in enumerate(emails):
+            message = EmailMessage(email.subject, email.body, to=[email.to], connection=connection)
+            try:
+                message.send()
+            except Exception as error:
+                statuses.update(record_failures([email], error))
+                if isinstance(error, smtplib.SMTPServerDisconnected):
+                    connection.close()
+                    try:
+                        connection.open()
+                    except Exception as reconnect_error:
+                        statuses.update(record_failures(emails[position + 1:], reconnect_error))
+                        break
+            else:
+                sent_ids.append(email.pk)
+    finally:
+        OutboundEmail.objects.filter(pk__in=sent_ids) \
+            .update(status=OutboundEmail.SENT, sent_at=timezone.now(), attempts=F('attempts') + 1)
+    statuses[OutboundEmail.SENT] += len(sent_ids)
+    return statuses
+
+
+def send_pending(batch_size=100, max_batches=10, connection=None):
+    """
+        Delivers up to `max_batches` batches of due emails, one connection
+        per batch, returns a Counter of the resulting statuses
+    """
+
+    connection = connection or get_connection()
+    statuses = Counter()
+    for _ in range(max_batches):
+        emails = claim_batch(batch_size)
+        if not emails:
+            break
+        try:
+            connection.open()
+        except Exception as error:
+            # the server can not be reached, the next batches would not fare
+            # better
+            statuses.update(record_failures(emails, error))
+            break
+        try:
+            statuses.update(send_batch(emails, connection))
+        finally:
+            connection.close()
+        if len(emails) < batch_size:
+            break
+    return statuses
@@ -1,7 +1,8 @@
 from django.contrib.auth import get_user_model, authenticate, password_validation
 from django.utils.translation import gettext_lazy as _
 from rest_framework import serializers
-from validate_email import validate_email
+
+from .email_validation import is_acceptable_email
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -27,7 +28,7 @@ class CreateUserSerializer(UserSerializer):
         confirm_password = attrs.get('confirm_password')
         email = attrs.get('email')
 
-        email_is_valid = validate_email(email, check_mx=True)
+        email_is_valid = is_acceptable_email(email)
 
         if not email_is_valid:
             raise serializers.ValidationError(_('No MX record for domain found. (The email doesnt exist)'))
@@ -51,7 +52,7 @@ class UpdateUserSerializer(serializers.ModelSerializer):
         """
 
         email = attrs.get('email')
-        email_is_valid = validate_email(email, check_mx=True)
+        email_is_valid = is_acceptable_email(email)
         if not email_is_valid:
             raise serializers.ValidationError(_('No MX record for domain found. (The email doesnt exist)'))
         return attrs
@@ -0,0 +1,18 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from profiles.models import Profile
+from .authentication import invalidate_cached_user
+from .models import User
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def invalidate_authenticated_user(sender, instance, **kwargs):
+    user_id = instance.pk if sender is User else instance.user_id
+    invalidate_cached_user(user_id)
+    # a request may cache the pre-commit state between now and the commit
+    transaction.on_commit(lambda: invalidate_cached_user(user_id))
@@ -0,0 +1,44 @@
+from celery import shared_task
+from celery.schedules import crontab
+from celery.task import periodic_task
+from celery.utils.log import get_task_logger
+
+from accounts.email_validation import TemporaryResolutionError, domain_accepts_mail, email_domain
+from accounts.models import User
+from accounts.outbox import send_pending
+
+logger = get_task_logger(__name__)
+
+RETRY_DELAY = 60
+
+
+@shared_task(bind=True, name="check_email_deliverability", ignore_result=True, max_retries=5)
+def check_email_deliverability(self, user_id, email):
+    """
+        Looks up the MX records of the user's email domain and records
+        whether mail can be delivered there, unless the email changed
+        in the meantime
+    """
+
+    try:
+        accepts_mail = domain_accepts_mail(email_domain(email))
+    except TemporaryResolutionError as error:
+        raise self.retry(exc=error, countdown=RETRY_DELAY * 2 ** self.request.retries)
+
+    User.objects.filter(pk=user_id, email=email).update(email_undeliverable=not accepts_mail)
+    if not accepts_mail:
+        logger.info("marked the email of user %s undeliverable", user_id)
+
+
+@periodic_task(run_every=(crontab(minute='*')), name="send_outbound_emails", ignore_result=True)
+def send_outbound_emails(batch_size=100):
+    """
+        Delivers the due emails of the outbox, also queued whenever an
+        email is added to it
+    """
+
+    statuses = send_pending(batch_size=batch_size)
+    if statuses:
+        logger.info("outbox: %s sent, %s to retry, %s failed",
+                    statuses['sent'], statuses['retried'], statuses['failed'])
+    return dict(statuses)
@@ -1,3 +1,274 @@
-from django.test import TestCase
+import smtplib
+from datetime import datetime, timedelta
+from unittest import mock
 
-# Create your tests here.
+from celery.exceptions import Retry
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail.backends import locmem
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.tokens import AccessToken
+
+from profiles.models import Profile
+from . import outbox
+from .authentication import CachedJWTAuthentication, auth_user_key
+from .email_validation import MX_CACHE_TIMEOUT, MX_NEGATIVE_CACHE_TIMEOUT, TemporaryResolutionError, \
+    domain_accepts_mail, is_acceptable_email
+from .models import OutboundEmail, User
+from .tasks import RETRY_DELAY, check_email_deliverability
+
+# domain -> MX verdict of the stub resolver, or the exception it raises
+STUB_DOMAINS = {
+    'example.com': True,
+    'nomail.example': False,
+    'flaky.example': TemporaryResolutionError('timed out'),
+}
+stub_lookups = []
+
+
+def stub_resolver(domain):
+    stub_lookups.append(domain)
+    verdict = STUB_DOMAINS[domain]
+    if isinstance(verdict, Exception):
+        raise verdict
+    return verdict
+
+
+@override_settings(EMAIL_MX_RESOLVER='accounts.tests.stub_resolver')
+class EmailValidationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        stub_lookups.clear()
+
+    def test_domain_with_mx_records(self):
+        self.assertTrue(domain_accepts_mail('example.com'))
+        self.assertTrue(is_acceptable_email('someone@example.com'))
+
+    def test_domain_without_mx_records(self):
+        self.assertTrue(is_acceptable_email('someone@nomail.example'))
+        self.assertFalse(domain_accepts_mail('nomail.example'))
+        self.assertFalse(is_acceptable_email('someone@nomail.example'))
+
+    def test_invalid_syntax(self):
+        self.assertFalse(is_acceptable_email('someone@'))
+
+    def test_verdicts_are_cached_for_their_timeout(self):
+        with mock.patch('time.time', return_value=1000):
+            domain_accepts_mail('example.com')
+            domain_accepts_mail('nomail.example')
+            domain_accepts_mail('example.com')
+            domain_accepts_mail('nomail.example')
+        self.assertEqual(stub_lookups, ['example.com', 'nomail.example'])
+
+        # the negative verdict expires first
+        with mock.patch('time.time', return_value=1000 + MX_NEGATIVE_CACHE_TIMEOUT + 1):
+            domain_accepts_mail('example.com')
+            domain_accepts_mail('nomail.example')
+        self.assertEqual(stub_lookups, ['example.com', 'nomail.example', 'nomail.example'])
+
+        with mock.patch('time.time', return_value=1000 + MX_CACHE_TIMEOUT + 1):
+            domain_accepts_mail('example.com')
+        self.assertEqual(stub_lookups[-1], 'example.com')
+
+    def test_temporary_errors_are_not_cached(self):
+        for _ in range(2):
+            with self.assertRaises(TemporaryResolutionError):
+                domain_accepts_mail('flaky.example')
+        self.assertEqual(stub_lookups, ['flaky.example', 'flaky.example'])
+
+
+@override_settings(EMAIL_MX_RESOLVER='accounts.tests.stub_resolver')
+class CheckEmailDeliverabilityTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def create_user(self, email):
+        return User.objects.create_user(email=email, password='password')
+
+    def test_marks_undeliverable_email(self):
+        user = self.create_user('someone@nomail.example')
+        check_email_deliverability.apply(args=(user.pk, user.email))
+        user.refresh_from_db()
+        self.assertTrue(user.email_undeliverable)
+
+    def test_clears_the_mark_of_a_deliverable_email(self):
+        user = self.create_user('someone@example.com')
+        User.objects.filter(pk=user.pk).update(email_undeliverable=True)
+        check_email_deliverability.apply(args=(user.pk, user.email))
+        user.refresh_from_db()
+        self.assertFalse(user.email_undeliverable)
+
+    def test_ignores_a_changed_email(self):
+        user = self.create_user('someone@example.com')
+        check_email_deliverability.apply(args=(user.pk, 'someone@nomail.example'))
+        user.refresh_from_db()
+        self.assertFalse(user.email_undeliverable)
+
+    def test_retries_temporary_errors(self):
+        user = self.create_user('someone@flaky.example')
+        with mock.patch.object(check_email_deliverability, 'retry', side_effect=Retry()) as retry:
+            check_email_deliverability.apply(args=(user.pk, user.email))
+        self.assertEqual(retry.call_args[1]['countdown'], RETRY_DELAY)
+        user.refresh_from_db()
+        self.assertFalse(user.email_undeliverable)
+
+
+class FlakyEmailBackend(locmem.EmailBackend):
+    """
+        Local SMTP stand-in failing the recipients of `errors`, and every
+        connection while `open_error` is set
+    """
+
+    def __init__(self, errors=None, open_error=None, **kwargs):
+        super().__init__(**kwargs)
+        self.errors = errors or {}
+        self.open_error = open_error
+
+    def open(self):
+        if self.open_error is not None:
+            raise self.open_error
+
+    def send_messages(self, messages):
+        for message in messages:
+            if message.to[0] in self.errors:
+                raise self.errors[message.to[0]]
+        return super().send_messages(messages)
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class OutboxTests(TestCase):
+
+    def queue(self, to, **fields):
+        email = outbox.queue_email('Subject', 'Body', to)
+        if fields:
+            OutboundEmail.objects.filter(pk=email.pk).update(**fields)
+        return email
+
+    def test_claim_batch(self):
+        due = [self.queue('due{}@example.com'.format(index)) for index in range(3)]
+        now = timezone.now()
+        self.queue('later@example.com', next_attempt_at=now + timedelta(minutes=5))
+        self.queue('sent@example.com', status=OutboundEmail.SENT)
+
+        claimed = outbox.claim_batch(2, now=now)
+        self.assertEqual([email.pk for email in claimed], [email.pk for email in due[:2]])
+        self.assertTrue(all(email.next_attempt_at == now + outbox.CLAIM_TIMEOUT for email in claimed))
+        self.assertEqual([email.pk for email in outbox.claim_batch(10, now=now)], [due[2].pk])
+        self.assertEqual(outbox.claim_batch(10, now=now), [])
+
+    def test_send_pending(self):
+        for index in range(3):
+            self.queue('someone{}@example.com'.format(index))
+
+        statuses = outbox.send_pending(batch_size=2)
+        self.assertEqual(statuses[OutboundEmail.SENT], 3)
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox),
+                         ['someone0@example.com', 'someone1@example.com', 'someone2@example.com'])
+        self.assertFalse(OutboundEmail.objects.exclude(status=OutboundEmail.SENT, attempts=1).exists())
+        self.assertEqual(outbox.send_pending(), {})
+
+    def test_retry_with_backoff(self):
+        email = self.queue('someone@example.com')
+        connection = FlakyEmailBackend(errors={'someone@example.com': smtplib.SMTPDataError(451, 'try later')})
+
+        self.assertEqual(outbox.send_pending(connection=connection)['retried'], 1)
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), (OutboundEmail.PENDING, 1))
+        self.assertIn('SMTPDataError', email.last_error)
+        self.assertGreater(email.next_attempt_at, timezone.now() + outbox.RETRY_DELAY / 2)
+
+        OutboundEmail.objects.filter(pk=email.pk).update(next_attempt_at=timezone.now())
+        self.assertEqual(outbox.send_pending()[OutboundEmail.SENT], 1)
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), (OutboundEmail.SENT, 2))
+
+    def test_give_up_after_max_attempts(self):
+        email = self.queue('someone@example.com', attempts=outbox.MAX_ATTEMPTS - 1)
+        connection = FlakyEmailBackend(errors={'someone@example.com': smtplib.SMTPDataError(451, 'try later')})
+
+        self.assertEqual(outbox.send_pending(connection=connection)[OutboundEmail.FAILED], 1)
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), (OutboundEmail.FAILED, outbox.MAX_ATTEMPTS))
+
+    def test_refused_recipient_is_not_retried(self):
+        email = self.queue('someone@example.com')
+        refused = smtplib.SMTPRecipientsRefused({'someone@example.com': (550, b'no such user')})
+
+        outbox.send_pending(connection=FlakyEmailBackend(errors={'someone@example.com': refused}))
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), (OutboundEmail.FAILED, 1))
+
+    def test_unreachable_server(self):
+        emails = [self.queue('someone{}@example.com'.format(index)) for index in range(3)]
+        connection = FlakyEmailBackend(open_error=ConnectionRefusedError('connection refused'))
+
+        statuses = outbox.send_pending(batch_size=2, connection=connection)
+        self.assertEqual(statuses, {'retried': 2})
+        for email in emails[:2]:
+            email.refresh_from_db()
+            self.assertEqual((email.status, email.attempts), (OutboundEmail.PENDING, 1))
+            self.assertIn('ConnectionRefusedError', email.last_error)
+        emails[2].refresh_from_db()
+        self.assertEqual(emails[2].attempts, 0)
+
+
+class CachedJWTAuthenticationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='someone@example.com', password='password', is_active=True)
+        self.profile = Profile.objects.create(user=self.user, first_name='John', last_name='Doe',
+                                              birthday=datetime(1990, 1, 1).date(), gender='M')
+        self.token = AccessToken.for_user(self.user)
+
+    def authenticate(self):
+        return CachedJWTAuthentication().get_user(self.token)
+
+    def test_user_and_profile_are_read_together_then_cached(self):
+        with self.assertNumQueries(1):
+            user = self.authenticate()
+        with self.assertNumQueries(0):
+            user = self.authenticate()
+            self.assertEqual((user.pk, user.email), (self.user.pk, 'someone@example.com'))
+            self.assertEqual(user.profile.pk, self.profile.pk)
+            self.assertEqual(user.profile.full_name, 'John Doe')
+
+        self.assertNotIn('password', str(cache.get(auth_user_key(self.user.pk))))
+        # deferred, loaded on demand
+        self.assertTrue(user.check_password('password'))
+
+    def test_user_without_profile(self):
+        self.profile.delete()
+        user = self.authenticate()
+        with self.assertNumQueries(0):
+            self.assertFalse(hasattr(user, 'profile'))
+
+    def test_saves_drop_the_cached_user(self):
+        self.authenticate()
+        self.profile.first_name = 'Jim'
+        self.profile.save()
+        self.assertEqual(self.authenticate().profile.first_name, 'Jim')
+
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    def test_deleted_user(self):
+        self.authenticate()
+        self.user.delete()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    def test_bearer_token(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Bearer {}'.format(self.token))
+        self.assertEqual(client.get('/stories/tray/').status_code, 200)
+        self.assertIsNotNone(cache.get(auth_user_key(self.user.pk)))
+        client.credentials(HTTP_AUTHORIZATION='Bearer invalid')
+        self.assertEqual(client.get('/stories/tray/').status_code, 401)
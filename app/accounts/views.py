@@ -1,6 +1,6 @@
 from django.contrib.auth import get_user_model
 from django.contrib.auth.tokens import default_token_generator
-from django.core.mail import EmailMessage
+from django.db import transaction
 from django.shortcuts import get_object_or_404
 from rest_framework import permissions, mixins
 from rest_framework import status
@@ -9,12 +9,14 @@ from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.viewsets import GenericViewSet
-from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework_simplejwt.tokens import RefreshToken
 
+from .authentication import CachedJWTAuthentication
 from .models import User
+from .outbox import queue_email
 from .serializers import UserSerializer, AuthTokenSerializer, PasswordChangeSerializer, CreateUserSerializer, \
     UpdateUserSerializer
+from .tasks import check_email_deliverability
 
 
 def get_tokens_for_user(user):
@@ -30,6 +32,16 @@ def get_tokens_for_user(user):
     }
 
 
+def queue_deliverability_check(user):
+    """
+        Checks the MX records of the user's email domain once the
+        transaction commits, outside of the request
+    """
+
+    user_id, email = user.pk, user.email
+    transaction.on_commit(lambda: check_email_deliverability.delay(user_id, email))
+
+
 class UserRelatedView(mixins.RetrieveModelMixin,
                       mixins.UpdateModelMixin,
                       mixins.DestroyModelMixin,
@@ -40,7 +52,7 @@ class UserRelatedView(mixins.RetrieveModelMixin,
     'DELETE') the users data through the users/ url for superusers, and 'users/me/' url for the authenticated users
     """
 
-    authentication_classes = (JWTAuthentication,)
+    authentication_classes = (CachedJWTAuthentication,)
     permission_classes = (IsAdminUser,)
     queryset = get_user_model().objects.all()
     serializer_class = UserSerializer
@@ -51,16 +63,16 @@ class UserRelatedView(mixins.RetrieveModelMixin,
     def create_user(self, request):
         serializer = CreateUserSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        user = serializer.create(validated_data=serializer.validated_data)
-        token = default_token_generator.make_token(user)
-        mail_subject = 'Activate your account.'
-
-        message = 'link: ' + f"http://127.0.0.1:8000/activate/{user.id}/{token}"
-        to_email = serializer.data['email']
-        email = EmailMessage(
-            mail_subject, message, to=[to_email]
-        )
-        email.send()
+        with transaction.atomic():
+            user = serializer.create(validated_data=serializer.validated_data)
+            queue_deliverability_check(user)
+            token = default_token_generator.make_token(user)
+            mail_subject = 'Activate your account.'
+
+            message = 'link: ' + f"http://127.0.0.1:8000/activate/{user.id}/{token}"
+            to_email = serializer.data['email']
+            # sent by the send_outbound_emails task once the user is committed
+            queue_email(mail_subject, message, to_email)
         serializer.data['detail'] = "Please check your email address to complete the registration"
         return Response("Please check your email address to complete the registration", status=status.HTTP_201_CREATED)
 
@@ -76,7 +88,8 @@ class UserRelatedView(mixins.RetrieveModelMixin,
     def change_password(self, request):
         serializer = PasswordChangeSerializer(data=request.data, context={'request': request})
         serializer.is_valid(raise_exception=True)
-        instance = serializer.validated_data['user']
+        # re-read, the authenticated user may come from the cache
+        instance = User.objects.get(pk=serializer.validated_data['user'].pk)
         instance.set_password(serializer.data.get('new_password'))
         instance.save()
 
@@ -92,16 +105,22 @@ class UserRelatedView(mixins.RetrieveModelMixin,
             serializer = UserSerializer(user)
             return Response(serializer.data, status=status.HTTP_200_OK)
 
+        # the authenticated user may come from the cache, saving it would
+        # write back stale columns
+        user = User.objects.get(pk=user.pk)
+
         if request.method == 'PUT':
             serializer = UpdateUserSerializer(data=request.data)
             serializer.is_valid(raise_exception=True)
             serializer.update(instance=user, validated_data=serializer.validated_data)
+            queue_deliverability_check(user)
             return Response(serializer.validated_data, status=status.HTTP_200_OK)
 
         if request.method == 'PATCH':
             serializer = UpdateUserSerializer(data=request.data, partial=True)
             serializer.is_valid(raise_exception=True)
             serializer.update(instance=user, validated_data=serializer.validated_data)
+            queue_deliverability_check(user)
             return Response(serializer.validated_data, status=status.HTTP_200_OK)
 
         if request.method == 'DELETE':
@@ -0,0 +1,82 @@
+"""
+Conditional GET for DRF viewsets.
+
+A viewset action opts in by defining get_<action>_marker(request, ...),
+returning a cheap value that changes whenever the response would: the
+ids, counters and timestamps of the rows on the requested page, read
+with values_list instead of loading and serializing the models. The
+marker is hashed with the absolute url, the user and the renderer into
+a strong ETag. When it matches If-None-Match the action does not run
+and the response is an empty 304.
+
+There is no Last-Modified: the newest created_at of a page does not move
+when a row is edited, deleted or has its counters changed, so it can not
+tell whether a page is still current.
+"""
+
+import hashlib
+
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.response import Response
+
+
+class NotModified(APIException):
+    status_code = status.HTTP_304_NOT_MODIFIED
+    default_detail = 'Not modified.'
+    default_code = 'not_modified'
+
+
+def compute_etag(request, marker):
+    digest = hashlib.sha1(repr((
+        request.build_absolute_uri(), request.user.pk, request.accepted_renderer.format, marker,
+    )).encode()).hexdigest()
+    return quote_etag(digest)
+
+
+def etag_matches(etag, if_none_match):
+    # If-None-Match uses the weak comparison
+    return any(candidate in ('*', etag, 'W/' + etag) for candidate in parse_etags(if_none_match))
+
+
+class ConditionalGetMixin:
+    """
+        Answers the GET requests of the actions that have a marker with an
+        ETag, and with 304 Not Modified before the action runs when the
+        client already has the current response
+    """
+
+    etag = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.etag = None
+        get_marker = getattr(self, 'get_{}_marker'.format(self.action), None)
+        if request.method not in ('GET', 'HEAD') or get_marker is None:
+            return
+
+        self.etag = compute_etag(request, get_marker(request, *args, **kwargs))
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match and etag_matches(self.etag, if_none_match):
+            raise NotModified()
+
+    def handle_exception(self, exc):
+        if isinstance(exc, NotModified):
+            return Response(status=exc.status_code)
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if self.etag is not None and response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+            response['ETag'] = self.etag
+        return response
+
+    def page_marker(self, queryset, *fields):
+        """
+            The `fields` of the rows on the requested page of `queryset`
+        """
+
+        rows = queryset.values_list(*fields)
+        page = self.paginate_queryset(rows)
+        return list(page if page is not None else rows)
@@ -66,7 +66,7 @@ ROOT_URLCONF = 'app.urls'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'accounts.authentication.CachedJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
 
@@ -144,6 +144,11 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = '/vol/web/media'
 STATIC_ROOT = '/vol/web/static'
 
+DEFAULT_FILE_STORAGE = 'app.storage.ContentAddressedStorage'
+
+# served by Django itself, see app.views.serve_media
+MEDIA_SENDFILE_HEADER = None
+
 AUTH_USER_MODEL = 'accounts.User'
 
 EMAIL_USE_TLS = True
@@ -179,3 +184,31 @@ SIMPLE_JWT = {
     'SLIDING_TOKEN_LIFETIME': timedelta(minutes=5),
     'SLIDING_TOKEN_REFRESH_LIFETIME': timedelta(days=1),
 }
+
+# The shared store holds the home timelines and the buffered likes and
+# story views, which the Celery worker reads and writes (fan_out_post,
+# flush_likes, flush_story_views). LocMemStore lives in the memory of each
+# process, so the worker's writes never reach the web process: point
+# SHARED_STORE_LOCATION at a Redis server when running a worker and beat.
+# Without one the tasks run eagerly in the web process instead. The
+# periodic ones do not run at all then, so the like, unlike and story view
+# endpoints flush what they buffered themselves.
+if os.environ.get('SHARED_STORE_LOCATION'):
+    SHARED_STORE = {
+        'BACKEND': 'app.stores.RedisStore',
+        'LOCATION': os.environ['SHARED_STORE_LOCATION'],
+    }
+else:
+    SHARED_STORE = {
+        'BACKEND': 'app.stores.LocMemStore',
+    }
+    CELERY_TASK_ALWAYS_EAGER = True
+
+TIMELINE_MAX_LENGTH = 800
+
+NAME_INDEX_PATH = os.path.join(BASE_DIR, 'name_index.npz')
+
+FRIEND_GRAPH_SNAPSHOT_PATH = os.path.join(BASE_DIR, 'friend_graph.bin')
+
+# files written by the export_profile_history task
+EXPORT_ROOT = os.path.join(BASE_DIR, 'exports')
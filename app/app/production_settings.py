@@ -38,6 +38,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     # 3rd party
 
@@ -67,7 +68,7 @@ ROOT_URLCONF = 'app.urls'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'accounts.authentication.CachedJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
 
@@ -171,6 +172,13 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = '/vol/web/media'
 STATIC_ROOT = '/vol/web/static'
 
+DEFAULT_FILE_STORAGE = 'app.storage.ContentAddressedStorage'
+
+# nginx serves MEDIA_ROOT from an internal location, see app.views.serve_media:
+#     location /protected-media/ { internal; alias /vol/web/media/; }
+MEDIA_SENDFILE_HEADER = 'X-Accel-Redirect'
+MEDIA_ACCEL_REDIRECT_PREFIX = '/protected-media/'
+
 AUTH_USER_MODEL = 'accounts.User'
 
 EMAIL_USE_TLS = True
@@ -212,3 +220,27 @@ CELERY_RESULT_BACKEND = 'redis://localhost:6379'
 CELERY_ACCEPT_CONTENT = ['application/json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': 'redis://localhost:6379/2',
+        'OPTIONS': {
+            'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+        },
+    }
+}
+
+SHARED_STORE = {
+    'BACKEND': 'app.stores.RedisStore',
+    'LOCATION': 'redis://localhost:6379/1',
+}
+
+TIMELINE_MAX_LENGTH = 800
+
+NAME_INDEX_PATH = '/vol/web/indexes/name_index.npz'
+
+FRIEND_GRAPH_SNAPSHOT_PATH = '/vol/web/graph/friend_graph.bin'
+
+# files written by the export_profile_history task
+EXPORT_ROOT = '/vol/web/exports'
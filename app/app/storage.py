@@ -0,0 +1,86 @@
+"""
+Content addressed file storage.
+
+Files are named by the sha256 of their content, sharded in two levels of
+directories by the first hex digits of the hash:
+
+    3f/a9/3fa96c...e1.jpg
+
+Identical uploads are stored once, and a stored file never changes, which
+is what lets the media view mark responses as immutable. As one file may
+back several records, delete() leaves files in place; the prune_media
+command removes the files no record refers to anymore.
+"""
+
+import hashlib
+import os
+import re
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+HASH_NAME = re.compile(r'^[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(\.[0-9a-z]+)?$')
+
+
+class _AlreadyStored(Exception):
+    pass
+
+
+def content_hash(content):
+    digest = hashlib.sha256()
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    for chunk in content.chunks():
+        digest.update(chunk)
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    return digest.hexdigest()
+
+
+def is_content_addressed(name):
+    return HASH_NAME.match(name) is not None
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    def hashed_name(self, name, content):
+        extension = os.path.splitext(name)[1].lower()
+        digest = content_hash(content)
+        return '{}/{}/{}{}'.format(digest[:2], digest[2:4], digest, extension)
+
+    def get_available_name(self, name, max_length=None):
+        # FileSystemStorage._save asks for another name when a concurrent
+        # upload of the same content created the file first
+        if is_content_addressed(name) and self.exists(name):
+            raise _AlreadyStored()
+        # other names are replaced by the content hash in _save
+        return name
+
+    def _save(self, name, content):
+        name = self.hashed_name(name, content)
+        if self.exists(name):
+            return name
+        try:
+            return super()._save(name, content)
+        except _AlreadyStored:
+            return name
+
+    def delete(self, name):
+        pass
+
+    def prune(self, referenced, older_than):
+        """
+            Deletes the content addressed files missing from `referenced`
+            and last modified before the `older_than` timestamp. Returns the
+            deleted names.
+        """
+
+        deleted = []
+        for root, _, files in os.walk(self.location):
+            for file_name in files:
+                path = os.path.join(root, file_name)
+                name = os.path.relpath(path, self.location).replace(os.sep, '/')
+                if is_content_addressed(name) and name not in referenced and os.path.getmtime(path) < older_than:
+                    os.remove(path)
+                    deleted.append(name)
+        return deleted
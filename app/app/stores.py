@@ -0,0 +1,512 @@
+"""
+Shared key/value stores for data structures the Django cache cannot hold
+(sorted sets, ...).
+
+The backend is picked by the SHARED_STORE setting:
+
+    SHARED_STORE = {
+        'BACKEND': 'app.stores.RedisStore',
+        'LOCATION': 'redis://127.0.0.1:6379/1',
+    }
+
+When the setting is missing an in-process LocMemStore is used, which is
+what the development settings and the tests run on.
+"""
+
+import bisect
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+DEFAULT_BACKEND = 'app.stores.LocMemStore'
+
+# KEYS[1]: list, ARGV[1]: count, ARGV[2]: expected first value
+LTRIM_IF_SCRIPT = """
+if redis.call('lindex', KEYS[1], 0) == ARGV[2] then
+    redis.call('ltrim', KEYS[1], ARGV[1], -1)
+    return 1
+end
+return 0
+"""
+
+# KEYS[1]: hash, ARGV: field, value, whether the field is expected, expected
+# value, then increments as field, amount pairs
+HSETIF_SCRIPT = """
+local current = redis.call('hget', KEYS[1], ARGV[1])
+if ARGV[3] == '1' then
+    if current ~= ARGV[4] then
+        return 0
+    end
+elseif current then
+    return 0
+end
+redis.call('hset', KEYS[1], ARGV[1], ARGV[2])
+for i = 5, #ARGV, 2 do
+    redis.call('hincrby', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+return 1
+"""
+
+# KEYS[1]: hash, ARGV: number of expected fields, expected fields as field,
+# value pairs, then increments as field, amount pairs
+HDELIF_SCRIPT = """
+local expected = tonumber(ARGV[1])
+local deleted = 0
+for i = 2, expected * 2, 2 do
+    if redis.call('hget', KEYS[1], ARGV[i]) == ARGV[i + 1] then
+        deleted = deleted + redis.call('hdel', KEYS[1], ARGV[i])
+    end
+end
+for i = expected * 2 + 2, #ARGV, 2 do
+    if redis.call('hincrby', KEYS[1], ARGV[i], ARGV[i + 1]) == 0 then
+        redis.call('hdel', KEYS[1], ARGV[i])
+    end
+end
+local left = redis.call('hlen', KEYS[1])
+for i = expected * 2 + 2, #ARGV, 2 do
+    left = left - redis.call('hexists', KEYS[1], ARGV[i])
+end
+if left == 0 then
+    redis.call('del', KEYS[1])
+end
+return deleted
+"""
+
+# KEYS[1]: source set, KEYS[2]: destination set, ARGV[1]: count. SPOP is
+# random, so before Redis 5 the script has to replicate its effects.
+SMOVE_MANY_SCRIPT = """
+if redis.replicate_commands then
+    redis.replicate_commands()
+end
+local members = redis.call('spop', KEYS[1], ARGV[1])
+if #members > 0 then
+    redis.call('sadd', KEYS[2], unpack(members))
+end
+return members
+"""
+
+
+def _flatten(pairs):
+    return [value for pair in pairs for value in pair]
+
+
+class RedisStore:
+    """
+        Store backed by a redis server
+    """
+
+    def __init__(self, location, **options):
+        import redis
+
+        self.client = redis.Redis.from_url(location, **options)
+        self._ltrim_if = self.client.register_script(LTRIM_IF_SCRIPT)
+        self._hsetif = self.client.register_script(HSETIF_SCRIPT)
+        self._hdelif = self.client.register_script(HDELIF_SCRIPT)
+        self._smove_many = self.client.register_script(SMOVE_MANY_SCRIPT)
+
+    def zadd_many(self, keys, member, score, max_length=None, expire_at=None):
+        """
+            Add `member` with `score` to every sorted set in `keys`, keeping
+            only the `max_length` highest scored members of each set. With
+            `expire_at` (a unix timestamp) the sets expire at that time.
+        """
+
+        with self.client.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.zadd(key, {member: score})
+                if max_length:
+                    pipe.zremrangebyrank(key, 0, -max_length - 1)
+                if expire_at:
+                    pipe.expireat(key, math.ceil(expire_at))
+            pipe.execute()
+
+    def zadd(self, key, scores, max_length=None):
+        """
+            Add the members of `scores`, a {member: score} dict, to a sorted
+            set, keeping only its `max_length` highest scored members
+        """
+
+        with self.client.pipeline(transaction=False) as pipe:
+            pipe.zadd(key, scores)
+            if max_length:
+                pipe.zremrangebyrank(key, 0, -max_length - 1)
+            pipe.execute()
+
+    def zrevrange(self, key, start, stop):
+        """
+            Members of a sorted set from the highest score down, `stop` inclusive
+        """
+
+        return [member.decode() for member in self.client.zrevrange(key, start, stop)]
+
+    def zrem(self, key, *members):
+        """
+            Remove `members` from a sorted set
+        """
+
+        if members:
+            self.client.zrem(key, *members)
+
+    def zrevrangebyscore_many(self, keys, min_score):
+        """
+            Members scored `min_score` or higher of every sorted set in `keys`,
+            as {key: [(member, score), ...]} from the highest score down.
+            Empty sets are left out.
+        """
+
+        keys = list(keys)
+        with self.client.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.zrevrangebyscore(key, '+inf', min_score, withscores=True)
+            results = pipe.execute()
+        return {
+            key: [(member.decode(), score) for member, score in members]
+            for key, members in zip(keys, results) if members
+        }
+
+    def zremrangebyscore(self, key, max_score):
+        """
+            Remove the members scored lower than `max_score`
+        """
+
+        self.client.zremrangebyscore(key, '-inf', '({}'.format(max_score))
+
+    def sadd(self, key, member, expire_at=None):
+        """
+            Add `member` to a set, returns whether it was not there yet
+        """
+
+        with self.client.pipeline(transaction=False) as pipe:
+            pipe.sadd(key, member)
+            if expire_at:
+                pipe.expireat(key, math.ceil(expire_at))
+            added = pipe.execute()[0]
+        return bool(added)
+
+    def scard_many(self, keys):
+        """
+            Sizes of the sets in `keys`, as {key: size}
+        """
+
+        keys = list(keys)
+        with self.client.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.scard(key)
+            return dict(zip(keys, pipe.execute()))
+
+    def rpush(self, key, *values):
+        """
+            Append `values` to a list
+        """
+
+        self.client.rpush(key, *values)
+
+    def lrange(self, key, start, stop):
+        """
+            Values of a list from `start` to `stop` inclusive
+        """
+
+        return [value.decode() for value in self.client.lrange(key, start, stop)]
+
+    def ltrim_if(self, key, count, head):
+        """
+            Remove the first `count` values of a list if its first value is
+            still `head`, returns whether it did. Consumers read the head
+            with lrange and remove it once processed, a consumer that read
+            the same values concurrently does not remove them twice.
+        """
+
+        return bool(self._ltrim_if(keys=[key], args=[count, head]))
+
+    def hget(self, key, field):
+        """
+            Value of `field` in a hash, None when it is not set
+        """
+
+        value = self.client.hget(key, field)
+        return value.decode() if value is not None else None
+
+    def hget_many(self, keys, field):
+        """
+            Value of `field` in every hash of `keys`, as {key: value}.
+            Hashes without the field are left out.
+        """
+
+        keys = list(keys)
+        with self.client.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.hget(key, field)
+            results = pipe.execute()
+        return {key: value.decode() for key, value in zip(keys, results) if value is not None}
+
+    def hgetall_many(self, keys):
+        """
+            Fields of the hashes in `keys`, as {key: {field: value}}.
+            Missing hashes are left out.
+        """
+
+        keys = list(keys)
+        with self.client.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.hgetall(key)
+            results = pipe.execute()
+        return {
+            key: {field.decode(): value.decode() for field, value in fields.items()}
+            for key, fields in zip(keys, results) if fields
+        }
+
+    def hsetif(self, key, field, value, expected=None, increments=None):
+        """
+            Set `field` of a hash to `value` and add `increments` to its
+            integer fields, atomically and only if `field` still holds
+            `expected` (is not set when `expected` is None). Returns whether
+            it did.
+        """
+
+        args = [field, value, '0' if expected is None else '1', '' if expected is None else expected]
+        return bool(self._hsetif(keys=[key], args=args + _flatten((increments or {}).items())))
+
+    def hdelif(self, key, expected, increments=None):
+        """
+            Remove the fields of a hash that still hold their value in
+            `expected`, a {field: value} dict, and add `increments` to its
+            integer fields, atomically. Integer fields brought to 0 are
+            removed, so is a hash left with nothing but those fields.
+            Returns the number of fields removed.
+        """
+
+        args = [len(expected)] + _flatten(expected.items()) + _flatten((increments or {}).items())
+        return self._hdelif(keys=[key], args=args)
+
+    def smove_many(self, source, destination, count):
+        """
+            Move up to `count` members of a set to another one, returns them
+        """
+
+        return [member.decode() for member in self._smove_many(keys=[source, destination], args=[count])]
+
+    def srem(self, key, *members):
+        """
+            Remove `members` from a set
+        """
+
+        if members:
+            self.client.srem(key, *members)
+
+
+class LocMemStore:
+    """
+        In-process store with the same interface as RedisStore
+    """
+
+    def __init__(self, location='', **options):
+        self._sorted_sets = {}
+        self._sets = {}
+        self._lists = {}
+        self._hashes = {}
+        self._expire_at = {}
+        self._lock = threading.Lock()
+
+    def _expire(self, key):
+        # expired keys are dropped lazily, as redis does on access
+        if key in self._expire_at and self._expire_at[key] <= time.time():
+            del self._expire_at[key]
+            for values in (self._sorted_sets, self._sets, self._lists, self._hashes):
+                values.pop(key, None)
+
+    def _sorted_set(self, key):
+        self._expire(key)
+        return self._sorted_sets.get(key, [])
+
+    def zadd_many(self, keys, member, score, max_length=None, expire_at=None):
+        member = str(member)
+        with self._lock:
+            for key in keys:
+                entries = self._sorted_set(key)
+                self._sorted_sets[key] = entries
+                for index, (_, existing) in enumerate(entries):
+                    if existing == member:
+                        del entries[index]
+                        break
+                bisect.insort(entries, (score, member))
+                if max_length:
+                    del entries[:-max_length]
+                if expire_at:
+                    self._expire_at[key] = math.ceil(expire_at)
+
+    def zadd(self, key, scores, max_length=None):
+        scores = {str(member): score for member, score in scores.items()}
+        with self._lock:
+            entries = [entry for entry in self._sorted_set(key) if entry[1] not in scores]
+            entries.extend((score, member) for member, score in scores.items())
+            entries.sort()
+            if max_length:
+                del entries[:-max_length]
+            self._sorted_sets[key] = entries
+
+    def zrevrange(self, key, start, stop):
+        with self._lock:
+            entries = self._sorted_set(key)
+            members = [member for _, member in reversed(entries)]
+        return members[start:stop + 1 if stop != -1 else None]
+
+    def zrem(self, key, *members):
+        members = {str(member) for member in members}
+        with self._lock:
+            entries = self._sorted_set(key)
+            if entries:
+                self._sorted_sets[key] = [entry for entry in entries if entry[1] not in members]
+
+    def zrevrangebyscore_many(self, keys, min_score):
+        result = {}
+        with self._lock:
+            for key in keys:
+                members = [(member, score) for score, member in reversed(self._sorted_set(key))
+                           if score >= min_score]
+                if members:
+                    result[key] = members
+        return result
+
+    def zremrangebyscore(self, key, max_score):
+        with self._lock:
+            entries = self._sorted_set(key)
+            entries[:] = [entry for entry in entries if entry[0] >= max_score]
+
+    def sadd(self, key, member, expire_at=None):
+        member = str(member)
+        with self._lock:
+            self._expire(key)
+            members = self._sets.setdefault(key, set())
+            added = member not in members
+            members.add(member)
+            if expire_at:
+                self._expire_at[key] = math.ceil(expire_at)
+        return added
+
+    def scard_many(self, keys):
+        with self._lock:
+            result = {}
+            for key in keys:
+                self._expire(key)
+                result[key] = len(self._sets.get(key, ()))
+        return result
+
+    def rpush(self, key, *values):
+        with self._lock:
+            self._expire(key)
+            self._lists.setdefault(key, []).extend(str(value) for value in values)
+
+    def lrange(self, key, start, stop):
+        with self._lock:
+            self._expire(key)
+            values = self._lists.get(key, [])
+            return values[start:stop + 1 if stop != -1 else None]
+
+    def ltrim_if(self, key, count, head):
+        with self._lock:
+            self._expire(key)
+            values = self._lists.get(key, [])
+            if not values or values[0] != head:
+                return False
+            del values[:count]
+            return True
+
+    def hget(self, key, field):
+        with self._lock:
+            self._expire(key)
+            return self._hashes.get(key, {}).get(str(field))
+
+    def hget_many(self, keys, field):
+        field = str(field)
+        result = {}
+        with self._lock:
+            for key in keys:
+                self._expire(key)
+                if field in self._hashes.get(key, {}):
+                    result[key] = self._hashes[key][field]
+        return result
+
+    def hgetall_many(self, keys):
+        result = {}
+        with self._lock:
+            for key in keys:
+                self._expire(key)
+                if self._hashes.get(key):
+                    result[key] = dict(self._hashes[key])
+        return result
+
+    def _increment(self, fields, increments):
+        for field, amount in (increments or {}).items():
+            fields[str(field)] = str(int(fields.get(str(field), 0)) + amount)
+
+    def hsetif(self, key, field, value, expected=None, increments=None):
+        with self._lock:
+            self._expire(key)
+            fields = self._hashes.get(key, {})
+            if fields.get(str(field)) != (None if expected is None else str(expected)):
+                return False
+            fields[str(field)] = str(value)
+            self._increment(fields, increments)
+            self._hashes[key] = fields
+            return True
+
+    def hdelif(self, key, expected, increments=None):
+        with self._lock:
+            self._expire(key)
+            fields = self._hashes.get(key, {})
+            deleted = 0
+            for field, value in expected.items():
+                if fields.get(str(field)) == str(value):
+                    del fields[str(field)]
+                    deleted += 1
+            self._increment(fields, increments)
+            for field in increments or {}:
+                if fields.get(str(field)) == '0':
+                    del fields[str(field)]
+            if set(fields) - {str(field) for field in increments or {}}:
+                self._hashes[key] = fields
+            else:
+                self._hashes.pop(key, None)
+            return deleted
+
+    def smove_many(self, source, destination, count):
+        with self._lock:
+            self._expire(source)
+            self._expire(destination)
+            members = self._sets.get(source, set())
+            moved = [members.pop() for _ in range(min(count, len(members)))]
+            if moved:
+                self._sets.setdefault(destination, set()).update(moved)
+            return moved
+
+    def srem(self, key, *members):
+        with self._lock:
+            self._expire(key)
+            self._sets.get(key, set()).difference_update(str(member) for member in members)
+
+    def clear(self):
+        with self._lock:
+            for values in (self._sorted_sets, self._sets, self._lists, self._hashes, self._expire_at):
+                values.clear()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """
+        Returns the process wide store configured by SHARED_STORE
+    """
+
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                config = dict(getattr(settings, 'SHARED_STORE', {}))
+                backend = import_string(config.pop('BACKEND', DEFAULT_BACKEND))
+                _store = backend(config.pop('LOCATION', ''), **config.pop('OPTIONS', {}))
+    return _store
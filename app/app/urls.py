@@ -13,6 +13,7 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.conf.urls import url
 from django.contrib import admin
 from django.urls import path, include
@@ -24,6 +25,7 @@ from rest_framework_simplejwt.views import (
 )
 
 from accounts.views import ActivateUserView
+from .views import serve_media
 
 schema_view = get_schema_view(
     openapi.Info(
@@ -47,6 +49,7 @@ urlpatterns = [
     path('', include('posts.urls')),
     path('stories/', include('stories.urls')),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path(settings.MEDIA_URL.lstrip('/') + '<path:path>', serve_media, name='media'),
 
     url(r'^swagger(?P<format>\.json|\.yaml)$', schema_view.without_ui(cache_timeout=0), name='schema-json'),
     url(r'^swagger/$', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
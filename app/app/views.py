@@ -0,0 +1,51 @@
+import mimetypes
+import os
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified
+from django.views.decorators.http import require_safe
+
+from .storage import is_content_addressed
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+DEFAULT_CACHE_CONTROL = 'public, max-age=3600'
+
+
+@require_safe
+def serve_media(request, path):
+    """
+        Hands media files to the front server with X-Accel-Redirect (nginx)
+        or X-Sendfile (apache, lighttpd) as set by MEDIA_SENDFILE_HEADER, so
+        that the bytes never go through the workers. Without a front server
+        the file is streamed by Django.
+    """
+
+    try:
+        full_path = default_storage.path(path)
+    except SuspiciousFileOperation:
+        raise Http404()
+    if not os.path.isfile(full_path):
+        raise Http404()
+
+    immutable = is_content_addressed(path)
+    etag = '"{}"'.format(os.path.splitext(os.path.basename(path))[0]) if immutable else None
+    if etag is not None and request.META.get('HTTP_IF_NONE_MATCH') == etag:
+        response = HttpResponseNotModified()
+    else:
+        header = getattr(settings, 'MEDIA_SENDFILE_HEADER', None)
+        content_type = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+        if header == 'X-Accel-Redirect':
+            response = HttpResponse(content_type=content_type)
+            response[header] = settings.MEDIA_ACCEL_REDIRECT_PREFIX + path
+        elif header == 'X-Sendfile':
+            response = HttpResponse(content_type=content_type)
+            response[header] = full_path
+        else:
+            response = FileResponse(open(full_path, 'rb'), content_type=content_type)
+
+    response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL if immutable else DEFAULT_CACHE_CONTROL
+    if etag is not None:
+        response['ETag'] = etag
+    return response
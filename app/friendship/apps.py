@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class FriendshipConfig(AppConfig):
     name = 'friendship'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,107 @@
+"""
+Cached friend id sets.
+
+The accepted friends of a profile are kept as a frozenset under a
+versioned key in the shared cache, with a small LRU in front of it in
+every process. Writes to Friendship bump the version of both profiles,
+which orphans every cached copy at once; the orphans simply expire.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import cache
+
+FRIEND_IDS_TIMEOUT = 60 * 60
+LOCAL_CACHE_SIZE = 2048
+
+
+class LRUCache:
+    """
+        Thread safe least recently used mapping of bounded size
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_local = LRUCache(LOCAL_CACHE_SIZE)
+
+
+def _version_key(profile_id):
+    return 'friends:version:{}'.format(profile_id)
+
+
+def _ids_key(profile_id, version):
+    return 'friends:ids:{}:{}'.format(profile_id, version)
+
+
+def _new_version():
+    # time based so a version key evicted from the shared cache never comes
+    # back with a number that still has a stale set stored under it
+    return int(time.time() * 1000)
+
+
+def _get_version(profile_id):
+    key = _version_key(profile_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _new_version(), None)
+        version = cache.get(key)
+    return version
+
+
+def get_friend_ids(profile_id):
+    """
+        Frozenset of the ids of the accepted friends of a profile
+    """
+
+    from .models import Friendship
+
+    version = _get_version(profile_id)
+    friend_ids = _local.get((profile_id, version))
+    if friend_ids is not None:
+        return friend_ids
+
+    key = _ids_key(profile_id, version)
+    friend_ids = cache.get(key)
+    if friend_ids is None:
+        friend_ids = frozenset(Friendship.objects.friend_ids(profile_id))
+        cache.set(key, friend_ids, FRIEND_IDS_TIMEOUT)
+
+    _local.set((profile_id, version), friend_ids)
+    return friend_ids
+
+
+def are_friends(profile_id, other_id):
+    return other_id in get_friend_ids(profile_id)
+
+
+def invalidate_friend_ids(*profile_ids):
+    for profile_id in profile_ids:
+        key = _version_key(profile_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, _new_version(), None)
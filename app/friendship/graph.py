@@ -0,0 +1,232 @@
+"""
+Memory mapped snapshot of the accepted friend graph.
+
+The export_friend_graph command writes the graph in CSR form:
+
+    header      8s magic, int64 node count, int64 edge count,
+                int64 id of the last FriendEdgeChange it contains
+    profile_ids int32[nodes]      sorted profile ids
+    offsets     int32[nodes + 1]  neighbours of profile_ids[i] are
+                                  neighbours[offsets[i]:offsets[i + 1]]
+    neighbours  int32[edges]      profile ids
+
+Every process maps the same file read only, so the pages are shared by
+all the workers of a host. Friendships changed after the export are
+replayed on top of it from the FriendEdgeChange log.
+"""
+
+import os
+import struct
+import threading
+import time
+from collections import defaultdict
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Max
+
+from .cache import get_friend_ids
+from .models import FriendEdgeChange
+from .suggestions import FriendGraph
+
+MAGIC = b'FGRAPH01'
+HEADER = struct.Struct('<8sqqq')
+DELTA_REFRESH_SECONDS = 5
+MAX_DEGREE_OF_SEPARATION = 3
+
+
+def snapshot_path():
+    return getattr(settings, 'FRIEND_GRAPH_SNAPSHOT_PATH',
+                   os.path.join(settings.BASE_DIR, 'friend_graph.bin'))
+
+
+def write_snapshot(path, profile_ids, offsets, neighbours, last_change_id):
+    """
+        Writes a snapshot next to `path` and moves it in place atomically
+    """
+
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp_path, 'wb') as snapshot:
+        snapshot.write(HEADER.pack(MAGIC, len(profile_ids), len(neighbours), last_change_id))
+        for array in (profile_ids, offsets, neighbours):
+            snapshot.write(np.ascontiguousarray(array, dtype='<i4').tobytes())
+    os.replace(tmp_path, path)
+
+
+def export_snapshot(path=None):
+    """
+        Exports the accepted friend graph, returns the number of profiles
+        and of directed edges written
+    """
+
+    # changes logged while the graph is loaded are replayed again by the
+    # readers, which is harmless as replaying is idempotent
+    last_change_id = FriendEdgeChange.objects.aggregate(latest=Max('id'))['latest'] or 0
+    graph = FriendGraph.load()
+    adjacency = graph.adjacency
+    adjacency.sort_indices()
+    write_snapshot(path or snapshot_path(), graph.profile_ids, adjacency.indptr,
+                   graph.profile_ids[adjacency.indices], last_change_id)
+    return len(graph.profile_ids), adjacency.nnz
+
+
+class GraphSnapshot:
+    """
+        Read only view of a snapshot file
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as snapshot:
+            magic, nodes, edges, self.last_change_id = HEADER.unpack(snapshot.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError('{} is not a friend graph snapshot'.format(path))
+
+        self.mtime = os.stat(path).st_mtime
+        offset = HEADER.size
+        self.profile_ids = self._map(path, offset, nodes)
+        offset += nodes * 4
+        self.offsets = self._map(path, offset, nodes + 1)
+        offset += (nodes + 1) * 4
+        self.neighbours = self._map(path, offset, edges)
+
+    @staticmethod
+    def _map(path, offset, length):
+        if not length:
+            return np.zeros(0, dtype='<i4')
+        return np.memmap(path, dtype='<i4', mode='r', offset=offset, shape=(length,))
+
+    def friends_of(self, profile_id):
+        # searching with the array's own dtype avoids converting the array
+        index = np.searchsorted(self.profile_ids, self.profile_ids.dtype.type(profile_id))
+        if index == len(self.profile_ids) or self.profile_ids[index] != profile_id:
+            return ()
+        return self.neighbours[self.offsets[index]:self.offsets[index + 1]]
+
+
+class SocialGraph:
+    """
+        Snapshot of the friend graph with the later friendship changes
+        replayed on top of it
+    """
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self.last_change_id = snapshot.last_change_id
+        self.added = defaultdict(set)
+        self.removed = defaultdict(set)
+        self.refreshed_at = 0
+
+    def refresh(self):
+        """
+            Replays the changes logged since the last refresh
+        """
+
+        changes = FriendEdgeChange.objects.filter(id__gt=self.last_change_id).order_by('id') \
+            .values_list('id', 'profile_one_id', 'profile_two_id', 'accepted')
+        for change_id, profile_one, profile_two, accepted in changes.iterator():
+            for profile_id, friend_id in ((profile_one, profile_two), (profile_two, profile_one)):
+                if accepted:
+                    self.added[profile_id].add(friend_id)
+                    self.removed[profile_id].discard(friend_id)
+                else:
+                    self.removed[profile_id].add(friend_id)
+                    self.added[profile_id].discard(friend_id)
+            self.last_change_id = change_id
+        self.refreshed_at = time.monotonic()
+
+    def friends_of(self, profile_id):
+        friends = self.snapshot.friends_of(profile_id)
+        if profile_id not in self.added and profile_id not in self.removed:
+            return friends
+        return (set(friends) - self.removed[profile_id]) | self.added[profile_id]
+
+
+class CachedFriendGraph:
+    """
+        Fallback used while no snapshot has been exported, backed by the
+        cached friend id sets
+    """
+
+    def friends_of(self, profile_id):
+        return get_friend_ids(profile_id)
+
+
+_graph = None
+_graph_lock = threading.Lock()
+
+
+def get_graph():
+    """
+        The process wide graph, remapped when a new snapshot was exported
+        and refreshed from the change log every DELTA_REFRESH_SECONDS
+    """
+
+    global _graph
+    path = snapshot_path()
+    with _graph_lock:
+        try:
+            mtime = os.stat(path).st_mtime
+        except FileNotFoundError:
+            _graph = None
+            return CachedFriendGraph()
+
+        if _graph is None or _graph.snapshot.mtime != mtime:
+            _graph = SocialGraph(GraphSnapshot(path))
+        if time.monotonic() - _graph.refreshed_at > DELTA_REFRESH_SECONDS:
+            _graph.refresh()
+        return _graph
+
+
+def connection_path(graph, source, target, max_depth=MAX_DEGREE_OF_SEPARATION):
+    """
+        Shortest chain of friends from `source` to `target` with at most
+        `max_depth` friendships, found with a bidirectional breadth first
+        search. Returns the profile ids of the chain, or None.
+    """
+
+    if source == target:
+        return [source]
+
+    parents = {source: None}
+    children = {target: None}
+    forward, backward = [source], [target]
+
+    for _ in range(max_depth):
+        # expand the smaller frontier, the other side only gets checked
+        if len(forward) <= len(backward):
+            forward, meeting = _expand(graph, forward, parents, children)
+        else:
+            backward, meeting = _expand(graph, backward, children, parents)
+        if meeting is not None:
+            return _join(meeting, parents, children)
+        if not forward or not backward:
+            return None
+    return None
+
+
+def _expand(graph, frontier, seen, other_side):
+    next_frontier = []
+    for profile_id in frontier:
+        for friend_id in graph.friends_of(profile_id):
+            friend_id = int(friend_id)
+            if friend_id in seen:
+                continue
+            seen[friend_id] = profile_id
+            if friend_id in other_side:
+                return next_frontier, friend_id
+            next_frontier.append(friend_id)
+    return next_frontier, None
+
+
+def _join(meeting, parents, children):
+    path = []
+    node = meeting
+    while node is not None:
+        path.append(node)
+        node = parents[node]
+    path.reverse()
+    node = children[meeting]
+    while node is not None:
+        path.append(node)
+        node = children[node]
+    return path
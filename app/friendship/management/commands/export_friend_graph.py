@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from friendship.graph import export_snapshot, snapshot_path
+
+
+class Command(BaseCommand):
+    help = 'Exports the accepted friend graph to the memory mapped snapshot file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=None,
+                            help='Snapshot path, FRIEND_GRAPH_SNAPSHOT_PATH by default')
+
+    def handle(self, *args, **options):
+        path = options['output'] or snapshot_path()
+        profiles, edges = export_snapshot(path)
+        self.stdout.write(self.style.SUCCESS(
+            'Exported {} profiles and {} edges to {}'.format(profiles, edges, path)
+        ))
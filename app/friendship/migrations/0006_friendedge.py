@@ -0,0 +1,37 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+CREATE_VIEW = """
+CREATE VIEW friendship_friendedge AS
+    SELECT id * 2 AS id, user_one_id_id AS profile_id, user_two_id_id AS friend_id
+    FROM friendship_friendship WHERE status = 2
+    UNION ALL
+    SELECT id * 2 + 1 AS id, user_two_id_id AS profile_id, user_one_id_id AS friend_id
+    FROM friendship_friendship WHERE status = 2
+"""
+
+DROP_VIEW = "DROP VIEW IF EXISTS friendship_friendedge"
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0001_initial'),
+        ('friendship', '0005_auto_20200722_1226'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_VIEW, DROP_VIEW),
+        migrations.CreateModel(
+            name='FriendEdge',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('friend', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='profiles.Profile')),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='profiles.Profile')),
+            ],
+            options={
+                'db_table': 'friendship_friendedge',
+                'managed': False,
+            },
+        ),
+    ]
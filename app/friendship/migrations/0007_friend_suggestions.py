@@ -0,0 +1,45 @@
+# Generated by Django 3.0.8 on 2026-10-18 18:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0001_initial'),
+        ('friendship', '0006_friendedge'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FriendEdgeChange',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('profile_one_id', models.IntegerField()),
+                ('profile_two_id', models.IntegerField()),
+                ('accepted', models.BooleanField()),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='FriendSuggestion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='friend_suggestions', to='profiles.Profile')),
+                ('suggested', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='profiles.Profile')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='friendsuggestion',
+            index=models.Index(fields=['profile', 'rank'], name='friendship_suggestion_rank_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='friendsuggestion',
+            unique_together={('profile', 'suggested')},
+        ),
+    ]
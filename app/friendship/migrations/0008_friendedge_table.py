@@ -0,0 +1,81 @@
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+CREATE_VIEW = """
+CREATE VIEW friendship_friendedge AS
+    SELECT id * 2 AS id, user_one_id_id AS profile_id, user_two_id_id AS friend_id
+    FROM friendship_friendship WHERE status = 2
+    UNION ALL
+    SELECT id * 2 + 1 AS id, user_two_id_id AS profile_id, user_one_id_id AS friend_id
+    FROM friendship_friendship WHERE status = 2
+"""
+
+DROP_VIEW = "DROP VIEW IF EXISTS friendship_friendedge"
+
+STATUS_PREFERENCE = {2: 0, 1: 1, 3: 2, None: 3}
+
+
+def build_edges(apps, schema_editor):
+    """
+        Creates the two edges of every friendship. When both A->B and B->A
+        exist, the accepted (then pending, then oldest) one is kept and the
+        other friendship row is removed.
+    """
+
+    Friendship = apps.get_model('friendship', 'Friendship')
+    FriendEdge = apps.get_model('friendship', 'FriendEdge')
+
+    kept = {}
+    for friendship in Friendship.objects.order_by('id').iterator():
+        pair = frozenset((friendship.user_one_id_id, friendship.user_two_id_id))
+        current = kept.get(pair)
+        if current is None or STATUS_PREFERENCE[friendship.status] < STATUS_PREFERENCE[current.status]:
+            kept[pair] = friendship
+
+    kept_ids = {friendship.id for friendship in kept.values()}
+    redundant = [pk for pk in Friendship.objects.values_list('id', flat=True) if pk not in kept_ids]
+    for start in range(0, len(redundant), 1000):
+        Friendship.objects.filter(id__in=redundant[start:start + 1000]).delete()
+
+    edges = []
+    for friendship in kept.values():
+        for profile_id, friend_id in ((friendship.user_one_id_id, friendship.user_two_id_id),
+                                      (friendship.user_two_id_id, friendship.user_one_id_id)):
+            edges.append(FriendEdge(friendship_id=friendship.id, profile_id=profile_id, friend_id=friend_id,
+                                    status=friendship.status, created_at=friendship.created_at))
+    FriendEdge.objects.bulk_create(edges, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0001_initial'),
+        ('friendship', '0007_friend_suggestions'),
+    ]
+
+    operations = [
+        migrations.RunSQL(DROP_VIEW, CREATE_VIEW),
+        migrations.DeleteModel(
+            name='FriendEdge',
+        ),
+        migrations.CreateModel(
+            name='FriendEdge',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.IntegerField(choices=[(1, 'Pending'), (2, 'Accepted'), (3, 'Declined')], null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('friend', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='profiles.Profile')),
+                ('friendship', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='edges', to='friendship.Friendship')),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='profiles.Profile')),
+            ],
+            options={
+                'unique_together': {('profile', 'friend')},
+            },
+        ),
+        migrations.AddIndex(
+            model_name='friendedge',
+            index=models.Index(fields=['profile', 'status', 'friend'], name='friendship_edge_status_idx'),
+        ),
+        migrations.RunPython(build_edges, migrations.RunPython.noop),
+    ]
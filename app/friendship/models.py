@@ -1,14 +1,18 @@
 from django.core import exceptions
 from django.core.exceptions import ValidationError
-from django.db import models
-from django.db.models import Q
+from django.db import IntegrityError, models, transaction
 from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 
 from profiles.models import Profile
+from .cache import are_friends
 from .exceptions import AlreadyExistsError, AlreadyFriendsError
 
 
+def _profile_id(profile):
+    return getattr(profile, 'pk', profile)
+
+
 class FriendshipManager(models.Manager):
     """
         Friendship manager
@@ -16,35 +20,52 @@ class FriendshipManager(models.Manager):
 
     def validation(self, user1, user2, status):
 
-        if Friendship.objects.filter(
-                Q(user_one_id=user1, user_two_id=user2, status=status)
-                | Q(user_one_id=user2, user_two_id=user1, status=status)
-        ).exists():
+        if status == Friendship.Status.ACCEPTED:
+            return are_friends(_profile_id(user1), _profile_id(user2))
+
+        if FriendEdge.objects.filter(profile=user1, friend=user2, status=status).exists():
             return True
         else:
             return False
 
+    def friend_ids(self, profile):
+        """
+            Ids of the profiles that have an accepted friendship with `profile`
+        """
+
+        return set(FriendEdge.objects.filter(profile=profile, status=Friendship.Status.ACCEPTED)
+                   .values_list('friend', flat=True))
+
     def add_friend(self, from_user, to_user):
         """
-            Create a friendship request
+            Create a friendship request. A declined request between the two
+            profiles, sent by either of them, is replaced by the new one.
         """
 
         if from_user == to_user:
             raise ValidationError("Users cannot be friends with themselves")
 
-        if self.validation(from_user, to_user, 1):
+        edge = FriendEdge.objects.filter(profile=from_user, friend=to_user).select_related('friendship').first()
+        if edge is not None and edge.status == Friendship.Status.PENDING:
             raise AlreadyExistsError("Friendship already requested")
 
-        if self.validation(from_user, to_user, 2):
+        if edge is not None and edge.status == Friendship.Status.ACCEPTED:
             raise AlreadyFriendsError("Users are already friends")
 
-        friendship = Friendship.objects.create(
-            user_one_id=from_user, user_two_id=to_user, status=1
-        )
-
-        friendship.save()
-
-        # return friendship
+        try:
+            with transaction.atomic():
+                if edge is not None:
+                    friendship = edge.friendship
+                    friendship.user_one_id, friendship.user_two_id = from_user, to_user
+                    friendship.status = Friendship.Status.PENDING
+                    friendship.created_at = timezone.now()
+                    friendship.save()
+                else:
+                    Friendship.objects.create(user_one_id=from_user, user_two_id=to_user,
+                                              status=Friendship.Status.PENDING)
+        except IntegrityError:
+            # a concurrent request between the same profiles was saved first
+            raise AlreadyExistsError("Friendship already requested")
 
     def accept(self, user1, user2):
         """
@@ -53,7 +74,7 @@ class FriendshipManager(models.Manager):
 
         friendship = Friendship.objects.filter(
             user_one_id=user1, user_two_id=user2, status=1
-        )
+        ).first()
 
         if friendship:
             friendship.status = 2
@@ -68,7 +89,7 @@ class FriendshipManager(models.Manager):
 
         friendship = Friendship.objects.filter(
             user_one_id=user1, user_two_id=user2, status=1
-        )
+        ).first()
 
         if friendship:
             friendship.status = 3
@@ -83,13 +104,8 @@ class FriendshipManager(models.Manager):
         """
 
         try:
-            qs = (
-                Friendship.objects.filter(
-                    Q(user_one_id=to_user, user_two_id=from_user, status=2)
-                    | Q(user_one_id=from_user, user_two_id=to_user, status=2)
-                )
-                    .distinct()
-                    .all()
+            qs = Friendship.objects.filter(
+                pk__in=FriendEdge.objects.filter(profile=from_user, friend=to_user, status=2).values('friendship')
             )
 
             if qs:
@@ -121,6 +137,9 @@ class Friendship(models.Model):
 
     objects = FriendshipManager()
 
+    # the status as last loaded or saved, None for a new friendship
+    saved_status = None
+
     class Meta:
         verbose_name = _("Friend")
         verbose_name_plural = _("Friends")
@@ -129,8 +148,142 @@ class Friendship(models.Model):
     def __str__(self):
         return f"User {self.user_one_id} is friend with user {self.user_two_id}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        friendship = super().from_db(db, field_names, values)
+        if 'status' in field_names:
+            friendship.saved_status = friendship.status
+        return friendship
+
+    def became(self, status):
+        """
+            Whether the save being signalled moves the friendship to
+            `status`, for the post_save receivers
+        """
+
+        return self.status == status and self.saved_status != status
+
     def save(self, *args, **kwargs):
         # users can't be friends with themselves
         if self.user_one_id == self.user_two_id:
             raise ValidationError("Users cannot be friends with themselves.")
-        super(Friendship, self).save(*args, **kwargs)
+        with transaction.atomic():
+            super(Friendship, self).save(*args, **kwargs)
+            self.sync_edges()
+        self.saved_status = self.status
+
+    def sync_edges(self):
+        """
+            Mirrors this friendship into its two FriendEdge rows. The unique
+            (profile, friend) constraint of the edges refuses a friendship
+            whose reverse direction already exists.
+        """
+
+        if FriendEdge.objects.filter(friendship=self).update(status=self.status):
+            return
+        FriendEdge.objects.bulk_create([
+            FriendEdge(friendship=self, profile_id=self.user_one_id_id, friend_id=self.user_two_id_id,
+                       status=self.status, created_at=self.created_at),
+            FriendEdge(friendship=self, profile_id=self.user_two_id_id, friend_id=self.user_one_id_id,
+                       status=self.status, created_at=self.created_at),
+        ])
+
+
+class FriendEdgeManager(models.Manager):
+    """
+        Friend edge manager
+    """
+
+    def friends_of(self, profile):
+        """
+            Subquery of the ids of the accepted friends of `profile`
+        """
+
+        return self.filter(profile=profile, status=Friendship.Status.ACCEPTED).values('friend')
+
+    def connected_to(self, profile):
+        """
+            Subquery of the ids of the profiles `profile` is friends with or
+            has a pending request with, sent by either of them
+        """
+
+        return self.filter(profile=profile, status__in=[Friendship.Status.PENDING, Friendship.Status.ACCEPTED]) \
+            .values('friend')
+
+    def mutual_counts(self, profile, profile_ids):
+        """
+            Number of friends every profile in `profile_ids` shares with
+            `profile`, as a {profile_id: count} dict without the zeros
+        """
+
+        return dict(
+            self.filter(profile__in=profile_ids, status=Friendship.Status.ACCEPTED,
+                        friend__in=self.friends_of(profile))
+                .values('profile')
+                .annotate(mutual=models.Count('friend'))
+                .values_list('profile', 'mutual')
+        )
+
+
+class FriendEdge(models.Model):
+    """
+        Friendships normalized to one row per direction, kept in sync by
+        Friendship.save and removed with their friendship. "Are A and B
+        friends" is a single probe of the (profile, friend) unique index
+        and a friend list is one range scan of (profile, status, friend).
+    """
+
+    friendship = models.ForeignKey(Friendship, models.CASCADE, related_name='edges')
+    profile = models.ForeignKey(Profile, models.CASCADE, related_name='+')
+    friend = models.ForeignKey(Profile, models.CASCADE, related_name='+')
+    status = models.IntegerField(choices=Friendship.Status.choices, null=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    objects = FriendEdgeManager()
+
+    class Meta:
+        unique_together = ("profile", "friend")
+        indexes = [
+            models.Index(fields=['profile', 'status', 'friend'], name='friendship_edge_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"User {self.friend_id} is friend with user {self.profile_id}"
+
+
+class FriendEdgeChange(models.Model):
+    """
+        Append only log of accepted friendships that were created or
+        removed, consumed by the batch jobs that work on the friend graph.
+        Holds plain ids so that entries outlive the profiles they mention.
+    """
+
+    profile_one_id = models.IntegerField()
+    profile_two_id = models.IntegerField()
+    accepted = models.BooleanField()
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        action = 'added' if self.accepted else 'removed'
+        return f"Edge {self.profile_one_id}-{self.profile_two_id} {action}"
+
+
+class FriendSuggestion(models.Model):
+    """
+        Precomputed "people you may know" entry, ranked per profile
+    """
+
+    profile = models.ForeignKey(Profile, models.CASCADE, related_name='friend_suggestions')
+    suggested = models.ForeignKey(Profile, models.CASCADE, related_name='+')
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        unique_together = ("profile", "suggested")
+        indexes = [
+            models.Index(fields=['profile', 'rank'], name='friendship_suggestion_rank_idx'),
+        ]
+
+    def __str__(self):
+        return f"Suggest user {self.suggested_id} to user {self.profile_id}"
@@ -1,7 +1,7 @@
 from rest_framework import serializers
 
 from profiles.serializers import ProfileSerializer
-from .models import Friendship
+from .models import Friendship, FriendEdge, FriendSuggestion
 
 
 class SpecifUserSerializer(ProfileSerializer):
@@ -16,3 +16,18 @@ class FriendshipSerializer(serializers.ModelSerializer):
         model = Friendship
         fields = ('friend', 'created_at')
 
+
+class FriendEdgeSerializer(serializers.ModelSerializer):
+    friend = SpecifUserSerializer()
+
+    class Meta:
+        model = FriendEdge
+        fields = ('friend', 'created_at')
+
+
+class FriendSuggestionSerializer(serializers.ModelSerializer):
+    profile = SpecifUserSerializer(source='suggested')
+
+    class Meta:
+        model = FriendSuggestion
+        fields = ('profile', 'score')
@@ -0,0 +1,31 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import invalidate_friend_ids
+from .models import Friendship, FriendEdgeChange
+
+
+@receiver(post_save, sender=Friendship)
+@receiver(post_delete, sender=Friendship)
+def invalidate_friendship_cache(sender, instance, **kwargs):
+    profile_ids = (instance.user_one_id_id, instance.user_two_id_id)
+    invalidate_friend_ids(*profile_ids)
+    # a reader may cache the pre-commit state between now and the commit
+    transaction.on_commit(lambda: invalidate_friend_ids(*profile_ids))
+
+
+@receiver(post_save, sender=Friendship)
+def log_accepted_friendship(sender, instance, **kwargs):
+    if instance.became(Friendship.Status.ACCEPTED):
+        FriendEdgeChange.objects.create(profile_one_id=instance.user_one_id_id,
+                                        profile_two_id=instance.user_two_id_id,
+                                        accepted=True)
+
+
+@receiver(post_delete, sender=Friendship)
+def log_removed_friendship(sender, instance, **kwargs):
+    if instance.status == Friendship.Status.ACCEPTED:
+        FriendEdgeChange.objects.create(profile_one_id=instance.user_one_id_id,
+                                        profile_two_id=instance.user_two_id_id,
+                                        accepted=False)
@@ -0,0 +1,170 @@
+"""
+"People you may know" scoring.
+
+The accepted friend graph is loaded into a sparse CSR adjacency matrix A
+over a compact index of profile ids. For a batch of rows R, A[R] @ A
+holds, for every pair, the number of friends the two profiles share
+(common neighbours). Adamic-Adar weighs every shared friend w by
+1 / log(deg(w)) instead, so that friends with huge friend lists count
+less: A[R] @ diag(w) @ A. Friends, pending requests and the profile
+itself are masked out and the top K of every row are stored as
+FriendSuggestion rows.
+"""
+
+from itertools import chain
+
+import numpy as np
+from django.db import transaction
+from scipy import sparse
+
+from .models import Friendship, FriendEdge, FriendSuggestion
+
+COMMON_NEIGHBOURS = 'common_neighbours'
+ADAMIC_ADAR = 'adamic_adar'
+
+SUGGESTIONS_PER_PROFILE = 20
+BATCH_SIZE = 1000
+
+
+class FriendGraph:
+    """
+        Accepted friend graph as a symmetric CSR adjacency matrix
+    """
+
+    def __init__(self, profile_ids, adjacency):
+        # sorted, so that positions can be found with a binary search
+        self.profile_ids = profile_ids
+        self.adjacency = adjacency
+
+    @classmethod
+    def load(cls):
+        edges = np.fromiter(
+            chain.from_iterable(
+                FriendEdge.objects.filter(status=Friendship.Status.ACCEPTED)
+                .values_list('profile', 'friend').iterator(chunk_size=10000)
+            ),
+            dtype=np.int64,
+        ).reshape(-1, 2)
+        profile_ids = np.unique(edges)
+        return cls(profile_ids, cls._pairs_to_matrix(profile_ids, edges))
+
+    @staticmethod
+    def _pairs_to_matrix(profile_ids, pairs):
+        size = len(profile_ids)
+        rows = np.searchsorted(profile_ids, pairs[:, 0])
+        cols = np.searchsorted(profile_ids, pairs[:, 1])
+        matrix = sparse.csr_matrix(
+            (np.ones(2 * len(rows), dtype=np.float32), (np.concatenate([rows, cols]), np.concatenate([cols, rows]))),
+            shape=(size, size),
+        )
+        # duplicated pairs were summed up while building the matrix
+        matrix.data[:] = 1
+        return matrix
+
+    def pairs_matrix(self, pairs):
+        """
+            Symmetric matrix of the given (profile_id, profile_id) pairs,
+            ignoring the pairs that reference profiles outside the graph
+        """
+
+        pairs = np.array(list(pairs), dtype=np.int64).reshape(-1, 2)
+        known = np.isin(pairs, self.profile_ids).all(axis=1)
+        return self._pairs_to_matrix(self.profile_ids, pairs[known])
+
+    def positions(self, profile_ids):
+        """
+            Matrix rows of the given profile ids, and the ids that have no
+            accepted friend at all
+        """
+
+        profile_ids = np.array(sorted(profile_ids), dtype=np.int64)
+        known = np.isin(profile_ids, self.profile_ids)
+        return np.searchsorted(self.profile_ids, profile_ids[known]), profile_ids[~known].tolist()
+
+    def with_neighbours(self, rows):
+        """
+            The given rows plus the rows of all their friends
+        """
+
+        neighbours = self.adjacency[rows].indices
+        return np.union1d(rows, neighbours)
+
+
+def score_rows(graph, rows, excluded, method=COMMON_NEIGHBOURS):
+    """
+        Sparse matrix of the candidate scores of every row in `rows`
+    """
+
+    adjacency = graph.adjacency
+    friends = adjacency[rows]
+    if method == ADAMIC_ADAR:
+        degrees = np.asarray(adjacency.sum(axis=0)).ravel()
+        weights = np.zeros_like(degrees)
+        # a friend with a single friend is never shared by two profiles
+        shared = degrees > 1
+        weights[shared] = 1 / np.log(degrees[shared])
+        friends = friends @ sparse.diags(weights)
+
+    scores = (friends @ adjacency).tocsr()
+    scores = scores - scores.multiply(excluded[rows] > 0)
+    scores.eliminate_zeros()
+    return scores
+
+
+def top_suggestions(graph, rows, scores, limit=SUGGESTIONS_PER_PROFILE):
+    """
+        Yields a FriendSuggestion for the `limit` best candidates of every row
+    """
+
+    for index, row in enumerate(rows):
+        start, end = scores.indptr[index], scores.indptr[index + 1]
+        candidates, values = scores.indices[start:end], scores.data[start:end]
+        if len(values) > limit:
+            best = np.argpartition(-values, limit)[:limit]
+        else:
+            best = np.arange(len(values))
+        best = best[np.argsort(-values[best], kind='stable')]
+
+        profile_id = int(graph.profile_ids[row])
+        for rank, position in enumerate(best, start=1):
+            yield FriendSuggestion(profile_id=profile_id,
+                                   suggested_id=int(graph.profile_ids[candidates[position]]),
+                                   score=float(values[position]),
+                                   rank=rank)
+
+
+def rebuild_suggestions(profile_ids=None, method=COMMON_NEIGHBOURS, limit=SUGGESTIONS_PER_PROFILE,
+                        batch_size=BATCH_SIZE):
+    """
+        Recomputes the suggestions of every profile, or only of the given
+        profiles and their friends, whose candidates change with them.
+        Returns the number of profiles that were rebuilt.
+    """
+
+    graph = FriendGraph.load()
+    size = len(graph.profile_ids)
+
+    if profile_ids is None:
+        rows = np.arange(size)
+        FriendSuggestion.objects.exclude(
+            profile__in=FriendEdge.objects.filter(status=Friendship.Status.ACCEPTED).values('profile')
+        ).delete()
+    else:
+        rows, isolated = graph.positions(profile_ids)
+        rows = graph.with_neighbours(rows)
+        FriendSuggestion.objects.filter(profile__in=isolated).delete()
+
+    pending = graph.pairs_matrix(
+        Friendship.objects.filter(status=Friendship.Status.PENDING).values_list('user_one_id', 'user_two_id')
+    )
+    excluded = (graph.adjacency + pending + sparse.identity(size, dtype=np.float32, format='csr')).tocsr()
+
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        scores = score_rows(graph, batch, excluded, method=method)
+        suggestions = list(top_suggestions(graph, batch, scores, limit=limit))
+        with transaction.atomic():
+            FriendSuggestion.objects.filter(profile__in=graph.profile_ids[batch].tolist()).delete()
+            FriendSuggestion.objects.bulk_create(suggestions, batch_size=1000)
+
+    return len(rows)
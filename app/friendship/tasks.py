@@ -0,0 +1,67 @@
+import datetime
+from itertools import chain
+
+from celery.schedules import crontab
+from celery.task import periodic_task
+from celery.utils.log import get_task_logger
+from django.core.cache import cache
+from django.db.models import Max
+from django.utils import timezone
+
+from friendship.graph import export_snapshot
+from friendship.models import FriendEdgeChange
+from friendship.suggestions import COMMON_NEIGHBOURS, rebuild_suggestions
+
+logger = get_task_logger(__name__)
+
+SUGGESTIONS_WATERMARK_KEY = 'friendship:suggestions:last_change_id'
+EDGE_CHANGE_RETENTION = datetime.timedelta(days=7)
+
+
+@periodic_task(run_every=(crontab(minute=15)), name="refresh_friend_suggestions", ignore_result=True)
+def refresh_friend_suggestions(method=COMMON_NEIGHBOURS):
+    """
+        Rebuilds the suggestions of the profiles whose friendships changed
+        since the last run. Falls back to a full rebuild when the position
+        of the last run is unknown.
+    """
+
+    last_change_id = cache.get(SUGGESTIONS_WATERMARK_KEY)
+    if last_change_id is None:
+        return rebuild_friend_suggestions(method=method)
+
+    latest_change_id = FriendEdgeChange.objects.aggregate(latest=Max('id'))['latest'] or 0
+    changes = FriendEdgeChange.objects.filter(id__gt=last_change_id, id__lte=latest_change_id)
+    profile_ids = set(chain.from_iterable(changes.values_list('profile_one_id', 'profile_two_id')))
+    rebuilt = rebuild_suggestions(profile_ids, method=method) if profile_ids else 0
+
+    cache.set(SUGGESTIONS_WATERMARK_KEY, latest_change_id, None)
+    logger.info("refreshed friend suggestions of %s profiles", rebuilt)
+    return rebuilt
+
+
+@periodic_task(run_every=(crontab(minute=0, hour=3)), name="rebuild_friend_suggestions", ignore_result=True)
+def rebuild_friend_suggestions(method=COMMON_NEIGHBOURS):
+    """
+        Rebuilds the suggestions of every profile and trims the edge change log
+    """
+
+    latest_change_id = FriendEdgeChange.objects.aggregate(latest=Max('id'))['latest'] or 0
+    rebuilt = rebuild_suggestions(method=method)
+
+    cache.set(SUGGESTIONS_WATERMARK_KEY, latest_change_id, None)
+    FriendEdgeChange.objects.filter(created_at__lt=timezone.now() - EDGE_CHANGE_RETENTION).delete()
+    logger.info("rebuilt friend suggestions of %s profiles", rebuilt)
+    return rebuilt
+
+
+@periodic_task(run_every=(crontab(minute=30, hour='*/4')), name="export_friend_graph", ignore_result=True)
+def export_friend_graph():
+    """
+        Re-exports the friend graph snapshot, well within the retention of
+        the edge change log the readers replay on top of it
+    """
+
+    profiles, edges = export_snapshot()
+    logger.info("exported friend graph of %s profiles and %s edges", profiles, edges)
+    return edges
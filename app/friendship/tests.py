@@ -1,3 +1,302 @@
-from django.test import TestCase
+import math
+import os
+import tempfile
+from datetime import datetime
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from accounts.models import User
+from profiles.models import Profile
+from . import graph
+from .cache import LOCAL_CACHE_SIZE, LRUCache, are_friends, get_friend_ids
+from .exceptions import AlreadyExistsError, AlreadyFriendsError
+from .models import Friendship, FriendEdge, FriendSuggestion
+from .suggestions import ADAMIC_ADAR
+from .tasks import rebuild_friend_suggestions, refresh_friend_suggestions
+from .views import MUTUAL_COUNTS_MAX_IDS
+
+
+def create_profile(email, first_name='John', last_name='Doe'):
+    user = User.objects.create_user(email=email, password='password')
+    return Profile.objects.create(user=user, first_name=first_name, last_name=last_name,
+                                  birthday=datetime(1990, 1, 1).date(), gender='M')
+
+
+def client_for(profile):
+    client = APIClient()
+    client.force_authenticate(profile.user)
+    return client
+
+
+def befriend(profile, friend, status=Friendship.Status.ACCEPTED):
+    return Friendship.objects.create(user_one_id=profile, user_two_id=friend, status=status)
+
+
+class FriendTestCase(TestCase):
+    """
+        Starts every test with empty friend id caches
+    """
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch('friendship.cache._local', LRUCache(LOCAL_CACHE_SIZE))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class FriendIdCacheTests(FriendTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.profile = create_profile('someone@example.com')
+        self.friend = create_profile('friend@example.com')
+
+    def test_friend_ids_follow_friendship_changes(self):
+        self.assertEqual(get_friend_ids(self.profile.pk), frozenset())
+
+        Friendship.objects.add_friend(self.friend, self.profile)
+        self.assertEqual(get_friend_ids(self.profile.pk), frozenset())
+
+        response = client_for(self.profile).post('/friends/{}/accept_request/'.format(self.friend.user.pk))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(get_friend_ids(self.profile.pk), {self.friend.pk})
+        self.assertEqual(get_friend_ids(self.friend.pk), {self.profile.pk})
+
+        Friendship.objects.remove_friend(self.profile, self.friend)
+        self.assertEqual(get_friend_ids(self.profile.pk), frozenset())
+        self.assertEqual(get_friend_ids(self.friend.pk), frozenset())
+
+    def test_friend_checks_read_the_cache(self):
+        befriend(self.profile, self.friend)
+        get_friend_ids(self.profile.pk)
+        with self.assertNumQueries(0):
+            self.assertTrue(are_friends(self.profile.pk, self.friend.pk))
+            self.assertTrue(Friendship.objects.validation(self.profile, self.friend, Friendship.Status.ACCEPTED))
+
+    def test_local_cache_is_bounded(self):
+        local = LRUCache(2)
+        local.set('a', 1)
+        local.set('b', 2)
+        local.get('a')
+        local.set('c', 3)
+        self.assertEqual((local.get('a'), local.get('b'), local.get('c')), (1, None, 3))
+
+
+class MutualFriendsTests(FriendTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.profile, self.other, self.first, self.second, self.third = [
+            create_profile('someone{}@example.com'.format(index)) for index in range(5)
+        ]
+        for profile in (self.profile, self.other):
+            befriend(self.first, profile)
+            befriend(profile, self.second)
+        befriend(self.third, self.other)
+        befriend(self.profile, self.third, status=Friendship.Status.PENDING)
+        self.client = client_for(self.profile)
+
+    def test_mutual_friends(self):
+        response = self.client.get('/friends/{}/mutual_friends/'.format(self.other.pk))
+        self.assertEqual([friend['user'] for friend in response.json()['results']],
+                         [self.second.user.pk, self.first.user.pk])
+
+    def test_mutual_friends_of_unknown_profile(self):
+        self.assertEqual(self.client.get('/friends/9999/mutual_friends/').status_code, 404)
+        self.assertEqual(self.client.get('/friends/abc/mutual_friends/').status_code, 404)
+
+    def test_mutual_counts(self):
+        ids = [self.other.pk, self.first.pk, self.third.pk, 9999]
+        with self.assertNumQueries(1):
+            response = self.client.get('/friends/mutual_counts/', {'ids': ','.join(map(str, ids))})
+        self.assertEqual(response.json(), {str(self.other.pk): 2, str(self.first.pk): 0,
+                                           str(self.third.pk): 0, '9999': 0})
+
+    def test_mutual_counts_validation(self):
+        self.assertEqual(self.client.get('/friends/mutual_counts/', {'ids': 'x'}).status_code, 400)
+        too_many = ','.join(str(profile_id) for profile_id in range(1, MUTUAL_COUNTS_MAX_IDS + 2))
+        self.assertEqual(self.client.get('/friends/mutual_counts/', {'ids': too_many}).status_code, 400)
+
+
+class SuggestionTests(FriendTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.first, self.second, self.third, self.fourth, self.fifth = [
+            create_profile('someone{}@example.com'.format(index)) for index in range(5)
+        ]
+        for profile, friend in ((self.first, self.second), (self.second, self.third), (self.first, self.fourth),
+                                (self.fourth, self.third), (self.fifth, self.third)):
+            befriend(profile, friend)
+
+    def suggestions(self, profile):
+        response = client_for(profile).get('/friends/suggestions/')
+        return [(suggestion['profile']['user'], suggestion['score']) for suggestion in response.json()['results']]
+
+    def test_common_neighbours(self):
+        rebuild_friend_suggestions()
+        self.assertEqual(self.suggestions(self.first), [(self.third.user.pk, 2)])
+        self.assertEqual(self.suggestions(self.second), [(self.fourth.user.pk, 2), (self.fifth.user.pk, 1)])
+
+    def test_adamic_adar(self):
+        rebuild_friend_suggestions(method=ADAMIC_ADAR)
+        scores = dict(FriendSuggestion.objects.filter(profile=self.second).values_list('suggested', 'score'))
+        self.assertEqual(scores.keys(), {self.fourth.pk, self.fifth.pk})
+        # shared friends with fewer friends of their own weigh more
+        self.assertAlmostEqual(scores[self.fourth.pk], 1 / math.log(2) + 1 / math.log(3), places=5)
+        self.assertAlmostEqual(scores[self.fifth.pk], 1 / math.log(3), places=5)
+
+    def test_requests_hide_suggestions(self):
+        rebuild_friend_suggestions()
+        Friendship.objects.add_friend(self.second, self.fourth)
+        self.assertEqual(self.suggestions(self.second), [(self.fifth.user.pk, 1)])
+        self.assertEqual(self.suggestions(self.fourth), [(self.fifth.user.pk, 1)])
+
+        Friendship.objects.reject(self.second, self.fourth)
+        self.assertEqual(self.suggestions(self.second), [(self.fourth.user.pk, 2), (self.fifth.user.pk, 1)])
+
+    def test_refresh_rebuilds_the_changed_profiles(self):
+        rebuild_friend_suggestions()
+        befriend(self.first, self.third)
+
+        self.assertEqual(refresh_friend_suggestions(), 5)
+        self.assertEqual(self.suggestions(self.first), [(self.fifth.user.pk, 1)])
+        self.assertEqual(refresh_friend_suggestions(), 0)
+
+
+class FriendEdgeTests(FriendTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.profile = create_profile('someone@example.com')
+        self.friend = create_profile('friend@example.com')
+
+    def edges(self):
+        return set(FriendEdge.objects.values_list('profile', 'friend', 'status'))
+
+    def test_edges_mirror_the_friendship(self):
+        Friendship.objects.add_friend(self.profile, self.friend)
+        pending = Friendship.Status.PENDING
+        self.assertEqual(self.edges(), {(self.profile.pk, self.friend.pk, pending),
+                                        (self.friend.pk, self.profile.pk, pending)})
+
+        Friendship.objects.accept(self.profile, self.friend)
+        accepted = Friendship.Status.ACCEPTED
+        self.assertEqual(self.edges(), {(self.profile.pk, self.friend.pk, accepted),
+                                        (self.friend.pk, self.profile.pk, accepted)})
+
+        self.assertTrue(Friendship.objects.remove_friend(self.friend, self.profile))
+        self.assertEqual(self.edges(), set())
+
+    def test_one_friendship_per_pair(self):
+        Friendship.objects.add_friend(self.profile, self.friend)
+        with self.assertRaises(AlreadyExistsError):
+            Friendship.objects.add_friend(self.friend, self.profile)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            befriend(self.friend, self.profile, status=Friendship.Status.PENDING)
+
+        Friendship.objects.accept(self.profile, self.friend)
+        with self.assertRaises(AlreadyFriendsError):
+            Friendship.objects.add_friend(self.friend, self.profile)
+
+    def test_declined_request_is_replaced(self):
+        Friendship.objects.add_friend(self.profile, self.friend)
+        Friendship.objects.reject(self.profile, self.friend)
+        Friendship.objects.add_friend(self.friend, self.profile)
+
+        friendship = Friendship.objects.get()
+        self.assertEqual((friendship.user_one_id, friendship.user_two_id, friendship.status),
+                         (self.friend, self.profile, Friendship.Status.PENDING))
+        self.assertEqual(FriendEdge.objects.filter(status=Friendship.Status.PENDING).count(), 2)
+
+    def test_my_friends(self):
+        other = create_profile('other@example.com')
+        befriend(self.profile, self.friend)
+        befriend(other, self.profile)
+        befriend(self.profile, create_profile('pending@example.com'), status=Friendship.Status.PENDING)
+
+        response = client_for(self.profile).get('/friends/my_friends/')
+        self.assertEqual([edge['friend']['user'] for edge in response.json()['results']],
+                         [other.user.pk, self.friend.user.pk])
+
+    def test_my_friends_is_not_sent_again_until_it_changes(self):
+        befriend(self.profile, self.friend)
+        client = client_for(self.profile)
+        etag = client.get('/friends/my_friends/')['ETag']
+        response = client.get('/friends/my_friends/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, response['ETag']), (304, etag))
+
+        self.friend.first_name = 'Jim'
+        self.friend.save()
+        response = client.get('/friends/my_friends/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        etag = response['ETag']
+        Friendship.objects.remove_friend(self.profile, self.friend)
+        self.assertEqual(client.get('/friends/my_friends/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class FriendGraphTests(FriendTestCase):
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.snapshot_path = os.path.join(directory.name, 'friend_graph.bin')
+        settings = override_settings(FRIEND_GRAPH_SNAPSHOT_PATH=self.snapshot_path)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        patcher = mock.patch('friendship.graph._graph', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        # a chain of friends, the last one out of reach of the first
+        self.chain = [create_profile('someone{}@example.com'.format(index)) for index in range(5)]
+        for profile, friend in zip(self.chain, self.chain[1:]):
+            befriend(profile, friend)
+        self.loner = create_profile('loner@example.com')
+
+    def path(self, source, target):
+        return graph.connection_path(graph.get_graph(), source.pk, target.pk)
+
+    def test_connection_path(self):
+        first = self.chain[0]
+        # read from the cached friend ids until a snapshot is exported
+        for export in (False, True):
+            if export:
+                graph.export_snapshot()
+                self.assertIsInstance(graph.get_graph(), graph.SocialGraph)
+            self.assertEqual(self.path(first, first), [first.pk])
+            self.assertEqual(self.path(first, self.chain[3]), [profile.pk for profile in self.chain[:4]])
+            self.assertIsNone(self.path(first, self.chain[4]))
+            self.assertIsNone(self.path(first, self.loner))
+
+    def test_connection_path_endpoint(self):
+        client = client_for(self.chain[0])
+        response = client.get('/friends/{}/connection_path/'.format(self.chain[2].pk))
+        self.assertEqual(response.json()['degree'], 2)
+        self.assertEqual([profile['user'] for profile in response.json()['path']],
+                         [profile.user.pk for profile in self.chain[:3]])
+        self.assertEqual(client.get('/friends/{}/connection_path/'.format(self.chain[4].pk)).status_code, 404)
+        self.assertEqual(client.get('/friends/abc/connection_path/').status_code, 404)
+
+    def test_snapshot_with_later_changes_replayed(self):
+        self.assertEqual(graph.export_snapshot(), (5, 8))
+        snapshot = graph.GraphSnapshot(self.snapshot_path)
+        self.assertEqual(sorted(snapshot.friends_of(self.chain[1].pk)), [self.chain[0].pk, self.chain[2].pk])
+        self.assertEqual(list(snapshot.friends_of(self.loner.pk)), [])
+
+        befriend(self.loner, self.chain[4])
+        Friendship.objects.remove_friend(self.chain[1], self.chain[2])
+        social_graph = graph.SocialGraph(snapshot)
+        social_graph.refresh()
+        self.assertEqual(set(social_graph.friends_of(self.chain[4].pk)), {self.chain[3].pk, self.loner.pk})
+        self.assertEqual(set(social_graph.friends_of(self.chain[1].pk)), {self.chain[0].pk})
+        self.assertEqual(graph.connection_path(social_graph, self.loner.pk, self.chain[2].pk),
+                         [self.loner.pk, self.chain[4].pk, self.chain[3].pk, self.chain[2].pk])
+        self.assertIsNone(graph.connection_path(social_graph, self.chain[0].pk, self.chain[2].pk))
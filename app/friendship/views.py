@@ -1,21 +1,29 @@
-from django.db.models import Q
 from rest_framework import mixins, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.generics import get_object_or_404
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.viewsets import GenericViewSet
-from rest_framework_simplejwt.authentication import JWTAuthentication
 
+from accounts.authentication import CachedJWTAuthentication
 from accounts.models import User
+from app.conditional import ConditionalGetMixin
 from profiles.models import Profile
-from .models import Friendship
-from .serializers import FriendshipSerializer
+from . import graph
+from .exceptions import AlreadyExistsError, AlreadyFriendsError
+from .models import Friendship, FriendEdge, FriendSuggestion
+from .serializers import FriendshipSerializer, FriendEdgeSerializer, FriendSuggestionSerializer, \
+    SpecifUserSerializer
 
+MUTUAL_COUNTS_MAX_IDS = 300
 
-class FriendshipViewSet(GenericViewSet,
+
+class FriendshipViewSet(ConditionalGetMixin,
+                        GenericViewSet,
                         mixins.ListModelMixin,
                         mixins.RetrieveModelMixin):
-    authentication_classes = (JWTAuthentication,)
+    authentication_classes = (CachedJWTAuthentication,)
     permission_classes = (IsAuthenticated,)
     serializer_class = FriendshipSerializer
     queryset = Friendship.objects.all()
@@ -24,53 +32,125 @@ class FriendshipViewSet(GenericViewSet,
         if self.action == 'list':
             return self.queryset
         return self.queryset.filter(
-            Q(user_one_id=self.request.user.profile)
-            | Q(user_two_id=self.request.user.profile)
-        ).distinct().all()
+            pk__in=FriendEdge.objects.filter(profile=self.request.user.profile).values('friendship')
+        )
+
+    def get_my_friends_queryset(self):
+        return FriendEdge.objects.filter(profile=self.request.user.profile, status=Friendship.Status.ACCEPTED) \
+            .order_by('-id')
+
+    def get_my_friends_marker(self, request):
+        return self.page_marker(self.get_my_friends_queryset(), 'id', 'created_at', 'friend__user',
+                                'friend__first_name', 'friend__last_name', 'friend__picture', 'friend__thumbnails')
 
     @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
     def my_friends(self, request):
-        self.queryset = self.get_queryset().filter(status=2).order_by('-id')
-        return self.list(request=request)
+        queryset = self.get_my_friends_queryset().select_related('friend')
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = FriendEdgeSerializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+
+        serializer = FriendEdgeSerializer(queryset, many=True)
+        return Response(serializer.data)
 
     @action(detail=True, methods=['get'], permission_classes=[IsAuthenticated])
     def mutual_friends(self, request, pk=None):
-        user2 = Profile.objects.get(pk=pk)
-        friends_with_user1 = self.get_queryset().filter(status=2).values_list('user_two_id', flat=True)
-        friends_with_user1_ = self.get_queryset().filter(status=2).values_list('user_one_id', flat=True)
-        print(friends_with_user1)
-        friends_with_user2 = Friendship.objects.filter(Q(user_one_id=user2, status=2)
-                                                       | Q(user_two_id=user2, status=2)).distinct().all()
-        print(friends_with_user2)
-        mutual_friends_of_user1_user2 = friends_with_user2.filter(
-            Q(user_two_id__in=friends_with_user1) | Q(user_one_id__in=friends_with_user1)).distinct().all()  # | Q(user_two_id__in=friends_with_user1)
-        print(mutual_friends_of_user1_user2)
-        self.queryset = mutual_friends_of_user1_user2.order_by('-id')
-        page = self.paginate_queryset(self.queryset)
+        # unknown and malformed ids are a 404
+        profile = get_object_or_404(Profile, pk=pk)
+        queryset = Profile.objects.filter(
+            pk__in=FriendEdge.objects.friends_of(request.user.profile)
+        ).filter(
+            pk__in=FriendEdge.objects.friends_of(profile)
+        ).order_by('-id')
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = SpecifUserSerializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+
+        serializer = SpecifUserSerializer(queryset, many=True)
+        return Response(serializer.data)
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
+    def mutual_counts(self, request):
+        """
+            Takes a query_param (ids), a comma separated list of up to
+            MUTUAL_COUNTS_MAX_IDS profile ids, and returns how many friends
+            each of them has in common with the user
+        """
+
+        try:
+            profile_ids = {int(profile_id) for profile_id in request.query_params.get('ids', '').split(',')
+                           if profile_id.strip()}
+        except ValueError:
+            raise ValidationError({'ids': 'Expected a comma separated list of profile ids.'})
+        if len(profile_ids) > MUTUAL_COUNTS_MAX_IDS:
+            raise ValidationError({'ids': f'At most {MUTUAL_COUNTS_MAX_IDS} profile ids are allowed.'})
+
+        counts = FriendEdge.objects.mutual_counts(request.user.profile, profile_ids)
+        return Response({profile_id: counts.get(profile_id, 0) for profile_id in profile_ids},
+                        status=status.HTTP_200_OK)
+
+    @action(detail=True, methods=['get'], permission_classes=[IsAuthenticated])
+    def connection_path(self, request, pk=None):
+        """
+            Shortest chain of friends between the user and the profile pk,
+            up to graph.MAX_DEGREE_OF_SEPARATION friendships apart
+        """
+
+        try:
+            target = int(pk)
+        except ValueError:
+            raise NotFound()
+
+        path = graph.connection_path(graph.get_graph(), request.user.profile.pk, target)
+        if path is None:
+            raise NotFound(f'No connection within {graph.MAX_DEGREE_OF_SEPARATION} degrees.')
+
+        profiles = Profile.objects.in_bulk(path)
+        serializer = SpecifUserSerializer([profiles[profile_id] for profile_id in path if profile_id in profiles],
+                                          many=True)
+        return Response({'degree': len(path) - 1, 'path': serializer.data}, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
+    def suggestions(self, request):
+        """
+            People the user may know, best match first. Profiles requested
+            or befriended since the suggestions were computed are left out.
+        """
+
+        profile = request.user.profile
+        queryset = FriendSuggestion.objects.filter(profile=profile) \
+            .exclude(suggested__in=FriendEdge.objects.connected_to(profile)) \
+            .select_related('suggested').order_by('rank')
+        page = self.paginate_queryset(queryset)
         if page is not None:
-            serializer = self.get_serializer(page, many=True)
+            serializer = FriendSuggestionSerializer(page, many=True)
             return self.get_paginated_response(serializer.data)
 
-        serializer = self.get_serializer(self.queryset, many=True)
+        serializer = FriendSuggestionSerializer(queryset, many=True)
         return Response(serializer.data)
 
     @action(detail=True, methods=['get'], permission_classes=[IsAuthenticated])
     def add_friend(self, request, pk=None):
-        Friendship.objects.add_friend(from_user=request.user.profile,
-                                      to_user=User.objects.get(pk=pk).profile)
+        try:
+            Friendship.objects.add_friend(from_user=request.user.profile,
+                                          to_user=User.objects.get(pk=pk).profile)
+        except (AlreadyExistsError, AlreadyFriendsError) as error:
+            return Response(str(error), status=status.HTTP_409_CONFLICT)
         return Response("Friendship request has been sent", status=status.HTTP_201_CREATED)
 
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
     def accept_request(self, request, pk=None):
-        Friendship.objects.accept(user_one_id=request.user.profile, user_two_id=User.objects.get(pk=pk).profile)
+        Friendship.objects.accept(user1=User.objects.get(pk=pk).profile, user2=request.user.profile)
         return Response("Friendship request has been accepted", status=status.HTTP_200_OK)
 
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
     def reject_request(self, request, pk=None):
-        Friendship.objects.reject(user_one_id=request.user.profile, user_two_id=User.objects.get(pk=pk).profile)
+        Friendship.objects.reject(user1=User.objects.get(pk=pk).profile, user2=request.user.profile)
         return Response("Friendship request has been rejected", status=status.HTTP_200_OK)
 
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
     def delete_friend(self, request, pk=None):
-        Friendship.objects.remove_friend(user_one_id=request.user.profile, user_two_id=User.objects.get(pk=pk).profile)
+        Friendship.objects.remove_friend(from_user=request.user.profile, to_user=User.objects.get(pk=pk).profile)
         return Response("Friend has been deleted", status=status.HTTP_204_NO_CONTENT)
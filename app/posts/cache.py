@@ -0,0 +1,92 @@
+"""
+Cached post_detail payloads.
+
+The part of the post_detail response that is the same for every viewer
+is cached under a versioned key per post, together with the owner and
+the flag the permission check needs. Edits, comments, flushed likes,
+counter repairs, renames of the owner and deletion bump the version,
+which orphans the cached copy; orphans simply expire.
+
+Whether a profile likes a post in the Like table only changes when the
+like buffer is flushed, which bumps the version too, so that is cached
+per viewer under the same version. The views layer the viewer specific
+parts on top: the permission check, the buffered like changes and
+liked_by_me.
+"""
+
+import time
+
+from django.core.cache import cache
+
+from .models import Like, Post
+from .serializers import PostDetailSerializer
+
+POST_DETAIL_TIMEOUT = 60 * 60
+
+
+def _version_key(post_id):
+    return 'posts:version:{}'.format(post_id)
+
+
+def _detail_key(post_id, version):
+    return 'posts:detail:{}:{}'.format(post_id, version)
+
+
+def _liked_key(post_id, version, profile_id):
+    return 'posts:liked:{}:{}:{}'.format(post_id, version, profile_id)
+
+
+def _new_version():
+    # time based, see friendship.cache
+    return int(time.time() * 1000)
+
+
+def get_version(post_id):
+    key = _version_key(post_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _new_version(), None)
+        version = cache.get(key)
+    return version
+
+
+def get_post_detail(post_id):
+    """
+        (version, payload) of a post, the payload being a dict with the
+        owner id, the flag and the serialized post, or None when there is
+        no such post
+    """
+
+    version = get_version(post_id)
+    key = _detail_key(post_id, version)
+    payload = cache.get(key)
+    if payload is None:
+        post = Post.objects.select_related('owner').filter(pk=post_id).first()
+        if post is None:
+            return version, None
+        payload = {'owner_id': post.owner_id, 'flag': post.flag, 'data': dict(PostDetailSerializer(post).data)}
+        cache.set(key, payload, POST_DETAIL_TIMEOUT)
+    return version, payload
+
+
+def liked_in_table(post_id, version, profile_id):
+    """
+        Whether the Like table has the profile liking the post, cached for
+        the given version of the post
+    """
+
+    key = _liked_key(post_id, version, profile_id)
+    liked = cache.get(key)
+    if liked is None:
+        liked = Like.objects.filter(post_id=post_id, owner_id=profile_id).exists()
+        cache.set(key, liked, POST_DETAIL_TIMEOUT)
+    return liked
+
+
+def invalidate_post(*post_ids):
+    for post_id in post_ids:
+        key = _version_key(post_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, _new_version(), None)
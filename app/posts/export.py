@@ -0,0 +1,118 @@
+"""
+NDJSON export of a profile's posts, comments and likes.
+
+Every line is one JSON object with a "type" of profile, post, comment or
+like. The rows are read with values() querysets iterated in chunks of
+EXPORT_CHUNK_SIZE, encoded line by line and grouped into blocks of about
+BLOCK_SIZE bytes, optionally gzip compressed on the fly, so exporting
+keeps a constant amount of memory whatever the size of the account.
+
+The export view streams the lines in the response, the
+export_profile_history task writes them to a file under EXPORT_ROOT for
+accounts too large to download in one request. queue_export keeps one
+such task per profile queued or running at a time.
+"""
+
+import json
+import os
+import zlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Comment, Like, Post
+
+EXPORT_CHUNK_SIZE = 2000
+BLOCK_SIZE = 64 * 1024
+# longest time an export is expected to take, a queued export whose
+# worker died is retried after that
+EXPORT_QUEUED_TIMEOUT = 30 * 60
+
+
+def export_root():
+    return getattr(settings, 'EXPORT_ROOT', os.path.join(settings.BASE_DIR, 'exports'))
+
+
+def export_path(profile_id):
+    return os.path.join(export_root(), '{}.ndjson.gz'.format(profile_id))
+
+
+def export_queued_key(profile_id):
+    return 'posts:export:queued:{}'.format(profile_id)
+
+
+def queue_export(profile_id):
+    """
+        Queues the export_profile_history task of the profile, unless one is
+        queued or running. Returns whether it did.
+    """
+
+    from .tasks import export_profile_history
+
+    if not cache.add(export_queued_key(profile_id), True, EXPORT_QUEUED_TIMEOUT):
+        return False
+    export_profile_history.delay(profile_id)
+    return True
+
+
+def export_records(profile):
+    yield {'type': 'profile', 'id': profile.pk, 'first_name': profile.first_name, 'last_name': profile.last_name}
+    querysets = (
+        ('post', Post.objects.filter(owner=profile)
+         .values('id', 'text', 'flag', 'like_count', 'comment_count', 'created_at')),
+        ('comment', Comment.objects.filter(owner=profile).values('id', 'post_id', 'text', 'created_at')),
+        ('like', Like.objects.filter(owner=profile).values('id', 'post_id', 'created_at')),
+    )
+    for record_type, queryset in querysets:
+        for row in queryset.order_by('id').iterator(chunk_size=EXPORT_CHUNK_SIZE):
+            row['type'] = record_type
+            yield row
+
+
+def export_blocks(profile):
+    """
+        The NDJSON export of the profile, as blocks of about BLOCK_SIZE bytes
+    """
+
+    block = []
+    size = 0
+    for record in export_records(profile):
+        line = json.dumps(record, cls=DjangoJSONEncoder).encode() + b'\n'
+        block.append(line)
+        size += len(line)
+        if size >= BLOCK_SIZE:
+            yield b''.join(block)
+            block, size = [], 0
+    if block:
+        yield b''.join(block)
+
+
+def gzip_blocks(blocks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for block in blocks:
+        compressed = compressor.compress(block)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def write_export(profile, path=None):
+    """
+        Writes the gzip compressed export of the profile next to `path` and
+        moves it in place atomically, returns the path
+    """
+
+    path = path or export_path(profile.pk)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    try:
+        with open(tmp_path, 'wb') as export:
+            for block in gzip_blocks(export_blocks(profile)):
+                export.write(block)
+        os.replace(tmp_path, path)
+    finally:
+        # left behind when the export failed
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return path
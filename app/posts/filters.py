@@ -0,0 +1,48 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connections
+from django.db.models import F
+from rest_framework import filters
+
+from .models import Post
+
+SEARCH_CONFIG = 'english'
+
+
+class PostSearchFilter(filters.SearchFilter):
+    """
+        Full text search over Post.text ordered by relevance.
+
+        PostgreSQL matches against the GIN indexed search_vector column and
+        ranks with ts_rank, SQLite matches against the posts_post_fts FTS5
+        mirror table and ranks with bm25. Other querysets and databases fall
+        back to the plain SearchFilter behaviour.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        search_terms = self.get_search_terms(request)
+        if not search_terms or queryset.model is not Post:
+            return super().filter_queryset(request, queryset, view)
+
+        vendor = connections[queryset.db].vendor
+        if vendor == 'postgresql':
+            return self.filter_postgresql(queryset, search_terms)
+        if vendor == 'sqlite':
+            return self.filter_sqlite(queryset, search_terms)
+        return super().filter_queryset(request, queryset, view)
+
+    def filter_postgresql(self, queryset, search_terms):
+        query = SearchQuery(' '.join(search_terms), config=SEARCH_CONFIG)
+        return queryset.annotate(search_rank=SearchRank(F('search_vector'), query)) \
+            .filter(search_vector=query) \
+            .order_by('-search_rank', '-created_at')
+
+    def filter_sqlite(self, queryset, search_terms):
+        # quote every term so user input is never parsed as FTS5 query syntax
+        match = ' '.join('"{}"'.format(term.replace('"', '""')) for term in search_terms)
+        return queryset.extra(
+            tables=['posts_post_fts'],
+            where=['posts_post_fts.rowid = posts_post.id', 'posts_post_fts MATCH %s'],
+            params=[match],
+            select={'search_rank': 'posts_post_fts.rank'},
+            order_by=['search_rank', '-created_at'],
+        )
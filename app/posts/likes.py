@@ -0,0 +1,242 @@
+"""
+Write buffer for likes.
+
+Liking or unliking a post does not touch the Like table. The latest
+intent is kept in a store hash per post, keyed by profile id, holding 1
+for a like and -1 for an unlike, plus the net change of the post's like
+count under DELTA_FIELD. An intent is only written, with its delta, if
+the field still holds what the like state was read from, so a double tap
+counts once. Liking then unliking before a flush leaves an unlike the
+table has nothing to remove for, such pairs never reach the database.
+
+flush_likes moves the posts marked dirty to a processing set and reads
+their hashes, inserts the buffered likes with
+bulk_create(ignore_conflicts=True), deletes the buffered unlikes in one
+statement per batch and shifts the stored counters by what actually
+changed, then bumps the cached versions of the posts it wrote to. Only
+then does it remove the intents it wrote, those changed in the meantime
+stay for the next flush, and take the written change off the delta. A
+flush that fails leaves its posts in the processing set, the next one
+puts them back. Until then reads add the buffered changes to the stored
+like counts and to the viewer's own like state.
+
+Where posts_like is partitioned its (post, owner) uniqueness is not
+enforced by the database (see migration 0011), so on PostgreSQL a flush
+takes a transaction level advisory lock per post before it looks the
+existing likes up, and concurrent flushes of a post run one after the
+other.
+"""
+
+from django.db import connection, transaction
+
+from app.stores import get_store
+from .cache import get_version, invalidate_post, liked_in_table
+from .models import Like, Post
+from .partitions import not_before
+
+DIRTY_KEY = 'posts:likes:dirty'
+PROCESSING_KEY = 'posts:likes:processing'
+DELTA_FIELD = 'delta'
+LIKED = '1'
+UNLIKED = '-1'
+# profile ids per query when looking existing likes up
+LOOKUP_CHUNK_SIZE = 500
+# first key of the advisory locks taken per post by flush_likes
+FLUSH_LOCK_CLASS = 7301
+
+
+def pending_key(post_id):
+    return 'posts:likes:pending:{}'.format(post_id)
+
+
+def buffered_intent(post_id, profile_id):
+    """
+        True for a buffered like of the post by the profile, False for a
+        buffered unlike, None when nothing is buffered
+    """
+
+    intent = get_store().hget(pending_key(post_id), profile_id)
+    return None if intent is None else intent == LIKED
+
+
+def is_liked(post_id, profile_id, version=None):
+    """
+        Whether the profile likes the post, buffered intents included
+    """
+
+    intent = buffered_intent(post_id, profile_id)
+    if intent is not None:
+        return intent
+    return liked_in_table(post_id, get_version(post_id) if version is None else version, profile_id)
+
+
+def set_liked(post_id, profile_id, liked):
+    """
+        Buffers a like (or unlike) of the post by the profile, returns
+        whether it changes the profile's like state
+    """
+
+    store = get_store()
+    key, field = pending_key(post_id), str(profile_id)
+    pending = store.hget(key, field)
+    liked_now = pending == LIKED if pending is not None else \
+        liked_in_table(post_id, get_version(post_id), profile_id)
+    if liked_now == liked:
+        return False
+
+    # a concurrent intent of the profile written since the read wins
+    if not store.hsetif(key, field, LIKED if liked else UNLIKED, expected=pending,
+                        increments={DELTA_FIELD: 1 if liked else -1}):
+        return False
+    store.sadd(DIRTY_KEY, post_id)
+    return True
+
+
+def like_count_deltas(post_ids):
+    """
+        Buffered change of the like count of each post, as {post_id: delta}
+    """
+
+    post_ids = list(post_ids)
+    deltas = get_store().hget_many((pending_key(post_id) for post_id in post_ids), DELTA_FIELD)
+    return {post_id: int(deltas.get(pending_key(post_id), 0)) for post_id in post_ids}
+
+
+def merge_like_counts(posts):
+    """
+        Adds the buffered changes to the like_count of `posts`
+    """
+
+    deltas = like_count_deltas(post.pk for post in posts)
+    for post in posts:
+        post.like_count = max(post.like_count + deltas[post.pk], 0)
+    return posts
+
+
+def liked_post_ids(profile_id, post_ids, since=None):
+    """
+        The posts among `post_ids` liked by the profile, buffered likes and
+        unlikes included. `since`, the created_at of the oldest of the
+        posts, narrows the lookup to the likes that can be theirs.
+    """
+
+    post_ids = list(post_ids)
+    likes = Like.objects.filter(owner_id=profile_id, post_id__in=post_ids)
+    if since is not None:
+        likes = likes.filter(created_at__gte=not_before(since))
+    liked = set(likes.values_list('post_id', flat=True))
+    pending = get_store().hget_many((pending_key(post_id) for post_id in post_ids), profile_id)
+    for post_id in post_ids:
+        intent = pending.get(pending_key(post_id))
+        if intent == LIKED:
+            liked.add(post_id)
+        elif intent == UNLIKED:
+            liked.discard(post_id)
+    return liked
+
+
+def _existing_likes(post_id, created_at, profile_ids):
+    """
+        {profile_id: like_id} of the profiles among `profile_ids` that like
+        the post, created at `created_at`, in the database
+    """
+
+    profile_ids = list(profile_ids)
+    likes = Like.objects.filter(post_id=post_id, created_at__gte=not_before(created_at))
+    existing = {}
+    for start in range(0, len(profile_ids), LOOKUP_CHUNK_SIZE):
+        existing.update(likes.filter(owner_id__in=profile_ids[start:start + LOOKUP_CHUNK_SIZE])
+                        .values_list('owner_id', 'id'))
+    return existing
+
+
+def _lock_posts(post_ids):
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        for post_id in sorted(post_ids):
+            cursor.execute('SELECT pg_advisory_xact_lock(%s, %s)', [FLUSH_LOCK_CLASS, post_id])
+
+
+def _consume_intents(store, post_id, fields, change, profile_ids):
+    """
+        Removes the flushed intents of a post from its hash, the ones of
+        `profile_ids` with the `change` they made to the table and the
+        others as dropped
+    """
+
+    key = pending_key(post_id)
+    flushed = {field: intent for field, intent in fields.items() if int(field) in profile_ids}
+    store.hdelif(key, flushed, increments={DELTA_FIELD: -change})
+    for field, intent in fields.items():
+        if field not in flushed and store.hdelif(key, {field: intent}):
+            # the change the dropped intent most likely added to the delta,
+            # the delta goes once no intent is left either way
+            store.hdelif(key, {}, increments={DELTA_FIELD: -1 if intent == LIKED else 1})
+
+
+def flush_likes(batch_size=100):
+    """
+        Writes the buffered likes and unlikes of up to `batch_size` posts at
+        a time to Like, returns the number of likes added and removed.
+        Intents for posts or profiles deleted in the meantime are dropped.
+    """
+
+    from profiles.models import Profile
+
+    store = get_store()
+    # the posts of a flush that failed
+    while store.smove_many(PROCESSING_KEY, DIRTY_KEY, batch_size):
+        pass
+
+    added = removed = 0
+    while True:
+        post_ids = [int(post_id) for post_id in store.smove_many(DIRTY_KEY, PROCESSING_KEY, batch_size)]
+        if not post_ids:
+            return added, removed
+
+        pending = store.hgetall_many(pending_key(post_id) for post_id in post_ids)
+        intents, buffered = {}, {}
+        for post_id in post_ids:
+            buffered[post_id] = fields = pending.get(pending_key(post_id), {})
+            intents[post_id] = {int(profile_id): intent == LIKED for profile_id, intent in fields.items()
+                                if profile_id != DELTA_FIELD}
+
+        existing_posts = dict(Post.objects.filter(pk__in=intents).values_list('pk', 'created_at'))
+        existing_profiles = set(Profile.objects.filter(
+            pk__in={profile_id for profiles in intents.values() for profile_id in profiles}
+        ).values_list('pk', flat=True))
+
+        new_likes, stale_like_ids, changes, changed_posts = [], [], {}, []
+        with transaction.atomic():
+            _lock_posts(existing_posts)
+            for post_id, created_at in existing_posts.items():
+                profiles = {profile_id: liked for profile_id, liked in intents[post_id].items()
+                            if profile_id in existing_profiles}
+                existing = _existing_likes(post_id, created_at, profiles)
+                likes = [Like(post_id=post_id, owner_id=profile_id) for profile_id, liked in profiles.items()
+                         if liked and profile_id not in existing]
+                unlikes = [existing[profile_id] for profile_id, liked in profiles.items()
+                           if not liked and profile_id in existing]
+                new_likes.extend(likes)
+                stale_like_ids.extend(unlikes)
+                changes[post_id] = len(likes) - len(unlikes)
+                if likes or unlikes:
+                    changed_posts.append(post_id)
+
+            Like.objects.bulk_create(new_likes, batch_size=1000, ignore_conflicts=True)
+            Like.objects.filter(pk__in=stale_like_ids).delete()
+            for post_id, change in changes.items():
+                Post.objects.adjust_counters(post_id, likes=change)
+        invalidate_post(*changed_posts)
+
+        for post_id, fields in buffered.items():
+            if post_id not in existing_posts:
+                # nothing to keep for a deleted post
+                store.hdelif(pending_key(post_id), fields)
+                continue
+            intent_fields = {field: intent for field, intent in fields.items() if field != DELTA_FIELD}
+            _consume_intents(store, post_id, intent_fields, changes[post_id], existing_profiles)
+        store.srem(PROCESSING_KEY, *post_ids)
+        added += len(new_likes)
+        removed += len(stale_like_ids)
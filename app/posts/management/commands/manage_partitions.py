@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from posts import partitions
+
+
+class Command(BaseCommand):
+    help = 'Creates the monthly partitions of the post tables ahead of time and detaches the old ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ahead', type=int, default=partitions.PARTITIONS_AHEAD,
+                            help='Number of months to create partitions for after the current one')
+        parser.add_argument('--detach-older-than', type=int, default=None, metavar='MONTHS',
+                            help='Detach the partitions of the months before this many months ago')
+        parser.add_argument('--archive', action='store_true',
+                            help='Move the detached partitions to the {} schema'.format(partitions.ARCHIVE_SCHEMA))
+
+    def handle(self, *args, **options):
+        if options['ahead'] < 0 or (options['detach_older_than'] or 0) < 0:
+            raise CommandError('--ahead and --detach-older-than can not be negative')
+        if not partitions.partitioned_tables():
+            self.stdout.write('The post tables are not partitioned, nothing to do')
+            return
+
+        created = partitions.ensure_partitions(ahead=options['ahead'])
+        self.stdout.write(self.style.SUCCESS('Created {} partitions'.format(len(created))))
+        if options['detach_older_than'] is not None:
+            before = partitions.add_months(partitions.month_start(timezone.now()), -options['detach_older_than'])
+            detached = partitions.detach_partitions(before, archive=options['archive'])
+            self.stdout.write(self.style.SUCCESS('Detached {} partitions from before {:%Y-%m}'.format(
+                len(detached), before)))
@@ -0,0 +1,59 @@
+import django.contrib.postgres.search
+from django.db import migrations
+
+POSTGRESQL_FORWARDS = [
+    "CREATE INDEX posts_post_search_vector_idx ON posts_post USING gin (search_vector)",
+    "CREATE TRIGGER posts_post_search_vector_update BEFORE INSERT OR UPDATE OF text ON posts_post "
+    "FOR EACH ROW EXECUTE PROCEDURE tsvector_update_trigger(search_vector, 'pg_catalog.english', text)",
+    "UPDATE posts_post SET search_vector = to_tsvector('pg_catalog.english', text)",
+]
+
+POSTGRESQL_BACKWARDS = [
+    "DROP TRIGGER IF EXISTS posts_post_search_vector_update ON posts_post",
+    "DROP INDEX IF EXISTS posts_post_search_vector_idx",
+]
+
+SQLITE_FORWARDS = [
+    "CREATE VIRTUAL TABLE posts_post_fts USING fts5(text, content='posts_post', content_rowid='id')",
+    "CREATE TRIGGER posts_post_fts_insert AFTER INSERT ON posts_post BEGIN "
+    "INSERT INTO posts_post_fts(rowid, text) VALUES (new.id, new.text); END",
+    "CREATE TRIGGER posts_post_fts_delete AFTER DELETE ON posts_post BEGIN "
+    "INSERT INTO posts_post_fts(posts_post_fts, rowid, text) VALUES ('delete', old.id, old.text); END",
+    "CREATE TRIGGER posts_post_fts_update AFTER UPDATE OF text ON posts_post BEGIN "
+    "INSERT INTO posts_post_fts(posts_post_fts, rowid, text) VALUES ('delete', old.id, old.text); "
+    "INSERT INTO posts_post_fts(rowid, text) VALUES (new.id, new.text); END",
+    "INSERT INTO posts_post_fts(posts_post_fts) VALUES ('rebuild')",
+]
+
+SQLITE_BACKWARDS = [
+    "DROP TRIGGER IF EXISTS posts_post_fts_insert",
+    "DROP TRIGGER IF EXISTS posts_post_fts_delete",
+    "DROP TRIGGER IF EXISTS posts_post_fts_update",
+    "DROP TABLE IF EXISTS posts_post_fts",
+]
+
+
+def run_for_vendor(statements):
+    def run(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0008_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(
+            run_for_vendor({'postgresql': POSTGRESQL_FORWARDS, 'sqlite': SQLITE_FORWARDS}),
+            run_for_vendor({'postgresql': POSTGRESQL_BACKWARDS, 'sqlite': SQLITE_BACKWARDS}),
+        ),
+    ]
@@ -0,0 +1,35 @@
+from django.db import migrations, models
+from django.db.models import Count, Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def delete_duplicate_likes(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    Like = apps.get_model('posts', 'Like')
+
+    duplicates = Like.objects.values('post', 'owner').order_by() \
+        .annotate(first=Min('id'), total=Count('id')).filter(total__gt=1)
+    post_ids = set()
+    for duplicate in list(duplicates):
+        Like.objects.filter(post=duplicate['post'], owner=duplicate['owner']) \
+            .exclude(id=duplicate['first']).delete()
+        post_ids.add(duplicate['post'])
+
+    likes = Like.objects.filter(post=OuterRef('pk')).order_by() \
+        .values('post').annotate(total=Count('pk')).values('total')
+    Post.objects.filter(pk__in=post_ids).update(like_count=Coalesce(Subquery(likes), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0009_post_search'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_likes, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='like',
+            constraint=models.UniqueConstraint(fields=('post', 'owner'), name='posts_like_post_owner_uniq'),
+        ),
+    ]
@@ -0,0 +1,141 @@
+"""
+Partitions posts_post, posts_comment and posts_like by month of
+created_at on PostgreSQL, see posts.partitions.
+
+A partitioned table can not be referenced by a foreign key, so first, on
+every database, posts_like and posts_comment lose their foreign key
+constraints to posts_post; the ORM still emulates the cascades.
+
+Then on PostgreSQL every table is renamed, recreated under its name as a
+partitioned table with the same columns, defaults, checks and foreign
+keys, given one partition per month from its oldest row to
+PARTITIONS_AHEAD months from now plus a default partition, filled from
+the old table and indexed like it was. What a partitioned table can not
+have changes in the database only, the models keep declaring it for the
+databases that are left alone:
+
+- the primary keys are (id, created_at); ids still come from the same
+  sequences and stay unique
+- the (post, owner) uniqueness of posts_like can only hold within one
+  partition, so posts_like_post_owner_uniq becomes a plain index of the
+  same name and flush_likes serializes the writes of a post with an
+  advisory lock
+
+The whole migration runs in one transaction and copies every row, plan
+for downtime on large tables.
+"""
+
+from datetime import date
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.migrations.exceptions import IrreversibleError
+from django.utils import timezone
+
+TABLES = ('posts_post', 'posts_comment', 'posts_like')
+PARTITIONS_AHEAD = 3
+UNIQUE_TO_INDEX = {
+    'posts_like_post_owner_uniq': 'CREATE INDEX posts_like_post_owner_uniq ON posts_like (post_id, owner_id)',
+}
+SEARCH_VECTOR_TRIGGER = (
+    "CREATE TRIGGER posts_post_search_vector_update BEFORE INSERT OR UPDATE OF text ON {} "
+    "FOR EACH ROW EXECUTE PROCEDURE tsvector_update_trigger(search_vector, 'pg_catalog.english', text)"
+)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def bound(month):
+    return '{:%Y-%m-%d} 00:00:00+00'.format(month)
+
+
+def partition_table(cursor, table):
+    old = table + '_unpartitioned'
+    cursor.execute('ALTER TABLE {} RENAME TO {}'.format(table, old))
+
+    cursor.execute(
+        "SELECT indexname, indexdef FROM pg_indexes WHERE schemaname = current_schema() AND tablename = %s", [old]
+    )
+    indexes = cursor.fetchall()
+    cursor.execute(
+        "SELECT conname, contype, pg_get_constraintdef(oid) FROM pg_constraint "
+        "WHERE conrelid = %s::regclass AND contype IN ('p', 'u', 'f')", [old]
+    )
+    constraints = cursor.fetchall()
+    constraint_names = {name for name, _, _ in constraints}
+
+    cursor.execute('CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) '
+                   'PARTITION BY RANGE (created_at)'.format(table, old))
+    cursor.execute("ALTER SEQUENCE {}_id_seq OWNED BY {}.id".format(table, table))
+
+    cursor.execute('SELECT min(created_at) FROM {}'.format(old))
+    oldest = cursor.fetchone()[0] or timezone.now()
+    month = date(oldest.year, oldest.month, 1)
+    now = timezone.now()
+    last = add_months(date(now.year, now.month, 1), PARTITIONS_AHEAD)
+    while month <= last:
+        partition = '{}_p{:%Y%m}'.format(table, month)
+        cursor.execute('CREATE TABLE {} PARTITION OF {} FOR VALUES FROM (%s) TO (%s)'.format(partition, table),
+                       [bound(month), bound(add_months(month, 1))])
+        if table == 'posts_post':
+            cursor.execute(SEARCH_VECTOR_TRIGGER.format(partition))
+        month = add_months(month, 1)
+    cursor.execute('CREATE TABLE {0}_default PARTITION OF {0} DEFAULT'.format(table))
+    if table == 'posts_post':
+        cursor.execute(SEARCH_VECTOR_TRIGGER.format(table + '_default'))
+
+    cursor.execute('INSERT INTO {} SELECT * FROM {}'.format(table, old))
+    cursor.execute('DROP TABLE {}'.format(old))
+
+    # the keys and indexes take the names the old table had
+    cursor.execute('ALTER TABLE {} ADD PRIMARY KEY (id, created_at)'.format(table))
+    for name, contype, definition in constraints:
+        if contype == 'f':
+            cursor.execute('ALTER TABLE {} ADD CONSTRAINT {} {}'.format(table, name, definition))
+        elif name in UNIQUE_TO_INDEX:
+            cursor.execute(UNIQUE_TO_INDEX[name])
+    for name, definition in indexes:
+        # the primary and unique keys are indexes too
+        if name in constraint_names:
+            continue
+        cursor.execute(definition.replace(' ON {} '.format(old), ' ON {} '.format(table))
+                       .replace(' ON public.{} '.format(old), ' ON {} '.format(table)))
+
+
+def partition_tables(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for table in TABLES:
+            partition_table(cursor, table)
+
+
+def refuse_to_unpartition(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        raise IrreversibleError('The post tables can not be turned back into plain tables')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0010_like_unique_owner'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='comment',
+            name='post',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE,
+                                    to='posts.Post'),
+        ),
+        migrations.AlterField(
+            model_name='like',
+            name='post',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE,
+                                    to='posts.Post'),
+        ),
+        migrations.RunPython(partition_tables, refuse_to_unpartition),
+    ]
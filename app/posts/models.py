@@ -1,7 +1,72 @@
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from friendship.models import FriendEdge
 from profiles.models import Profile
 
 
+class PostQuerySet(models.QuerySet):
+
+    def visible_to(self, profile):
+        """
+            Posts `profile` may read: public posts, its own posts and the
+            posts of its accepted friends, in a single statement. The
+            friends are a subquery on the friend edges, not a list of ids,
+            however many friends the profile has.
+        """
+
+        return self.filter(
+            Q(flag=Post.public) | Q(owner=profile) | Q(owner__in=FriendEdge.objects.friends_of(profile))
+        )
+
+
+class PostManager(models.Manager.from_queryset(PostQuerySet)):
+    """
+        Post manager
+    """
+
+    def adjust_counters(self, post_id, likes=0, comments=0):
+        """
+            Atomically shift the stored like/comment counters of a post
+        """
+
+        changes = {}
+        if likes:
+            changes['like_count'] = F('like_count') + likes
+        if comments:
+            changes['comment_count'] = F('comment_count') + comments
+        if changes:
+            self.filter(pk=post_id).update(**changes)
+
+    def with_actual_counts(self):
+        """
+            Annotates every post with its real like and comment counts
+        """
+
+        return self.annotate(
+            actual_likes=Coalesce(Subquery(_count_per_post(Like)), 0),
+            actual_comments=Coalesce(Subquery(_count_per_post(Comment)), 0),
+        )
+
+    def recount(self, post_ids):
+        """
+            Rewrite the stored counters of the given posts from the like and
+            comment tables in a single UPDATE
+        """
+
+        return self.filter(pk__in=post_ids).update(
+            like_count=Coalesce(Subquery(_count_per_post(Like)), 0),
+            comment_count=Coalesce(Subquery(_count_per_post(Comment)), 0),
+        )
+
+
+def _count_per_post(model):
+    return model.objects.filter(post=OuterRef('pk')).order_by() \
+        .values('post').annotate(total=Count('pk')).values('total')
+
+
 class Post(models.Model):
     public = 'public'
     private = 'private'
@@ -10,19 +75,22 @@ class Post(models.Model):
     owner = models.ForeignKey(Profile, on_delete=models.CASCADE)
     text = models.TextField()
     flag = models.CharField(max_length=10, choices=FLAG_CHOICES, null=False)
+    like_count = models.PositiveIntegerField(default=0)
+    comment_count = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
+    # maintained by a database trigger on PostgreSQL, see migration 0009
+    search_vector = SearchVectorField(null=True, editable=False)
 
-    @property
-    def fullname(self):
-        return self.owner.full_name
+    objects = PostManager()
 
-    @property
-    def num_likes(self):
-        return self.like_set.count()
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='posts_post_created_id_idx'),
+        ]
 
     @property
-    def num_comments(self):
-        return self.comment_set.count()
+    def fullname(self):
+        return self.owner.full_name
 
     def __str__(self):
         return str(self.owner.id)
@@ -30,9 +98,22 @@ class Post(models.Model):
 
 class Like(models.Model):
     owner = models.ForeignKey(Profile, on_delete=models.CASCADE)
-    post = models.ForeignKey(Post, on_delete=models.CASCADE)
+    # no constraint, a partitioned posts_post can not be referenced (see
+    # migration 0011), the ORM still cascades
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, db_constraint=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['post', 'created_at', 'id'], name='posts_like_post_created_idx'),
+        ]
+        # lets the buffered likes be flushed with bulk_create(ignore_conflicts=True).
+        # Migration 0011 makes it a plain index where it partitions posts_like,
+        # a partitioned table can not enforce it
+        constraints = [
+            models.UniqueConstraint(fields=['post', 'owner'], name='posts_like_post_owner_uniq'),
+        ]
+
     @property
     def fullname(self):
         return self.owner.full_name
@@ -43,10 +124,16 @@ class Like(models.Model):
 
 class Comment(models.Model):
     owner = models.ForeignKey(Profile, on_delete=models.CASCADE)
-    post = models.ForeignKey(Post, on_delete=models.CASCADE)
+    # no constraint, see Like.post
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, db_constraint=False)
     text = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['post', 'created_at', 'id'], name='posts_comment_post_created_idx'),
+        ]
+
     @property
     def fullname(self):
         return self.owner.full_name
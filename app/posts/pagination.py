@@ -0,0 +1,84 @@
+import base64
+import binascii
+from collections import OrderedDict
+
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+        Cursor pagination ordered by (created_at, id), newest first.
+
+        The cursor is an opaque token holding the (created_at, id) of the last
+        row of the previous page, so every page is an index range scan that
+        starts where the previous one stopped, without OFFSET or COUNT(*).
+        Requests carrying a `page` query_param are served by the page number
+        pagination instead, for clients that need totals or random access, and
+        so are search requests since relevance order has no stable keyset.
+    """
+
+    page_size = api_settings.PAGE_SIZE
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+    ordering = ('-created_at', '-id')
+
+    fallback_class = PageNumberPagination
+    fallback_query_params = ('page', api_settings.SEARCH_PARAM)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.fallback = None
+        if any(param in request.query_params for param in self.fallback_query_params):
+            if not queryset.ordered:
+                queryset = queryset.order_by(*self.ordering)
+            self.fallback = self.fallback_class()
+            return self.fallback.paginate_queryset(queryset, request, view=view)
+
+        self.request = request
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request)
+        if position is not None:
+            created_at, pk = position
+            queryset = queryset.filter(created_at__lte=created_at).exclude(created_at=created_at, pk__gte=pk)
+
+        results = list(queryset[:self.page_size + 1])
+        self.has_next = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        return self.page
+
+    def get_paginated_response(self, data):
+        if self.fallback is not None:
+            return self.fallback.get_paginated_response(data)
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(last.created_at, last.pk))
+
+    def encode_cursor(self, created_at, pk):
+        token = '{}|{}'.format(created_at.isoformat(), pk)
+        return base64.urlsafe_b64encode(token.encode('ascii')).decode('ascii')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            created_at, pk = base64.urlsafe_b64decode(encoded.encode('ascii')).decode('ascii').split('|')
+            created_at = parse_datetime(created_at)
+            pk = int(pk)
+        except (TypeError, ValueError, UnicodeError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+        if created_at is None:
+            raise NotFound(self.invalid_cursor_message)
+        return created_at, pk
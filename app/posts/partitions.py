@@ -0,0 +1,162 @@
+"""
+Monthly range partitions of the post tables on PostgreSQL.
+
+Migration 0011 partitions posts_post, posts_comment and posts_like by
+range of created_at, one partition per calendar month (UTC) named
+<table>_pYYYYMM, plus a <table>_default partition for rows outside of
+them. What partitioning costs the schema is spelled out in the
+migration. The manage_partitions command and the
+manage_post_partitions task create the partitions of the coming months
+ahead of time, and the command detaches, and optionally archives, the old
+ones. Read paths that know how old the rows they look for can filter
+on created_at with not_before, so the planner prunes the older
+partitions.
+
+A partition is created as a plain table, filled with the rows of its
+month that went to the default partition, if any, and then attached, so
+a month that was missed is still split out of the default partition.
+
+Other databases keep plain tables and every function here does nothing
+on them.
+"""
+
+import re
+from datetime import date, timedelta
+
+from django.db import connection as default_connection, transaction
+from django.utils import timezone
+
+PARTITIONED_TABLES = ('posts_post', 'posts_comment', 'posts_like')
+PARTITIONS_AHEAD = 3
+ARCHIVE_SCHEMA = 'posts_archive'
+PARTITION_NAME = re.compile(r'_p(\d{4})(\d{2})$')
+# tolerated clock difference between the servers stamping created_at
+CLOCK_SKEW = timedelta(hours=1)
+
+# row triggers can not be defined on a partitioned table before
+# PostgreSQL 13, every posts_post partition gets its own, see migration 0009
+SEARCH_VECTOR_TRIGGER = (
+    "CREATE TRIGGER posts_post_search_vector_update BEFORE INSERT OR UPDATE OF text ON {} "
+    "FOR EACH ROW EXECUTE PROCEDURE tsvector_update_trigger(search_vector, 'pg_catalog.english', text)"
+)
+
+
+def not_before(created_at):
+    """
+        Lower bound of the created_at of the rows referring to a row
+        created at `created_at`, such as the likes of a post. Filtering on
+        it lets the planner skip the partitions of the older months.
+    """
+
+    return created_at - CLOCK_SKEW
+
+
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table, month):
+    return '{}_p{:%Y%m}'.format(table, month)
+
+
+def _bound(month):
+    return '{:%Y-%m-%d} 00:00:00+00'.format(month)
+
+
+def partitioned_tables(connection=None):
+    """
+        The tables of PARTITIONED_TABLES that are partitioned
+    """
+
+    connection = connection or default_connection
+    if connection.vendor != 'postgresql':
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+            "WHERE c.relname = ANY(%s)", [list(PARTITIONED_TABLES)]
+        )
+        found = {name for name, in cursor.fetchall()}
+    return [table for table in PARTITIONED_TABLES if table in found]
+
+
+def monthly_partitions(cursor, table):
+    """
+        {month: partition name} of the monthly partitions attached to `table`
+    """
+
+    cursor.execute(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass(%s)", [table]
+    )
+    partitions = {}
+    for name, in cursor.fetchall():
+        match = PARTITION_NAME.search(name)
+        if match is not None:
+            partitions[date(int(match.group(1)), int(match.group(2)), 1)] = name
+    return partitions
+
+
+def create_partition(cursor, table, month):
+    name = partition_name(table, month)
+    quote = cursor.db.ops.quote_name
+    start, end = _bound(month), _bound(add_months(month, 1))
+    cursor.execute('CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'.format(
+        quote(name), quote(table)))
+    cursor.execute('INSERT INTO {} SELECT * FROM {} WHERE created_at >= %s AND created_at < %s'.format(
+        quote(name), quote(table + '_default')), [start, end])
+    cursor.execute('DELETE FROM {} WHERE created_at >= %s AND created_at < %s'.format(
+        quote(table + '_default')), [start, end])
+    cursor.execute('ALTER TABLE {} ATTACH PARTITION {} FOR VALUES FROM (%s) TO (%s)'.format(
+        quote(table), quote(name)), [start, end])
+    if table == 'posts_post':
+        cursor.execute(SEARCH_VECTOR_TRIGGER.format(quote(name)))
+    return name
+
+
+def ensure_partitions(ahead=PARTITIONS_AHEAD, today=None, connection=None):
+    """
+        Creates the missing partitions from the current month to `ahead`
+        months later, returns their names
+    """
+
+    connection = connection or default_connection
+    current = month_start(today or timezone.now())
+    created = []
+    for table in partitioned_tables(connection):
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            existing = monthly_partitions(cursor, table)
+            for offset in range(ahead + 1):
+                month = add_months(current, offset)
+                if month not in existing:
+                    created.append(create_partition(cursor, table, month))
+    return created
+
+
+def detach_partitions(before, archive=False, connection=None):
+    """
+        Detaches the monthly partitions of the months before `before`, and
+        moves them to the ARCHIVE_SCHEMA schema with `archive`. Returns
+        their names. Their rows disappear from the application.
+    """
+
+    connection = connection or default_connection
+    quote = connection.ops.quote_name
+    before = month_start(before)
+    detached = []
+    for table in partitioned_tables(connection):
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            for month, name in sorted(monthly_partitions(cursor, table).items()):
+                if month >= before:
+                    break
+                cursor.execute('ALTER TABLE {} DETACH PARTITION {}'.format(quote(table), quote(name)))
+                if archive:
+                    cursor.execute('CREATE SCHEMA IF NOT EXISTS {}'.format(quote(ARCHIVE_SCHEMA)))
+                    cursor.execute('ALTER TABLE {} SET SCHEMA {}'.format(quote(name), quote(ARCHIVE_SCHEMA)))
+                detached.append(name)
+    return detached
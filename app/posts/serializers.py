@@ -12,7 +12,7 @@ class BaseSerializer(serializers.ModelSerializer):
 
 
 class LikeSerializer(BaseSerializer):
-    class Meta:
+    class Meta(BaseSerializer.Meta):
         model = Like
 
 
@@ -22,17 +22,21 @@ class CommentSerializer(BaseSerializer):
         fields = BaseSerializer.Meta.fields + ('text',)
 
 
-class CreateCommentSerializer(serializers.ModelSerializer):
+class CreateCommentSerializer(serializers.Serializer):
     text = serializers.CharField(required=True)
 
 
 class PostDetailSerializer(serializers.ModelSerializer):
     owner = serializers.ReadOnlyField(source='owner.full_name')
-    likes = serializers.ReadOnlyField(source='num_likes')
-    comments = serializers.ReadOnlyField(source='num_comments')
+    likes = serializers.ReadOnlyField(source='like_count')
+    comments = serializers.ReadOnlyField(source='comment_count')
+    liked_by_me = serializers.SerializerMethodField()
 
     class Meta:
         model = Post
-        fields = ('id', 'owner', 'text', 'flag', 'likes', 'comments', 'created_at',)
+        fields = ('id', 'owner', 'text', 'flag', 'likes', 'comments', 'liked_by_me', 'created_at',)
         extra_kwargs = {'likes': {'read_only': True},
                         'comments': {'read_only': True}}
+
+    def get_liked_by_me(self, post):
+        return post.pk in self.context.get('liked_post_ids', ())
@@ -0,0 +1,42 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from friendship.models import Friendship
+from profiles.models import Profile
+from .cache import invalidate_post
+from .models import Post
+from .tasks import backfill_timelines, prune_timelines
+
+
+@receiver(post_delete, sender=Post)
+def invalidate_deleted_post(sender, instance, **kwargs):
+    post_id = instance.pk
+    transaction.on_commit(lambda: invalidate_post(post_id))
+
+
+@receiver(post_save, sender=Profile)
+def invalidate_renamed_owner_posts(sender, instance, update_fields=None, **kwargs):
+    # the cached payloads hold the owner's full name
+    if update_fields is not None and not {'first_name', 'last_name'} & set(update_fields):
+        return
+    profile_id = instance.pk
+    transaction.on_commit(lambda: invalidate_post(
+        *Post.objects.filter(owner_id=profile_id).values_list('pk', flat=True)
+    ))
+
+
+@receiver(post_save, sender=Friendship)
+def backfill_accepted_friendship(sender, instance, **kwargs):
+    if not instance.became(Friendship.Status.ACCEPTED):
+        return
+    profile_ids = (instance.user_one_id_id, instance.user_two_id_id)
+    transaction.on_commit(lambda: backfill_timelines.delay(*profile_ids))
+
+
+@receiver(post_delete, sender=Friendship)
+def prune_removed_friendship(sender, instance, **kwargs):
+    if instance.status != Friendship.Status.ACCEPTED:
+        return
+    profile_ids = (instance.user_one_id_id, instance.user_two_id_id)
+    transaction.on_commit(lambda: prune_timelines.delay(*profile_ids))
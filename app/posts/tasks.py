@@ -0,0 +1,113 @@
+from celery import shared_task
+from celery.schedules import crontab
+from celery.task import periodic_task
+from celery.utils.log import get_task_logger
+from django.core.cache import cache
+from django.db.models import F, Q
+
+from posts import export, likes, partitions, timeline
+from posts.cache import invalidate_post
+from posts.models import Post
+from profiles.models import Profile
+
+logger = get_task_logger(__name__)
+
+RECONCILE_BATCH_SIZE = 1000
+
+
+@periodic_task(run_every=(crontab(minute=0, hour='*/6')), name="reconcile_post_counters", ignore_result=True)
+def reconcile_post_counters(batch_size=RECONCILE_BATCH_SIZE):
+    """
+        Walks the posts table in primary key batches and rewrites the
+        like/comment counters of the posts that drifted from the real counts
+    """
+
+    last_id = 0
+    repaired = 0
+    while True:
+        batch = list(Post.objects.filter(pk__gt=last_id).order_by('pk')
+                     .values_list('pk', flat=True)[:batch_size])
+        if not batch:
+            break
+        last_id = batch[-1]
+
+        drifted = list(Post.objects.with_actual_counts().filter(pk__in=batch).exclude(
+            Q(like_count=F('actual_likes')) & Q(comment_count=F('actual_comments'))
+        ).values_list('pk', flat=True))
+        if drifted:
+            repaired += Post.objects.recount(drifted)
+            invalidate_post(*drifted)
+
+    logger.info("reconciled post counters, %s posts repaired", repaired)
+    return repaired
+
+
+@shared_task(name="fan_out_post", ignore_result=True)
+def fan_out_post(post_id):
+    """
+        Writes a freshly created post into its audience's home timelines
+    """
+
+    post = Post.objects.filter(pk=post_id).first()
+    if post is not None:
+        timeline.fan_out(post)
+
+
+@shared_task(name="backfill_timelines", ignore_result=True)
+def backfill_timelines(profile_one_id, profile_two_id):
+    """
+        Writes the recent posts of two new friends into each other's home
+        timelines
+    """
+
+    timeline.backfill(profile_one_id, profile_two_id)
+    timeline.backfill(profile_two_id, profile_one_id)
+
+
+@shared_task(name="prune_timelines", ignore_result=True)
+def prune_timelines(profile_one_id, profile_two_id):
+    """
+        Removes the posts of two former friends from each other's home
+        timelines
+    """
+
+    timeline.prune(profile_one_id, profile_two_id)
+    timeline.prune(profile_two_id, profile_one_id)
+
+
+@periodic_task(run_every=(crontab(minute='*')), name="flush_likes", ignore_result=True)
+def flush_likes(batch_size=100):
+    """
+        Writes the buffered likes and unlikes to Like
+    """
+
+    added, removed = likes.flush_likes(batch_size=batch_size)
+    logger.info("flushed likes, %s added and %s removed", added, removed)
+    return added, removed
+
+
+@shared_task(name="export_profile_history", ignore_result=True)
+def export_profile_history(profile_id):
+    """
+        Writes the NDJSON export of a profile to its file under EXPORT_ROOT
+    """
+
+    try:
+        profile = Profile.objects.filter(pk=profile_id).first()
+        if profile is not None:
+            path = export.write_export(profile)
+            logger.info("exported profile %s to %s", profile_id, path)
+    finally:
+        cache.delete(export.export_queued_key(profile_id))
+
+
+@periodic_task(run_every=(crontab(minute=15, hour=3)), name="manage_post_partitions", ignore_result=True)
+def manage_post_partitions():
+    """
+        Creates the monthly partitions of the post tables for the coming
+        months, nothing to do where they are not partitioned
+    """
+
+    created = partitions.ensure_partitions()
+    logger.info("created %s post table partitions", len(created))
+    return created
@@ -1,3 +1,692 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+import tempfile
+import unittest
+from datetime import datetime, time
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.settings import api_settings
+from rest_framework.test import APIClient
+
+from accounts.models import User
+from app.stores import LocMemStore
+from friendship.cache import LOCAL_CACHE_SIZE, LRUCache
+from friendship.models import Friendship
+from profiles.models import Profile
+from . import export, likes, partitions, timeline
+from .cache import get_version
+from .models import Comment, Like, Post
+from .tasks import export_profile_history, fan_out_post, flush_likes, prune_timelines, reconcile_post_counters
+
+
+def months_from_now(count):
+    return partitions.add_months(partitions.month_start(timezone.now()), count)
+
+
+def create_profile(email, first_name='John', last_name='Doe'):
+    user = User.objects.create_user(email=email, password='password')
+    return Profile.objects.create(user=user, first_name=first_name, last_name=last_name,
+                                  birthday=datetime(1990, 1, 1).date(), gender='M')
+
+
+def client_for(profile):
+    client = APIClient()
+    client.force_authenticate(profile.user)
+    return client
+
+
+class SharedStateMixin:
+    """
+        Runs every test with an empty cache, an empty local friend id cache
+        and a fresh in-process store
+    """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        for target, value in (('app.stores._store', LocMemStore()),
+                              ('friendship.cache._local', LRUCache(LOCAL_CACHE_SIZE))):
+            patcher = mock.patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+
+class CounterTests(SharedStateMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.owner = create_profile('owner@example.com')
+        self.post = Post.objects.create(owner=self.owner, text='text', flag=Post.public)
+
+    def test_comments_shift_the_counter(self):
+        client = client_for(create_profile('someone@example.com'))
+        self.assertEqual(client.post('/posts/{}/comment/'.format(self.post.pk), {'text': 'hi'}).status_code, 200)
+        self.assertEqual(client.post('/posts/{}/comment/'.format(self.post.pk), {'text': 'hi'}).status_code, 208)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 1)
+
+        comment = self.post.comment_set.get()
+        self.assertEqual(client.post('/posts/{}/uncomment/?comment_id={}'.format(self.post.pk, comment.pk))
+                         .status_code, 200)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 0)
+
+    def test_reconcile_repairs_drifted_counters(self):
+        Like.objects.create(owner=self.owner, post=self.post)
+        Post.objects.filter(pk=self.post.pk).update(comment_count=7)
+        in_sync = Post.objects.create(owner=self.owner, text='text', flag=Post.public)
+
+        self.assertEqual(reconcile_post_counters(batch_size=1), 1)
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.like_count, self.post.comment_count), (1, 0))
+        in_sync.refresh_from_db()
+        self.assertEqual((in_sync.like_count, in_sync.comment_count), (0, 0))
+        self.assertEqual(reconcile_post_counters(), 0)
+
+
+class KeysetPaginationTests(SharedStateMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.profile = create_profile('someone@example.com')
+        self.client = client_for(self.profile)
+
+    def walk(self, url):
+        """
+            The rows of every page from `url` on, following the next links
+        """
+
+        pages = []
+        while url:
+            data = self.client.get(url).json()
+            pages.append(data['results'])
+            url = data['next']
+        return pages
+
+    def test_cursor_pages_with_tied_timestamps(self):
+        posts = [Post.objects.create(owner=self.profile, text=str(index), flag=Post.public) for index in range(12)]
+        # rows created in the same instant are ordered by id
+        Post.objects.update(created_at=posts[0].created_at)
+
+        page_size = api_settings.PAGE_SIZE
+        pages = self.walk('/posts/list_posts/')
+        self.assertEqual([len(page) for page in pages], [page_size, page_size, 12 - 2 * page_size])
+        self.assertEqual([row['id'] for page in pages for row in page], [post.pk for post in reversed(posts)])
+
+    def test_page_number_fallback(self):
+        for index in range(7):
+            Post.objects.create(owner=self.profile, text=str(index), flag=Post.public)
+
+        data = self.client.get('/posts/list_posts/', {'page': 2}).json()
+        self.assertEqual((data['count'], len(data['results'])), (7, 7 - api_settings.PAGE_SIZE))
+        self.assertIsNone(data['next'])
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get('/posts/list_posts/', {'cursor': 'not a cursor'}).status_code, 404)
+
+    def test_likes_and_comments_pages(self):
+        post = Post.objects.create(owner=self.profile, text='text', flag=Post.public)
+        for index in range(7):
+            profile = create_profile('liker{}@example.com'.format(index))
+            Like.objects.create(owner=profile, post=post)
+            Comment.objects.create(owner=profile, post=post, text=str(index))
+
+        page_size = api_settings.PAGE_SIZE
+        for url in ('/posts/{}/post_likes_detail/', '/posts/{}/post_comments_detail/'):
+            pages = self.walk(url.format(post.pk))
+            self.assertEqual([len(page) for page in pages], [page_size, 7 - page_size])
+
+
+class PostSearchTests(SharedStateMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.profile = create_profile('someone@example.com')
+        self.client = client_for(self.profile)
+
+    def search(self, terms):
+        response = self.client.get('/posts/list_posts/', {'search': terms})
+        self.assertEqual(response.status_code, 200)
+        return sorted(post['text'] for post in response.json()['results'])
+
+    def test_search_matches_words(self):
+        Post.objects.create(owner=self.profile, text='hello world', flag=Post.public)
+        Post.objects.create(owner=self.profile, text='hello there', flag=Post.public)
+        Post.objects.create(owner=self.profile, text='nothing', flag=Post.public)
+
+        self.assertEqual(self.search('hello'), ['hello there', 'hello world'])
+        self.assertEqual(self.search('hello world'), ['hello world'])
+        self.assertEqual(self.search('goodbye'), [])
+
+    def test_search_follows_edits_and_deletes(self):
+        post = Post.objects.create(owner=self.profile, text='nothing', flag=Post.public)
+        post.text = 'world peace'
+        post.save()
+        self.assertEqual(self.search('nothing'), [])
+        self.assertEqual(self.search('peace'), ['world peace'])
+
+        post.delete()
+        self.assertEqual(self.search('peace'), [])
+
+    def test_search_terms_are_not_query_syntax(self):
+        Post.objects.create(owner=self.profile, text='hello world', flag=Post.public)
+        self.assertEqual(self.search('"AND ('), [])
+
+    def test_search_only_finds_visible_posts(self):
+        Post.objects.create(owner=create_profile('stranger@example.com'), text='hello', flag=Post.private)
+        self.assertEqual(self.search('hello'), [])
+
+
+class VisibilityTests(SharedStateMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.owner = create_profile('owner@example.com')
+        self.friend = create_profile('friend@example.com')
+        self.stranger = create_profile('stranger@example.com')
+        Friendship.objects.create(user_one_id=self.friend, user_two_id=self.owner,
+                                  status=Friendship.Status.ACCEPTED)
+        self.private = Post.objects.create(owner=self.owner, text='private', flag=Post.private)
+        self.public = Post.objects.create(owner=self.owner, text='public', flag=Post.public)
+        self.other = Post.objects.create(owner=self.stranger, text='other', flag=Post.private)
+
+    def test_visible_to(self):
+        self.assertEqual(set(Post.objects.visible_to(self.owner)), {self.private, self.public})
+        self.assertEqual(set(Post.objects.visible_to(self.friend)), {self.private, self.public})
+        self.assertEqual(set(Post.objects.visible_to(self.stranger)), {self.public, self.other})
+
+    def test_list_posts(self):
+        response = client_for(self.stranger).get('/posts/list_posts/')
+        self.assertEqual([post['text'] for post in response.json()['results']], ['other', 'public'])
+
+    def test_hidden_post_is_not_found(self):
+        client = client_for(self.stranger)
+        for action in ('post_detail', 'like', 'post_likes_detail', 'post_comments_detail'):
+            self.assertEqual(client.get('/posts/{}/{}/'.format(self.private.pk, action)).status_code, 404)
+        self.assertEqual(client.post('/posts/{}/comment/'.format(self.private.pk), {'text': 'hi'}).status_code,
+                         404)
+
+        client = client_for(self.friend)
+        for action in ('post_detail', 'post_likes_detail', 'post_comments_detail'):
+            self.assertEqual(client.get('/posts/{}/{}/'.format(self.private.pk, action)).status_code, 200)
+
+
+class ConditionalGetTests(SharedStateMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.profile = create_profile('someone@example.com')
+        self.client = client_for(self.profile)
+        self.post = Post.objects.create(owner=self.profile, text='text', flag=Post.public)
+
+    def etag(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, response.content, response['ETag']), (304, b'', etag))
+        return etag
+
+    def test_list_posts(self):
+        etag = self.etag('/posts/list_posts/')
+        self.assertEqual(self.client.get('/posts/list_posts/', HTTP_IF_NONE_MATCH='W/' + etag).status_code, 304)
+        self.assertEqual(self.client.get('/posts/list_posts/', HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+        self.assertNotEqual(self.etag('/posts/list_posts/?search=text'), etag)
+        self.assertNotEqual(client_for(create_profile('other@example.com')).get('/posts/list_posts/')['ETag'], etag)
+
+        liker = create_profile('liker@example.com')
+        changes = [
+            lambda: likes.set_liked(self.post.pk, liker.pk, True),
+            likes.flush_likes,
+            lambda: likes.set_liked(self.post.pk, self.profile.pk, True),
+            lambda: Post.objects.filter(pk=self.post.pk).update(text='edited'),
+            lambda: Post.objects.create(owner=self.profile, text='new', flag=Post.public),
+        ]
+        etags = [etag]
+        for change in changes:
+            change()
+            etags.append(self.etag('/posts/list_posts/'))
+        self.assertEqual(len(set(etags)), len(etags))
+
+    def test_post_comments_detail(self):
+        url = '/posts/{}/post_comments_detail/'.format(self.post.pk)
+        etag = self.etag(url)
+        self.client.post('/posts/{}/comment/'.format(self.post.pk), {'text': 'hi'})
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertNotEqual(self.etag(url), etag)
+
+    def test_actions_without_a_marker(self):
+        response = self.client.get('/posts/{}/post_likes_detail/'.format(self.post.pk))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
+
+
+class LikeBufferTests(SharedStateMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.owner = create_profile('owner@example.com')
+        self.likers = [create_profile('liker{}@example.com'.format(index)) for index in range(2)]
+        self.post = Post.objects.create(owner=self.owner, text='text', flag=Post.public)
+        # flushed by hand, as the beat would
+        self.set_eager(False)
+
+    def set_eager(self, eager):
+        # the CELERY_ namespaced settings win over the plain option names
+        conf = flush_likes.app.conf
+        self.addCleanup(conf.__setitem__, 'CELERY_TASK_ALWAYS_EAGER', conf.task_always_eager)
+        conf['CELERY_TASK_ALWAYS_EAGER'] = eager
+
+    def set_liked(self, profile, liked):
+        return client_for(profile).get('/posts/{}/{}/'.format(self.post.pk, 'like' if liked else 'unlike')) \
+            .status_code
+
+    def detail(self, profile):
+        data = client_for(profile).get('/posts/{}/post_detail/'.format(self.post.pk)).json()
+        return data['likes'], data['liked_by_me']
+
+    def stored_like_count(self):
+        self.post.refresh_from_db()
+        return self.post.like_count
+
+    def test_likes_are_buffered_until_flushed(self):
+        first, second = self.likers
+        self.assertEqual([self.set_liked(first, True), self.set_liked(first, True), self.set_liked(second, True)],
+                         [200, 208, 200])
+        self.assertFalse(Like.objects.exists())
+        self.assertEqual((self.detail(first), self.detail(self.owner)), ((2, True), (2, False)))
+
+        self.assertEqual(likes.flush_likes(), (2, 0))
+        self.assertEqual(set(self.post.like_set.values_list('owner', flat=True)), {first.pk, second.pk})
+        self.assertEqual(self.stored_like_count(), 2)
+        self.assertEqual((self.detail(first), self.detail(self.owner)), ((2, True), (2, False)))
+        self.assertEqual(likes.like_count_deltas([self.post.pk]), {self.post.pk: 0})
+
+        self.assertEqual([self.set_liked(first, False), self.set_liked(first, False)], [200, 208])
+        self.assertEqual(self.detail(first), (1, False))
+        self.assertEqual(likes.flush_likes(), (0, 1))
+        self.assertEqual(list(self.post.like_set.values_list('owner', flat=True)), [second.pk])
+        self.assertEqual(self.stored_like_count(), 1)
+        self.assertEqual(self.detail(first), (1, False))
+        self.assertEqual(self.set_liked(first, False), 208)
+
+    def test_like_then_unlike_never_reaches_the_table(self):
+        first, _ = self.likers
+        self.set_liked(first, True)
+        self.set_liked(first, False)
+        self.assertEqual(self.detail(first), (0, False))
+
+        self.assertEqual(likes.flush_likes(), (0, 0))
+        self.assertFalse(Like.objects.exists())
+        self.assertEqual(self.stored_like_count(), 0)
+        self.assertEqual(likes.like_count_deltas([self.post.pk]), {self.post.pk: 0})
+
+    def test_list_posts_merges_the_buffered_likes(self):
+        first, _ = self.likers
+        self.set_liked(first, True)
+        posts = client_for(first).get('/posts/list_posts/').json()['results']
+        self.assertEqual([(post['likes'], post['liked_by_me']) for post in posts], [(1, True)])
+
+    def test_intents_for_deleted_posts_and_profiles_are_dropped(self):
+        first, second = self.likers
+        other = Post.objects.create(owner=self.owner, text='other', flag=Post.public)
+        self.set_liked(first, True)
+        self.set_liked(second, True)
+        client_for(first).get('/posts/{}/like/'.format(other.pk))
+        second.delete()
+        other.delete()
+
+        self.assertEqual(likes.flush_likes(), (1, 0))
+        self.assertEqual(list(Like.objects.values_list('owner', flat=True)), [first.pk])
+        self.assertEqual(self.stored_like_count(), 1)
+        self.assertEqual(likes.like_count_deltas([self.post.pk, other.pk]), {self.post.pk: 0, other.pk: 0})
+        self.assertEqual(likes.flush_likes(), (0, 0))
+
+    def test_likes_are_flushed_right_away_when_tasks_are_eager(self):
+        self.set_eager(True)
+        first, _ = self.likers
+        self.assertEqual(self.set_liked(first, True), 200)
+        self.assertTrue(self.post.like_set.filter(owner=first).exists())
+        self.assertEqual(self.stored_like_count(), 1)
+        self.assertEqual(self.set_liked(first, False), 200)
+        self.assertFalse(Like.objects.exists())
+
+
+class PostDetailCacheTests(SharedStateMixin, TransactionTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.owner = create_profile('owner@example.com', first_name='Jane')
+        self.profile = create_profile('someone@example.com')
+        self.post = Post.objects.create(owner=self.owner, text='text', flag=Post.public)
+        self.client = client_for(self.profile)
+        self.url = '/posts/{}/post_detail/'.format(self.post.pk)
+
+    def detail(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        return data['owner'], data['text'], data['likes'], data['comments'], data['liked_by_me']
+
+    def test_detail_is_served_from_the_cache(self):
+        self.assertEqual(self.detail(), ('Jane Doe', 'text', 0, 0, False))
+        with self.assertNumQueries(0):
+            self.assertEqual(self.detail(), ('Jane Doe', 'text', 0, 0, False))
+
+    def test_comments_and_edits_refresh_the_detail(self):
+        self.detail()
+        self.client.post('/posts/{}/comment/'.format(self.post.pk), {'text': 'hi'})
+        self.assertEqual(self.detail(), ('Jane Doe', 'text', 0, 1, False))
+
+        response = client_for(self.owner).post('/posts/{}/edit_post/'.format(self.post.pk), {'text': 'edited'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.detail(), ('Jane Doe', 'edited', 0, 1, False))
+
+    def test_renaming_the_owner_refreshes_the_detail(self):
+        self.detail()
+        self.owner.first_name = 'Jim'
+        self.owner.save(update_fields=['first_name'])
+        self.assertEqual(self.detail(), ('Jim Doe', 'text', 0, 0, False))
+
+        # saves leaving the name alone keep the cached copy
+        version = get_version(self.post.pk)
+        self.owner.save(update_fields=['address'])
+        self.assertEqual(get_version(self.post.pk), version)
+
+    def test_flushed_likes_refresh_the_detail(self):
+        self.detail()
+        likes.set_liked(self.post.pk, self.profile.pk, True)
+        self.assertEqual(self.detail(), ('Jane Doe', 'text', 1, 0, True))
+        likes.flush_likes()
+        self.assertEqual(self.detail(), ('Jane Doe', 'text', 1, 0, True))
+        self.assertEqual(client_for(self.owner).get(self.url).json()['liked_by_me'], False)
+
+    def test_hidden_and_deleted_posts_are_not_found(self):
+        private = Post.objects.create(owner=self.owner, text='private', flag=Post.private)
+        url = '/posts/{}/post_detail/'.format(private.pk)
+        self.assertEqual(client_for(self.owner).get(url).status_code, 200)
+        # the cached copy is checked against the viewer too
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+        self.detail()
+        self.post.delete()
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        self.assertEqual(self.client.get('/posts/abc/post_detail/').status_code, 404)
+
+
+class ExportTests(SharedStateMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.export_root = directory.name
+        settings = override_settings(EXPORT_ROOT=self.export_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.profile = create_profile('someone@example.com')
+        self.client = client_for(self.profile)
+        other = create_profile('other@example.com')
+        self.posts = [Post.objects.create(owner=self.profile, text=str(index), flag=Post.public)
+                      for index in range(3)]
+        self.other_post = Post.objects.create(owner=other, text='other', flag=Post.public)
+        self.comment = Comment.objects.create(owner=self.profile, post=self.other_post, text='hi')
+        self.like = Like.objects.create(owner=self.profile, post=self.other_post)
+        Comment.objects.create(owner=other, post=self.posts[0], text='not mine')
+        Like.objects.create(owner=other, post=self.posts[0])
+
+    def records(self, content):
+        lines = content.decode().split('\n')
+        self.assertEqual(lines[-1], '')
+        return [json.loads(line) for line in lines[:-1]]
+
+    def test_export_lines(self):
+        response = self.client.get('/posts/export/')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(response['Content-Disposition'],
+                         'attachment; filename="export-{}.ndjson"'.format(self.profile.pk))
+        self.assertNotIn('Content-Encoding', response)
+
+        records = self.records(b''.join(response.streaming_content))
+        self.assertEqual([(record['type'], record['id']) for record in records],
+                         [('profile', self.profile.pk)] + [('post', post.pk) for post in self.posts] +
+                         [('comment', self.comment.pk), ('like', self.like.pk)])
+        self.assertEqual(records[0], {'type': 'profile', 'id': self.profile.pk,
+                                      'first_name': 'John', 'last_name': 'Doe'})
+        self.assertEqual({key: records[1][key] for key in ('text', 'flag', 'like_count', 'comment_count')},
+                         {'text': '0', 'flag': Post.public, 'like_count': 0, 'comment_count': 0})
+        self.assertEqual((records[4]['post_id'], records[4]['text']), (self.other_post.pk, 'hi'))
+        self.assertEqual(records[5]['post_id'], self.other_post.pk)
+
+    def test_gzip_export(self):
+        plain = b''.join(self.client.get('/posts/export/').streaming_content)
+        response = self.client.get('/posts/export/', HTTP_ACCEPT_ENCODING='br, gzip;q=0.8')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), plain)
+
+    def test_lines_are_grouped_into_blocks(self):
+        with mock.patch.object(export, 'BLOCK_SIZE', 100):
+            blocks = list(export.export_blocks(self.profile))
+        self.assertGreater(len(blocks), 1)
+        self.assertTrue(all(block.endswith(b'\n') for block in blocks))
+        self.assertEqual(b''.join(blocks), b''.join(export.export_blocks(self.profile)))
+
+    def test_export_file(self):
+        self.assertEqual(self.client.get('/posts/export_file/').status_code, 404)
+        with mock.patch.object(export_profile_history, 'delay') as delay:
+            for _ in range(2):
+                self.assertEqual(self.client.post('/posts/export/').status_code, 202)
+        delay.assert_called_once_with(self.profile.pk)
+
+        export_profile_history(self.profile.pk)
+        response = self.client.get('/posts/export_file/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Last-Modified', response)
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)),
+                         b''.join(export.export_blocks(self.profile)))
+        # the next one can be queued
+        with mock.patch.object(export_profile_history, 'delay') as delay:
+            self.client.post('/posts/export/')
+        delay.assert_called_once_with(self.profile.pk)
+
+    def test_failed_export_leaves_the_previous_file(self):
+        path = export.write_export(self.profile)
+        with open(path, 'rb') as previous:
+            content = previous.read()
+
+        gzip_blocks = export.gzip_blocks
+
+        def failing_blocks(blocks):
+            yield next(gzip_blocks(blocks))
+            raise OSError('disk full')
+
+        with mock.patch.object(export, 'gzip_blocks', failing_blocks), self.assertRaises(OSError):
+            export_profile_history(self.profile.pk)
+        self.assertEqual(os.listdir(self.export_root), [os.path.basename(path)])
+        with open(path, 'rb') as current:
+            self.assertEqual(current.read(), content)
+        self.assertIsNone(cache.get(export.export_queued_key(self.profile.pk)))
+
+
+class TimelineTests(SharedStateMixin, TransactionTestCase):
+    """
+        The timelines are written by tasks queued on commit, run eagerly here
+    """
+
+    def setUp(self):
+        super().setUp()
+        # the CELERY_ namespaced settings win over the plain option names
+        conf = fan_out_post.app.conf
+        self.addCleanup(conf.__setitem__, 'CELERY_TASK_ALWAYS_EAGER', conf.task_always_eager)
+        conf['CELERY_TASK_ALWAYS_EAGER'] = True
+
+        self.profile = create_profile('someone@example.com')
+        self.friend = create_profile('friend@example.com')
+        Friendship.objects.add_friend(self.profile, self.friend)
+        Friendship.objects.accept(self.profile, self.friend)
+
+    def create_post(self, profile, text, flag=Post.private):
+        response = client_for(profile).post('/posts/create_post/', {'text': text, 'flag': flag})
+        self.assertEqual(response.status_code, 201)
+        return Post.objects.get(pk=response.data['id'])
+
+    def feed(self, profile, page=1):
+        return client_for(profile).get('/posts/feed/', {'page': page}).json()
+
+    def feed_texts(self, profile, page=1):
+        return [post['text'] for post in self.feed(profile, page)['results']]
+
+    def test_feed_holds_own_and_friends_posts(self):
+        self.create_post(self.friend, 'first')
+        self.create_post(self.profile, 'second')
+        self.create_post(create_profile('stranger@example.com'), 'stranger', flag=Post.public)
+
+        self.assertEqual(self.feed_texts(self.profile), ['second', 'first'])
+        self.assertEqual(self.feed_texts(self.friend), ['second', 'first'])
+
+    def test_feed_pages(self):
+        page_size = api_settings.PAGE_SIZE
+        for index in range(page_size + 1):
+            self.create_post(self.friend, str(index))
+
+        first = self.feed(self.profile)
+        self.assertEqual([post['text'] for post in first['results']],
+                         [str(index) for index in range(page_size, 0, -1)])
+        self.assertIsNotNone(first['next'])
+        second = self.feed(self.profile, page=2)
+        self.assertEqual(([post['text'] for post in second['results']], second['next']), (['0'], None))
+
+    def test_accepting_a_friend_backfills_their_posts(self):
+        other = create_profile('other@example.com')
+        self.create_post(other, 'earlier')
+
+        Friendship.objects.add_friend(other, self.profile)
+        self.assertEqual(self.feed_texts(self.profile), [])
+        Friendship.objects.accept(other, self.profile)
+        self.assertEqual(self.feed_texts(self.profile), ['earlier'])
+
+    def test_removing_a_friend_prunes_their_posts(self):
+        self.create_post(self.friend, 'friend')
+        self.create_post(self.profile, 'own')
+
+        Friendship.objects.remove_friend(self.profile, self.friend)
+        self.assertEqual(self.feed_texts(self.profile), ['own'])
+        self.assertEqual(self.feed_texts(self.friend), ['friend'])
+        self.assertEqual(len(timeline.read_timeline(self.profile.pk, 0, 10)), 1)
+
+    def test_feed_hides_private_posts_of_a_former_friend_before_the_prune(self):
+        self.create_post(self.friend, 'private')
+        self.create_post(self.friend, 'public', flag=Post.public)
+
+        with mock.patch.object(prune_timelines, 'delay'):
+            Friendship.objects.remove_friend(self.profile, self.friend)
+        self.assertEqual(len(timeline.read_timeline(self.profile.pk, 0, 10)), 2)
+        self.assertEqual(self.feed_texts(self.profile), ['public'])
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'the post tables are only partitioned on PostgreSQL')
+class PartitionTests(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user(email='someone@example.com', password='password')
+        self.profile = Profile.objects.create(user=user, first_name='John', last_name='Doe',
+                                              birthday=datetime(1990, 1, 1).date(), gender='M')
+
+    def create_post(self, month, text='text'):
+        """
+            A post with a comment and a like, all created in the middle of
+            `month`
+        """
+
+        created_at = timezone.make_aware(datetime.combine(month.replace(day=15), time(12)), timezone.utc)
+        post = Post.objects.create(owner=self.profile, text=text, flag=Post.public)
+        comment = Comment.objects.create(owner=self.profile, post=post, text=text)
+        like = Like.objects.create(owner=self.profile, post=post)
+        for model, pk in ((Post, post.pk), (Comment, comment.pk), (Like, like.pk)):
+            model.objects.filter(pk=pk).update(created_at=created_at)
+        return post
+
+    def partitions_of(self, post):
+        """
+            The partitions holding the post, its comment and its like
+        """
+
+        found = []
+        with connection.cursor() as cursor:
+            for table, column in (('posts_post', 'id'), ('posts_comment', 'post_id'), ('posts_like', 'post_id')):
+                cursor.execute('SELECT tableoid::regclass::text FROM {} WHERE {} = %s'.format(table, column),
+                               [post.pk])
+                found.append(cursor.fetchone()[0])
+        return found
+
+    def test_tables_are_partitioned(self):
+        self.assertEqual(partitions.partitioned_tables(), list(partitions.PARTITIONED_TABLES))
+        post = self.create_post(months_from_now(0))
+        self.assertEqual(self.partitions_of(post), [
+            partitions.partition_name(table, months_from_now(0)) for table in partitions.PARTITIONED_TABLES
+        ])
+
+    def test_create_partition_moves_rows_out_of_the_default_partition(self):
+        month = months_from_now(-24)
+        post = self.create_post(month)
+        self.assertEqual(self.partitions_of(post), [table + '_default' for table in partitions.PARTITIONED_TABLES])
+
+        with connection.cursor() as cursor:
+            for table in partitions.PARTITIONED_TABLES:
+                self.assertEqual(partitions.create_partition(cursor, table, month),
+                                 partitions.partition_name(table, month))
+            self.assertIn(month, partitions.monthly_partitions(cursor, 'posts_post'))
+        self.assertEqual(self.partitions_of(post), [
+            partitions.partition_name(table, month) for table in partitions.PARTITIONED_TABLES
+        ])
+        self.assertEqual(list(Like.objects.filter(post=post, created_at__gte=partitions.not_before(
+            Post.objects.get(pk=post.pk).created_at)).values_list('owner', flat=True)), [self.profile.pk])
+
+        # the partition got the search vector trigger
+        Post.objects.filter(pk=post.pk).update(text='partitioned')
+        self.assertEqual(list(Post.objects.filter(search_vector='partitioned').values_list('pk', flat=True)),
+                         [post.pk])
+
+    def test_ensure_partitions(self):
+        later = months_from_now(partitions.PARTITIONS_AHEAD + 2)
+        post = self.create_post(later)
+
+        created = partitions.ensure_partitions(ahead=partitions.PARTITIONS_AHEAD + 2)
+        self.assertEqual(sorted(created), sorted(
+            partitions.partition_name(table, month) for table in partitions.PARTITIONED_TABLES
+            for month in (months_from_now(partitions.PARTITIONS_AHEAD + 1), later)
+        ))
+        self.assertEqual(self.partitions_of(post), [
+            partitions.partition_name(table, later) for table in partitions.PARTITIONED_TABLES
+        ])
+        self.assertEqual(partitions.ensure_partitions(ahead=partitions.PARTITIONS_AHEAD + 2), [])
+
+    def test_manage_partitions_command(self):
+        old_month = months_from_now(-13)
+        old_post = self.create_post(old_month)
+        with connection.cursor() as cursor:
+            partitions.create_partition(cursor, 'posts_post', old_month)
+        post = self.create_post(months_from_now(0))
+
+        out = StringIO()
+        call_command('manage_partitions', ahead=partitions.PARTITIONS_AHEAD + 1, detach_older_than=12,
+                     archive=True, stdout=out)
+        self.assertIn('Created 3 partitions', out.getvalue())
+        self.assertIn('Detached 1 partitions', out.getvalue())
+
+        # the detached month is gone from the application, not from the database
+        self.assertEqual(list(Post.objects.values_list('pk', flat=True)), [post.pk])
+        self.assertTrue(Comment.objects.filter(post=old_post).exists())
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT count(*) FROM {}.{}'.format(
+                partitions.ARCHIVE_SCHEMA, partitions.partition_name('posts_post', old_month)))
+            self.assertEqual(cursor.fetchone()[0], 1)
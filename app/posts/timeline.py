@@ -0,0 +1,75 @@
+"""
+Materialized home timelines.
+
+Every profile owns a capped sorted set of post ids scored by the post
+creation time. A new post is pushed to its owner's and to every friend's
+timeline when it is written, so reading a feed is one range read on the
+store followed by one multi-get of the posts. When a friendship is
+accepted the recent posts of each friend are backfilled into the other's
+timeline, when it is removed they are pruned from it. The feed still
+reads the posts through Post.objects.visible_to, so a post the reader
+may no longer see never shows before the prune.
+
+The timelines live in the shared store, which the web processes and the
+Celery worker running fan_out_post must share: with the in-process
+LocMemStore the worker writes into its own memory, see the development
+settings.
+"""
+
+from django.conf import settings
+
+from app.stores import get_store
+from friendship.cache import get_friend_ids
+from .models import Post
+
+TIMELINE_MAX_LENGTH = getattr(settings, 'TIMELINE_MAX_LENGTH', 800)
+
+
+def timeline_key(profile_id):
+    return 'timeline:{}'.format(profile_id)
+
+
+def fan_out(post):
+    """
+        Push `post` to the timelines of its owner and the owner's friends
+    """
+
+    profile_ids = get_friend_ids(post.owner_id) | {post.owner_id}
+    get_store().zadd_many(
+        [timeline_key(profile_id) for profile_id in profile_ids],
+        post.pk, post.created_at.timestamp(), max_length=TIMELINE_MAX_LENGTH,
+    )
+
+
+def backfill(profile_id, friend_id):
+    """
+        Push the most recent posts of `friend_id` to the timeline of
+        `profile_id`, once they became friends
+    """
+
+    posts = Post.objects.filter(owner_id=friend_id).order_by('-created_at') \
+        .values_list('pk', 'created_at')[:TIMELINE_MAX_LENGTH]
+    scores = {post_id: created_at.timestamp() for post_id, created_at in posts}
+    if scores:
+        get_store().zadd(timeline_key(profile_id), scores, max_length=TIMELINE_MAX_LENGTH)
+
+
+def prune(profile_id, friend_id):
+    """
+        Remove the posts of `friend_id` from the timeline of `profile_id`,
+        once they are no longer friends
+    """
+
+    store = get_store()
+    key = timeline_key(profile_id)
+    post_ids = [int(member) for member in store.zrevrange(key, 0, -1)]
+    store.zrem(key, *Post.objects.filter(pk__in=post_ids, owner_id=friend_id).values_list('pk', flat=True))
+
+
+def read_timeline(profile_id, offset, limit):
+    """
+        Post ids of a timeline slice, newest first
+    """
+
+    members = get_store().zrevrange(timeline_key(profile_id), offset, offset + limit - 1)
+    return [int(member) for member in members]
@@ -1,15 +1,32 @@
-from django.db.models import Q
-from rest_framework import mixins, filters, status, permissions
+import os
+import re
+
+from django.db import transaction
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils.http import http_date
+from rest_framework import mixins, status
 from rest_framework.decorators import action
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.exceptions import NotFound
+from rest_framework.generics import get_object_or_404
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
 from rest_framework.viewsets import GenericViewSet
-from rest_framework_simplejwt.authentication import JWTAuthentication
 
-from friendship.models import Friendship
-from .models import Post, Like, Comment
+from accounts.authentication import CachedJWTAuthentication
+from app.conditional import ConditionalGetMixin
+from friendship.cache import are_friends
+from . import export, likes, timeline
+from .cache import get_post_detail, invalidate_post
+from .filters import PostSearchFilter
+from .models import Post, Comment
+from .pagination import KeysetPagination
+from .partitions import not_before
 from .serializers import PostDetailSerializer, CreateCommentSerializer, LikeSerializer, CommentSerializer
+from .tasks import fan_out_post, flush_likes
+
+ACCEPTS_GZIP = re.compile(r'\bgzip\b')
 
 serializers = {
     'post_likes_detail': LikeSerializer,
@@ -17,47 +34,61 @@ serializers = {
 }
 
 
-class PostPermission(permissions.BasePermission):
-
-    def are_friends(self, user1, user2, request):
-        result = Friendship.objects.filter(
-            Q(user_one_id=user1, user_two_id=user2, status=2)
-            | Q(user_one_id=user2, user_two_id=user1, status=2)) \
-            .distinct().all()
-        if result or user2.user == request.user:
-            return True
-        return False
-
-    def is_post_public(self, post):
-        if post.flag == 'public':
-            return True
-        return False
-
-    def has_object_permission(self, request, view, obj):
-        if self.is_post_public(obj):
-            return True
-        return self.are_friends(request.user.profile, obj.owner, request)
-
-
-class PostViewSet(GenericViewSet,
+class PostViewSet(ConditionalGetMixin,
+                  GenericViewSet,
                   mixins.ListModelMixin,
                   mixins.CreateModelMixin,
                   mixins.RetrieveModelMixin,
                   mixins.UpdateModelMixin,
                   mixins.DestroyModelMixin):
 
-    authentication_classes = (JWTAuthentication,)
+    authentication_classes = (CachedJWTAuthentication,)
     permission_classes = (IsAdminUser,)
     queryset = Post.objects.all()
-    filter_backends = [filters.SearchFilter]
+    filter_backends = [PostSearchFilter]
     search_fields = ['text']
-    pagination_classes = (PageNumberPagination,)
+    pagination_class = KeysetPagination
 
     def perform_create(self, serializer):
-        serializer.save(owner=self.request.user.profile)
+        post = serializer.save(owner=self.request.user.profile)
+        transaction.on_commit(lambda: fan_out_post.delay(post.pk))
+
+    def perform_update(self, serializer):
+        post = serializer.save()
+        transaction.on_commit(lambda: invalidate_post(post.pk))
 
     def get_serializer(self, *args, **kwargs):
-        return serializers.get(self.action, PostDetailSerializer)(*args, **kwargs)
+        serializer_class = serializers.get(self.action, PostDetailSerializer)
+        if serializer_class is PostDetailSerializer and args:
+            posts = list(args[0]) if kwargs.get('many') else [args[0]]
+            kwargs['context'] = self.get_post_context(posts)
+        return serializer_class(*args, **kwargs)
+
+    def get_post_context(self, posts):
+        """
+            Serializer context for `posts`, with their like counts and the
+            user's like state merged with the buffered likes
+        """
+
+        likes.merge_like_counts(posts)
+        context = self.get_serializer_context()
+        context['liked_post_ids'] = likes.liked_post_ids(self.request.user.profile.pk, [post.pk for post in posts],
+                                                         since=min((post.created_at for post in posts), default=None))
+        return context
+
+    def get_visible_posts(self):
+        return Post.objects.visible_to(self.request.user.profile)
+
+    def get_visible_post(self):
+        """
+            The post addressed by the url, 404 when the user may not read it
+        """
+
+        self.queryset = self.get_visible_posts()
+        # not filtered, ?search narrows the comments of the post instead
+        post = get_object_or_404(self.queryset, pk=self.kwargs['pk'])
+        self.check_object_permissions(self.request, post)
+        return post
 
     @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated, ])
     def create_post(self, request, *args, **kwargs):
@@ -65,73 +96,182 @@ class PostViewSet(GenericViewSet,
 
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated, ])
     def edit_post(self, request, pk=None, *args, **kwargs):
-        post = Post.objects.filter(pk=pk)
-        if post.owner == request.user.profile:
+        post = self.get_visible_post()
+        if post.owner_id == request.user.profile.pk:
             return self.partial_update(request, *args, **kwargs)
-        return Response("You do not have permission to perform this action.")
+        return Response("You do not have permission to perform this action.", status=status.HTTP_403_FORBIDDEN)
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated, ])
+    def feed(self, request):
+        """
+            Posts of the user and their friends, newest first, read from the
+            user's materialized timeline. Takes a query_param (page)
+        """
+
+        page_size = api_settings.PAGE_SIZE
+        try:
+            page = max(int(request.query_params.get('page', 1)), 1)
+        except ValueError:
+            page = 1
+
+        post_ids = timeline.read_timeline(request.user.profile.pk, (page - 1) * page_size, page_size + 1)
+        next_page = None
+        if len(post_ids) > page_size:
+            post_ids = post_ids[:page_size]
+            next_page = replace_query_param(request.build_absolute_uri(), 'page', page + 1)
 
-    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated, PostPermission, ])
+        # a timeline may still hold posts of a former friend until its prune ran
+        posts = self.get_visible_posts().select_related('owner').in_bulk(post_ids)
+        serializer = self.get_serializer([posts[pk] for pk in post_ids if pk in posts], many=True)
+        return Response({'next': next_page, 'results': serializer.data}, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get', 'post'], permission_classes=[IsAuthenticated, ])
+    def export(self, request):
+        """
+            GET streams the user's posts, comments and likes as NDJSON, gzip
+            encoded when the client accepts it. POST writes the export to a
+            file in the background instead, downloaded from export_file
+        """
+
+        profile = request.user.profile
+        if request.method == 'POST':
+            if export.queue_export(profile.pk):
+                return Response('Your export is being prepared', status=status.HTTP_202_ACCEPTED)
+            return Response('Your export is already being prepared', status=status.HTTP_202_ACCEPTED)
+
+        blocks = export.export_blocks(profile)
+        use_gzip = ACCEPTS_GZIP.search(request.META.get('HTTP_ACCEPT_ENCODING', '')) is not None
+        response = StreamingHttpResponse(export.gzip_blocks(blocks) if use_gzip else blocks,
+                                         content_type='application/x-ndjson')
+        if use_gzip:
+            response['Content-Encoding'] = 'gzip'
+        response['Vary'] = 'Accept-Encoding'
+        response['Content-Disposition'] = 'attachment; filename="export-{}.ndjson"'.format(profile.pk)
+        return response
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated, ])
+    def export_file(self, request):
+        """
+            The export last written for the user by a POST to export, its
+            Last-Modified header tells when it was written
+        """
+
+        path = export.export_path(request.user.profile.pk)
+        if not os.path.isfile(path):
+            raise NotFound('No export has been written yet')
+        response = FileResponse(open(path, 'rb'), as_attachment=True, filename=os.path.basename(path),
+                                content_type='application/gzip')
+        response['Last-Modified'] = http_date(os.path.getmtime(path))
+        return response
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated, ])
     def list_posts(self, request):
-        self.queryset = Post.objects.all()
+        self.queryset = self.get_visible_posts().select_related('owner')
         return self.list(request=request)
 
-    @action(detail=True, methods=['get'], permission_classes=[IsAuthenticated, PostPermission, ])
-    def like(self, request, pk=None):  # dont forget the unlike and delete comment
-        post = Post.objects.filter(pk=pk)
-        like, created = Like.objects.get_or_create(owner=request.user.profile, post=post)
-        if created:
+    def get_list_posts_marker(self, request):
+        page = self.page_marker(self.filter_queryset(self.get_visible_posts()),
+                                'id', 'text', 'flag', 'like_count', 'comment_count', 'created_at',
+                                'owner__first_name', 'owner__last_name')
+        post_ids = [row[0] for row in page]
+        since = min((row[5] for row in page), default=None)
+        return (page, likes.like_count_deltas(post_ids),
+                sorted(likes.liked_post_ids(request.user.profile.pk, post_ids, since=since)))
+
+    def set_liked(self, post, liked):
+        if not likes.set_liked(post.pk, self.request.user.profile.pk, liked):
+            return False
+        if flush_likes.app.conf.task_always_eager:
+            # no beat runs the periodic flush then, see the development settings
+            flush_likes.delay()
+        return True
+
+    @action(detail=True, methods=['get'], permission_classes=[IsAuthenticated, ])
+    def like(self, request, pk=None):
+        post = self.get_visible_post()
+        # buffered, written to Like by the flush_likes task
+        if self.set_liked(post, True):
             return Response('You hit the like button', status=status.HTTP_200_OK)
         return Response('Like already exists', status=status.HTTP_208_ALREADY_REPORTED)
 
-    @action(detail=True, methods=['get'], permission_classes=[IsAuthenticated, PostPermission, ])
-    def unlike(self, request, pk=None):  # dont forget the unlike and delete comment
-        post = Post.objects.filter(pk=pk)
-        self.queryset = Like.objects.filter(owner=request.user.profile, post=post)
-        if self.queryset:
-            self.destroy(request=request)
+    @action(detail=True, methods=['get'], permission_classes=[IsAuthenticated, ])
+    def unlike(self, request, pk=None):
+        post = self.get_visible_post()
+        if self.set_liked(post, False):
             return Response('You hit the unlike button', status=status.HTTP_200_OK)
         return Response('Like already does not exists', status=status.HTTP_208_ALREADY_REPORTED)
 
-    @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated, PostPermission, ])
+    @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated, ])
     def comment(self, request, pk=None):
-        post = Post.objects.filter(pk=pk)
+        post = self.get_visible_post()
         serializer = CreateCommentSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        comment, created = Comment.objects.get_or_create(owner=request.user.profile, post=post,
-                                                         text=serializer.data['text'])
+        with transaction.atomic():
+            comment, created = Comment.objects.get_or_create(owner=request.user.profile, post=post,
+                                                             text=serializer.data['text'])
+            if created:
+                Post.objects.adjust_counters(post.pk, comments=1)
+                transaction.on_commit(lambda: invalidate_post(post.pk))
         if created:
             return Response('Your comment is submitted', status=status.HTTP_200_OK)
         return Response('comment with this text already exists', status=status.HTTP_208_ALREADY_REPORTED)
 
-    @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated, PostPermission, ])
+    @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated, ])
     def uncomment(self, request, pk=None):
         """
             Takes a query_param (comment_id) to specify the comment that
             will be deleted
         """
 
-        post = Post.objects.filter(pk=pk)
+        post = self.get_visible_post()
         comment_id = request.query_params.get('comment_id', None)
-        self.queryset = Comment.objects.filter(id=comment_id, owner=request.user.profile, post=post)
-        if self.queryset:
-            self.destroy(request=request)
+        with transaction.atomic():
+            deleted, _ = Comment.objects.filter(id=comment_id, owner=request.user.profile, post=post).delete()
+            if deleted:
+                Post.objects.adjust_counters(post.pk, comments=-deleted)
+                transaction.on_commit(lambda: invalidate_post(post.pk))
+        if deleted:
             return Response('Your comment has been deleted', status=status.HTTP_200_OK)
         return Response('Comment already does not exists', status=status.HTTP_208_ALREADY_REPORTED)
 
-    @action(detail=True, methods=['get'], permission_classes=[IsAuthenticated, PostPermission, ])
+    @action(detail=True, methods=['get'], permission_classes=[IsAuthenticated, ])
     def post_detail(self, request, pk=None):
-        # self.queryset = self.get_object()
-        self.queryset = Post.objects.filter(pk=pk)
-        return self.retrieve(request=request)
+        """
+            The cached payload of the post with the user's permission check,
+            the buffered likes and liked_by_me layered on top
+        """
+
+        try:
+            post_id = int(pk)
+        except ValueError:
+            raise NotFound()
+        profile = request.user.profile
+        version, payload = get_post_detail(post_id)
+        if payload is None or not (payload['flag'] == Post.public or payload['owner_id'] == profile.pk or
+                                   are_friends(profile.pk, payload['owner_id'])):
+            raise NotFound()
+
+        data = dict(payload['data'])
+        data['likes'] = max(data['likes'] + likes.like_count_deltas([post_id])[post_id], 0)
+        data['liked_by_me'] = likes.is_liked(post_id, profile.pk, version)
+        return Response(data, status=status.HTTP_200_OK)
 
-    @action(detail=True, methods=['get'], permission_classes=[IsAuthenticated, PostPermission, ])
+    @action(detail=True, methods=['get'], permission_classes=[IsAuthenticated, ])
     def post_likes_detail(self, request, pk=None):
-        post = Post.objects.filter(pk=pk)
-        self.queryset = post.like_set.all()
+        post = self.get_visible_post()
+        self.queryset = post.like_set.filter(created_at__gte=not_before(post.created_at)) \
+            .select_related('owner')
         return self.list(request)
 
-    @action(detail=True, methods=['get'], permission_classes=[IsAuthenticated, PostPermission, ])
+    def get_post_comments(self):
+        post = self.get_visible_post()
+        return post.comment_set.filter(created_at__gte=not_before(post.created_at))
+
+    def get_post_comments_detail_marker(self, request, pk=None):
+        return self.page_marker(self.filter_queryset(self.get_post_comments()),
+                                'id', 'text', 'created_at', 'owner__first_name', 'owner__last_name')
+
+    @action(detail=True, methods=['get'], permission_classes=[IsAuthenticated, ])
     def post_comments_detail(self, request, pk=None):
-        post = Post.objects.filter(pk=pk)
-        self.queryset = post.comment_set.all()
+        self.queryset = self.get_post_comments().select_related('owner')
         return self.list(request)
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from profiles.autocomplete import NameIndex, index_path
+
+
+class Command(BaseCommand):
+    help = 'Builds the profile name prefix index used by the autocomplete'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=None, help='Index path, NAME_INDEX_PATH by default')
+
+    def handle(self, *args, **options):
+        path = options['output'] or index_path()
+        index = NameIndex.from_database()
+        index.save(path)
+        self.stdout.write(self.style.SUCCESS(
+            'Indexed {} profiles under {} keys in {:.1f} MB (10^6 bytes) to {}'.format(
+                len(index.profile_ids), len(index.keys), index.nbytes / 10 ** 6, path)
+        ))
@@ -0,0 +1,28 @@
+import time
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+
+from profiles.models import Profile
+
+
+class Command(BaseCommand):
+    help = 'Deletes the content addressed media files no profile refers to anymore'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-age', type=float, default=24,
+                            help='Only delete files older than this many hours, uploads being saved are younger')
+
+    def handle(self, *args, **options):
+        if not hasattr(default_storage, 'prune'):
+            raise CommandError('The default storage is not content addressed')
+
+        referenced = set()
+        for picture, thumbnails in Profile.objects.exclude(picture='').exclude(picture=None) \
+                .values_list('picture', 'thumbnails').iterator(chunk_size=10000):
+            referenced.add(picture)
+            profile = Profile(picture=picture, thumbnails=thumbnails)
+            referenced.update(name for names in profile.thumbnail_names.values() for name in names.values())
+
+        deleted = default_storage.prune(referenced, older_than=time.time() - options['min_age'] * 3600)
+        self.stdout.write(self.style.SUCCESS('Deleted {} unreferenced files'.format(len(deleted))))
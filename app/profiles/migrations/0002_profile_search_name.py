@@ -0,0 +1,67 @@
+# Generated by Django 3.0.8 on 2026-10-18 18:19
+
+import unicodedata
+
+from django.db import migrations, models
+
+POSTGRESQL_FORWARDS = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX profiles_profile_search_name_trgm_idx ON profiles_profile USING gin (search_name gin_trgm_ops)",
+]
+
+POSTGRESQL_BACKWARDS = [
+    "DROP INDEX IF EXISTS profiles_profile_search_name_trgm_idx",
+]
+
+
+def normalize_name(*parts):
+    # frozen copy of profiles.models.normalize_name as of this migration
+    value = ' '.join(part for part in parts if part)
+    if not value.isascii():
+        value = ''.join(char for char in unicodedata.normalize('NFKD', value) if not unicodedata.combining(char))
+    return ' '.join(value.lower().split())
+
+
+def run_for_vendor(statements):
+    def run(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+def fill_search_names(apps, schema_editor):
+    Profile = apps.get_model('profiles', 'Profile')
+    profiles = []
+    for profile in Profile.objects.only('first_name', 'last_name').iterator(chunk_size=2000):
+        profile.search_name = normalize_name(profile.first_name, profile.last_name)
+        profile.search_name_reversed = normalize_name(profile.last_name, profile.first_name)
+        profiles.append(profile)
+        if len(profiles) == 2000:
+            Profile.objects.bulk_update(profiles, ['search_name', 'search_name_reversed'])
+            profiles = []
+    Profile.objects.bulk_update(profiles, ['search_name', 'search_name_reversed'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='search_name',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=101),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='search_name_reversed',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=101),
+        ),
+        migrations.RunPython(fill_search_names, migrations.RunPython.noop),
+        migrations.RunPython(
+            run_for_vendor({'postgresql': POSTGRESQL_FORWARDS}),
+            run_for_vendor({'postgresql': POSTGRESQL_BACKWARDS}),
+        ),
+    ]
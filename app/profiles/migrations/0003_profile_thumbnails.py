@@ -0,0 +1,18 @@
+# Generated by Django 3.0.8 on 2026-10-18 18:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0002_profile_search_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='thumbnails',
+            field=models.TextField(default='', editable=False),
+        ),
+    ]
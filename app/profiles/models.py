@@ -1,5 +1,60 @@
+import json
+import unicodedata
+
 from django.conf import settings
-from django.db import models
+from django.db import connection, models
+from django.db.models import FloatField, Q, Value
+from django.db.models.functions import Cast, Length
+
+# sorts after every character a normalized name can hold
+PREFIX_UPPER_BOUND = '\uffff'
+
+
+def normalize_name(*parts):
+    """
+        Lower cased, accent free and single spaced form of a name, which is
+        what the search columns store and what search terms are compared to
+    """
+
+    value = ' '.join(part for part in parts if part)
+    if not value.isascii():
+        value = ''.join(char for char in unicodedata.normalize('NFKD', value) if not unicodedata.combining(char))
+    return ' '.join(value.lower().split())
+
+
+class ProfileQuerySet(models.QuerySet):
+    def search(self, term):
+        """
+            Profiles whose name matches `term`, best match first, annotated
+            with their `rank`.
+
+            PostgreSQL matches trigram similar names and word prefixes, both
+            served by the pg_trgm GIN index of search_name. Elsewhere names
+            starting with the term, in "first last" or "last first" order,
+            are found with range scans of the two search name indexes.
+        """
+
+        term = normalize_name(term)
+        if not term:
+            return self.none()
+
+        if connection.vendor == 'postgresql':
+            from django.contrib.postgres.search import TrigramSimilarity
+
+            return self.filter(
+                Q(search_name__trigram_similar=term) |
+                Q(search_name__startswith=term) |
+                Q(search_name__contains=' ' + term)
+            ).annotate(rank=TrigramSimilarity('search_name', term)).order_by('-rank', 'id')
+
+        upper_bound = term + PREFIX_UPPER_BOUND
+        return self.filter(
+            Q(search_name__gte=term, search_name__lt=upper_bound) |
+            Q(search_name_reversed__gte=term, search_name_reversed__lt=upper_bound)
+        ).annotate(
+            # the share of the name the term covers
+            rank=Value(len(term), output_field=FloatField()) / Cast(Length('search_name'), FloatField())
+        ).order_by('-rank', 'id')
 
 
 class Profile(models.Model):
@@ -15,10 +70,67 @@ class Profile(models.Model):
     picture = models.ImageField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    # normalized "first last" and "last first" names, see ProfileQuerySet.search
+    search_name = models.CharField(max_length=101, db_index=True, editable=False, default='')
+    search_name_reversed = models.CharField(max_length=101, db_index=True, editable=False, default='')
+    # {size: {extension: name}} of the picture thumbnails, see profiles.thumbnails
+    thumbnails = models.TextField(editable=False, default='')
+
+    objects = ProfileQuerySet.as_manager()
 
     @property
     def full_name(self):
         return self.first_name + ' ' + self.last_name
 
+    # name of the picture as stored in the database
+    _saved_picture_name = ''
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'picture' in field_names:
+            instance._saved_picture_name = instance.picture.name or ''
+        return instance
+
+    @property
+    def picture_changed(self):
+        if 'picture' not in self.__dict__:
+            # deferred and never assigned
+            return False
+        return (self.picture.name or '') != self._saved_picture_name
+
+    @property
+    def thumbnail_names(self):
+        return json.loads(self.thumbnails or '{}')
+
+    def thumbnail_url(self, size, extension):
+        """
+            URL of a picture thumbnail, or of the picture itself while the
+            thumbnails are not rendered yet
+        """
+
+        name = self.thumbnail_names.get(size, {}).get(extension)
+        if name:
+            return self.picture.storage.url(name)
+        return self.picture.url if self.picture else None
+
+    def save(self, *args, **kwargs):
+        if self.picture_changed:
+            # the thumbnails of the previous picture, rendered again on commit
+            self.thumbnails = ''
+        self.search_name = normalize_name(self.first_name, self.last_name)
+        self.search_name_reversed = normalize_name(self.last_name, self.first_name)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            update_fields = set(update_fields)
+            if {'first_name', 'last_name'} & update_fields:
+                update_fields |= {'search_name', 'search_name_reversed'}
+            if 'picture' in update_fields:
+                update_fields.add('thumbnails')
+            kwargs['update_fields'] = update_fields
+        super().save(*args, **kwargs)
+        if 'picture' in self.__dict__:
+            self._saved_picture_name = self.picture.name or ''
+
     def __str__(self):
         return self.full_name
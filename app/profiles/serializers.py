@@ -1,19 +1,52 @@
 from rest_framework import serializers
 
 from .models import Profile
+from .thumbnails import DEFAULT_FORMAT, DEFAULT_SIZE, THUMBNAIL_FORMATS, THUMBNAIL_SIZES
 
 
-class ProfileSerializer(serializers.ModelSerializer):
+class PictureThumbnailMixin:
+    """
+        Represents the picture by the thumbnail the client asks for with the
+        picture_size (small, medium, large or original) and picture_format
+        (webp or jpeg) query params. The format defaults to webp when the
+        client accepts it.
+    """
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        if 'picture' not in data:
+            return data
+        request = self.context.get('request')
+        params = request.query_params if request is not None else {}
+
+        size = params.get('picture_size', DEFAULT_SIZE)
+        if size == 'original' or not instance.picture:
+            return data
+        if size not in THUMBNAIL_SIZES:
+            size = DEFAULT_SIZE
+
+        extension = params.get('picture_format')
+        if extension not in THUMBNAIL_FORMATS:
+            accepts_webp = request is not None and 'image/webp' in request.META.get('HTTP_ACCEPT', '')
+            extension = 'webp' if accepts_webp else DEFAULT_FORMAT
+
+        url = instance.thumbnail_url(size, extension)
+        data['picture'] = request.build_absolute_uri(url) if request is not None else url
+        return data
+
+
+class ProfileSerializer(PictureThumbnailMixin, serializers.ModelSerializer):
     class Meta:
         model = Profile
         fields = ('first_name', 'last_name', 'birthday', 'gender', "address", 'picture',)
 
 
-class SearchProfileSerializer(serializers.ModelSerializer):
+class SearchProfileSerializer(PictureThumbnailMixin, serializers.ModelSerializer):
     user = serializers.PrimaryKeyRelatedField(
         read_only=True
     )
+    full_name = serializers.ReadOnlyField()
 
     class Meta:
         model = Profile
-        fields = ('user', 'first_name', 'last_name', 'birthday', 'gender', "address", 'picture',)
+        fields = ('user', 'full_name', 'first_name', 'last_name', 'birthday', 'gender', "address", 'picture',)
@@ -0,0 +1,29 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .autocomplete import record_change
+from .models import Profile
+from .tasks import generate_profile_thumbnails
+from .thumbnails import delete_thumbnails
+
+
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def log_profile_name_change(sender, instance, **kwargs):
+    profile_id = instance.pk
+    # logged on commit, so that readers reload the committed names
+    transaction.on_commit(lambda: record_change(profile_id))
+
+
+@receiver(post_save, sender=Profile)
+def render_picture_thumbnails(sender, instance, **kwargs):
+    if instance.picture_changed and instance.picture:
+        profile_id, picture_name = instance.pk, instance.picture.name
+        transaction.on_commit(lambda: generate_profile_thumbnails.delay(profile_id, picture_name))
+
+
+@receiver(post_delete, sender=Profile)
+def delete_picture_thumbnails(sender, instance, **kwargs):
+    thumbnails = instance.thumbnails
+    transaction.on_commit(lambda: delete_thumbnails(thumbnails))
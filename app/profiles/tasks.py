@@ -0,0 +1,47 @@
+import json
+
+from celery import shared_task
+from celery.schedules import crontab
+from celery.task import periodic_task
+from celery.utils.log import get_task_logger
+from django.core.cache import cache
+
+from accounts.authentication import invalidate_cached_user
+from profiles.autocomplete import BUILD_QUEUED_KEY, NameIndex, index_path
+from profiles.models import Profile
+from profiles.thumbnails import generate_thumbnails
+
+logger = get_task_logger(__name__)
+
+
+@periodic_task(run_every=(crontab(minute=45, hour=4)), name="build_name_index", ignore_result=True)
+def build_name_index():
+    """
+        Rebuilds the autocomplete name index, which folds in the changes the
+        processes replayed since the last build
+    """
+
+    index = NameIndex.from_database()
+    index.save(index_path())
+    cache.delete(BUILD_QUEUED_KEY)
+    logger.info("indexed %s profile names", len(index.profile_ids))
+    return len(index.profile_ids)
+
+
+@shared_task(name="generate_profile_thumbnails", ignore_result=True)
+def generate_profile_thumbnails(profile_id, picture_name):
+    """
+        Renders the thumbnails of a profile picture, unless the picture was
+        replaced again in the meantime
+    """
+
+    profile = Profile.objects.filter(pk=profile_id).first()
+    if profile is None or profile.picture.name != picture_name:
+        return
+
+    thumbnails = json.dumps(generate_thumbnails(profile), sort_keys=True)
+    # only record them if the picture is still the one they were made from
+    Profile.objects.filter(pk=profile_id, picture=picture_name).update(thumbnails=thumbnails)
+    # the update bypasses the signal that drops the cached authenticated user
+    invalidate_cached_user(profile.user_id)
+    logger.info("rendered the picture thumbnails of profile %s", profile_id)
@@ -1,3 +1,340 @@
-from django.test import TestCase
+import io
+import json
+import os
+import tempfile
+import time
+from datetime import datetime
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from PIL import Image
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from accounts.models import User
+from app.storage import content_hash, is_content_addressed
+from app.stores import LocMemStore
+from friendship.cache import LOCAL_CACHE_SIZE, LRUCache
+from friendship.models import Friendship
+from . import autocomplete
+from .models import Profile, normalize_name
+from .serializers import ProfileSerializer
+from .tasks import build_name_index, generate_profile_thumbnails
+from .thumbnails import THUMBNAIL_FORMATS, THUMBNAIL_SIZES, render_thumbnails
+
+
+def create_profile(email, first_name='John', last_name='Doe'):
+    user = User.objects.create_user(email=email, password='password')
+    return Profile.objects.create(user=user, first_name=first_name, last_name=last_name,
+                                  birthday=datetime(1990, 1, 1).date(), gender='M')
+
+
+def client_for(profile):
+    client = APIClient()
+    client.force_authenticate(profile.user)
+    return client
+
+
+def picture_file(width, height, orientation=None, name='picture.jpg', color='red'):
+    output = io.BytesIO()
+    exif = Image.Exif()
+    if orientation is not None:
+        exif[0x0112] = orientation
+    Image.new('RGB', (width, height), color).save(output, 'JPEG', exif=exif.tobytes())
+    return SimpleUploadedFile(name, output.getvalue(), content_type='image/jpeg')
+
+
+class ProfileTestCase(TestCase):
+    """
+        Starts every test with an empty cache, an empty local friend id
+        cache and a fresh in-process store
+    """
+
+    def setUp(self):
+        cache.clear()
+        for target, value in (('app.stores._store', LocMemStore()),
+                              ('friendship.cache._local', LRUCache(LOCAL_CACHE_SIZE))):
+            patcher = mock.patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+
+class MediaTestCase(ProfileTestCase):
+    """
+        Stores the uploads of every test under a temporary MEDIA_ROOT
+    """
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.media_root = directory.name
+        settings = override_settings(MEDIA_ROOT=self.media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+
+class ProfileSearchTests(ProfileTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.john = create_profile('john@example.com', 'John', 'Doe')
+        self.joanna = create_profile('joanna@example.com', 'Joanna', 'Smith')
+        self.emile = create_profile('emile@example.com', 'Émile', 'Johnson')
+        self.bob = create_profile('bob@example.com', 'Bob', 'Jones')
+        self.client = client_for(self.john)
+
+    def search(self, **params):
+        response = self.client.get('/profile_search/', params)
+        self.assertEqual(response.status_code, 200)
+        return [profile['full_name'] for profile in response.json()['results']]
+
+    def test_normalize_name(self):
+        self.assertEqual(normalize_name(' Émile ', 'JOHNSON  Jr'), 'emile johnson jr')
+        self.assertEqual(normalize_name('', 'Doe'), 'doe')
+
+    def test_search_names_follow_renames(self):
+        self.assertEqual((self.emile.search_name, self.emile.search_name_reversed), ('emile johnson', 'johnson emile'))
+        self.john.last_name = 'Zed'
+        self.john.save(update_fields=['last_name'])
+        self.john.refresh_from_db()
+        self.assertEqual((self.john.search_name, self.john.search_name_reversed), ('john zed', 'zed john'))
+
+    def test_search_matches_first_and_last_name_prefixes(self):
+        self.assertEqual(set(self.search(q='jo')), {'John Doe', 'Joanna Smith', 'Émile Johnson', 'Bob Jones'})
+        self.assertEqual(self.search(q='JOHN d'), ['John Doe'])
+        self.assertEqual(self.search(q='emile'), ['Émile Johnson'])
+        self.assertEqual(self.search(q='smith'), ['Joanna Smith'])
+
+    def test_search_with_the_older_parameters(self):
+        self.assertEqual(self.search(first_name='Joanna', last_name='Smith'), ['Joanna Smith'])
+
+    def test_empty_search(self):
+        self.assertEqual(self.search(q=''), [])
+        self.assertEqual(self.search(), [])
+
+
+class AutocompleteTests(ProfileTestCase):
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(NAME_INDEX_PATH=os.path.join(directory.name, 'name_index.npz'))
+        settings.enable()
+        self.addCleanup(settings.disable)
+        patcher = mock.patch('profiles.autocomplete._autocomplete', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.john = create_profile('john@example.com', 'John', 'Doe')
+        self.joanna = create_profile('joanna@example.com', 'Joanna', 'Smith')
+        self.emile = create_profile('emile@example.com', 'Émile', 'Johnson')
+        self.mary = create_profile('mary@example.com', 'Mary Ann', 'Jo')
+        self.bob = create_profile('bob@example.com', 'Bob', 'Jones')
+        Friendship.objects.create(user_one_id=self.john, user_two_id=self.bob, status=Friendship.Status.ACCEPTED)
+
+    def suggest(self, completer, term, limit=autocomplete.DEFAULT_LIMIT):
+        return [(match['full_name'], match['is_friend'])
+                for match in completer.suggest(term, viewer_id=self.john.pk, limit=limit)]
+
+    def test_friends_first_then_in_name_order(self):
+        completer = autocomplete.Autocomplete(autocomplete.NameIndex.from_database())
+        self.assertEqual(self.suggest(completer, 'jo'), [
+            ('Bob Jones', True), ('Mary Ann Jo', False), ('Joanna Smith', False), ('Émile Johnson', False),
+        ])
+        self.assertEqual(self.suggest(completer, 'jo', limit=2), [('Bob Jones', True), ('Mary Ann Jo', False)])
+        self.assertEqual(self.suggest(completer, 'MARY a'), [('Mary Ann Jo', False)])
+        self.assertEqual(self.suggest(completer, 'emile'), [('Émile Johnson', False)])
+        self.assertEqual(self.suggest(completer, ' '), [])
+
+    def test_saved_index(self):
+        index = autocomplete.NameIndex.from_database()
+        index.save(autocomplete.index_path())
+        loaded = autocomplete.NameIndex.load(autocomplete.index_path())
+        self.assertEqual(loaded.matches('jo', 10, set()), index.matches('jo', 10, set()))
+        self.assertEqual(loaded.names_by_id([self.emile.pk, 9999]), {self.emile.pk: ('Émile', 'Johnson')})
+
+    def test_changes_are_replayed_on_the_index(self):
+        completer = autocomplete.Autocomplete(autocomplete.NameIndex.from_database())
+        self.joanna.first_name = 'Zoe'
+        self.joanna.save()
+        deleted_id = self.emile.pk
+        self.emile.delete()
+        dana = create_profile('dana@example.com', 'Dana', 'Jolly')
+        # logged on commit, which a TestCase never reaches
+        for profile_id in (self.joanna.pk, deleted_id, dana.pk):
+            autocomplete.record_change(profile_id)
+
+        completer.refresh()
+        self.assertEqual(self.suggest(completer, 'jo'), [
+            ('Bob Jones', True), ('Mary Ann Jo', False), ('Dana Jolly', False),
+        ])
+        self.assertEqual(self.suggest(completer, 'zo'), [('Zoe Smith', False)])
+
+    def test_endpoint(self):
+        build_name_index()
+        response = client_for(self.john).get('/profile_autocomplete/', {'q': 'jo', 'limit': 2})
+        self.assertEqual(response.json(), [
+            {'profile': self.bob.pk, 'full_name': 'Bob Jones', 'is_friend': True},
+            {'profile': self.mary.pk, 'full_name': 'Mary Ann Jo', 'is_friend': False},
+        ])
+
+    def test_missing_index_is_built_in_the_background(self):
+        with mock.patch.object(build_name_index, 'delay') as delay:
+            for _ in range(2):
+                response = client_for(self.john).get('/profile_autocomplete/', {'q': 'jo'})
+                self.assertEqual(response.json(), [])
+        delay.assert_called_once_with()
+
+
+class ThumbnailTests(MediaTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.profile = create_profile('john@example.com')
+
+    def set_picture(self, picture):
+        self.profile.picture = picture
+        self.profile.save()
+        return self.profile.picture.name
+
+    def test_render_thumbnails(self):
+        thumbnails = {}
+        for size, extension, content in render_thumbnails(picture_file(3000, 1500, orientation=6)):
+            thumbnails[size, extension] = Image.open(io.BytesIO(content))
+        self.assertEqual(set(thumbnails), {(size, extension) for size in THUMBNAIL_SIZES
+                                           for extension in THUMBNAIL_FORMATS})
+        for (size, extension), image in thumbnails.items():
+            # turned upright by the EXIF orientation, which is left out
+            self.assertEqual(image.size, (THUMBNAIL_SIZES[size] // 2, THUMBNAIL_SIZES[size]))
+            self.assertEqual(image.format, THUMBNAIL_FORMATS[extension][0])
+            self.assertEqual(dict(image.getexif()), {})
+
+    def test_small_pictures_are_not_enlarged(self):
+        sizes = {size: Image.open(io.BytesIO(content)).size
+                 for size, _, content in render_thumbnails(picture_file(100, 80))}
+        self.assertEqual(sizes, {'small': (64, 51), 'medium': (100, 80), 'large': (100, 80)})
+
+    def test_thumbnails_are_recorded(self):
+        picture_name = self.set_picture(picture_file(600, 600))
+        # queued on commit, which a TestCase never reaches
+        generate_profile_thumbnails(self.profile.pk, picture_name)
+        self.profile.refresh_from_db()
+
+        names = self.profile.thumbnail_names
+        self.assertEqual(set(names), set(THUMBNAIL_SIZES))
+        for size, by_extension in names.items():
+            self.assertEqual(set(by_extension), set(THUMBNAIL_FORMATS))
+            for name in by_extension.values():
+                self.assertTrue(self.profile.picture.storage.exists(name))
+        self.assertEqual(self.profile.thumbnail_url('small', 'webp'), '/media/' + names['small']['webp'])
+
+        self.set_picture(picture_file(600, 600, color='blue'))
+        self.assertEqual(self.profile.thumbnails, '')
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.thumbnails, '')
+
+    def test_thumbnails_of_a_replaced_picture_are_dropped(self):
+        picture_name = self.set_picture(picture_file(600, 600))
+        self.set_picture(picture_file(600, 600, color='blue'))
+        generate_profile_thumbnails(self.profile.pk, picture_name)
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.thumbnails, '')
+
+    def test_serialized_picture(self):
+        picture_name = self.set_picture(picture_file(600, 600))
+
+        def picture(**params):
+            accept = params.pop('accept', '*/*')
+            request = Request(APIRequestFactory().get('/', params, HTTP_ACCEPT=accept))
+            return ProfileSerializer(self.profile, context={'request': request}).data['picture']
+
+        # the picture itself until the thumbnails are rendered
+        self.assertEqual(picture(), 'http://testserver/media/' + picture_name)
+        generate_profile_thumbnails(self.profile.pk, picture_name)
+        self.profile.refresh_from_db()
+        names = json.loads(self.profile.thumbnails)
+        self.assertEqual(picture(), 'http://testserver/media/' + names['medium']['jpeg'])
+        self.assertEqual(picture(accept='image/webp,*/*'), 'http://testserver/media/' + names['medium']['webp'])
+        self.assertEqual(picture(picture_size='small', picture_format='webp'),
+                         'http://testserver/media/' + names['small']['webp'])
+        self.assertEqual(picture(picture_size='huge'), 'http://testserver/media/' + names['medium']['jpeg'])
+        self.assertEqual(picture(picture_size='original'), 'http://testserver/media/' + picture_name)
+
+
+class MediaStorageTests(MediaTestCase):
+
+    def test_files_are_stored_once_under_their_hash(self):
+        digest = content_hash(ContentFile(b'content'))
+        first = default_storage.save('first.TXT', ContentFile(b'content'))
+        second = default_storage.save('second.txt', ContentFile(b'content'))
+        self.assertEqual(first, '{}/{}/{}.txt'.format(digest[:2], digest[2:4], digest))
+        self.assertEqual(second, first)
+        self.assertTrue(is_content_addressed(first))
+        self.assertFalse(is_content_addressed('pictures/first.txt'))
+
+        # shared by every record storing the same content
+        default_storage.delete(first)
+        self.assertTrue(default_storage.exists(first))
+
+    def test_serve_media(self):
+        name = default_storage.save('file.txt', ContentFile(b'content'))
+        response = self.client.get('/media/' + name)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'content')
+        self.assertEqual(response['Content-Type'], 'text/plain')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+
+        etag = response['ETag']
+        response = self.client.get('/media/' + name, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(self.client.post('/media/' + name).status_code, 405)
+
+    def test_serve_media_with_a_front_server(self):
+        name = default_storage.save('file.txt', ContentFile(b'content'))
+        with override_settings(MEDIA_SENDFILE_HEADER='X-Accel-Redirect', MEDIA_ACCEL_REDIRECT_PREFIX='/protected/'):
+            response = self.client.get('/media/' + name)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected/' + name)
+        self.assertEqual(response.content, b'')
+        with override_settings(MEDIA_SENDFILE_HEADER='X-Sendfile'):
+            response = self.client.get('/media/' + name)
+        self.assertEqual(response['X-Sendfile'], default_storage.path(name))
+
+    def test_serve_media_of_other_names(self):
+        os.makedirs(os.path.join(self.media_root, 'static'))
+        with open(os.path.join(self.media_root, 'static', 'file.txt'), 'wb') as file:
+            file.write(b'content')
+        response = self.client.get('/media/static/file.txt')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=3600')
+        self.assertNotIn('ETag', response)
+
+        self.assertEqual(self.client.get('/media/static/missing.txt').status_code, 404)
+        self.assertEqual(self.client.get('/media/static').status_code, 404)
+        self.assertEqual(self.client.get('/media/../tests.py').status_code, 404)
+        self.assertEqual(self.client.get('/media/%2E%2E/tests.py').status_code, 404)
+
+    def test_prune_media(self):
+        profile = create_profile('john@example.com')
+        profile.picture = picture_file(600, 600)
+        profile.save()
+        generate_profile_thumbnails(profile.pk, profile.picture.name)
+        profile.refresh_from_db()
+        kept = {profile.picture.name} | {name for names in profile.thumbnail_names.values() for name in names.values()}
+        unreferenced = default_storage.save('file.txt', ContentFile(b'content'))
+        recent = default_storage.save('file.txt', ContentFile(b'recent'))
+        past = time.time() - 2 * 24 * 3600
+        for name in kept | {unreferenced}:
+            os.utime(default_storage.path(name), (past, past))
+
+        output = io.StringIO()
+        call_command('prune_media', stdout=output)
+        self.assertIn('Deleted 1 unreferenced files', output.getvalue())
+        self.assertFalse(default_storage.exists(unreferenced))
+        self.assertTrue(all(default_storage.exists(name) for name in kept | {recent}))
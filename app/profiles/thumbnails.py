@@ -0,0 +1,99 @@
+"""
+Profile picture thumbnails.
+
+Every picture is rendered once per size of THUMBNAIL_SIZES in each format
+of THUMBNAIL_FORMATS by the generate_profile_thumbnails task, and the
+stored names are recorded in Profile.thumbnails. JPEG uploads are decoded
+with Image.draft at the smallest DCT scale that still covers the largest
+thumbnail, so the full resolution bitmap of a large photo is never held in
+memory; other formats are shrunk with reduce before resampling. EXIF data
+is applied to the orientation and then left out of the thumbnails.
+"""
+
+import io
+import json
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+# longest side in pixels
+THUMBNAIL_SIZES = {
+    'small': 64,
+    'medium': 256,
+    'large': 1024,
+}
+
+# extension -> (Pillow format, save options)
+THUMBNAIL_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 85, 'optimize': True, 'progressive': True}),
+}
+
+DEFAULT_SIZE = 'medium'
+DEFAULT_FORMAT = 'jpeg'
+
+
+def thumbnail_name(profile_id, size, extension):
+    """
+        Name a thumbnail is saved under. ContentAddressedStorage, the
+        storage of both settings, only keeps its extension and stores the
+        file under its sha256, so the size and format of a stored thumbnail
+        are only carried by its keys in Profile.thumbnails.
+    """
+
+    return 'thumbnails/profiles/{}/{}.{}'.format(profile_id, size, extension)
+
+
+def _open(picture):
+    largest = max(THUMBNAIL_SIZES.values())
+    image = Image.open(picture)
+    # JPEG only: decode straight to a downscaled bitmap
+    image.draft('RGB', (largest, largest))
+    # reduce by an integer factor first, keeping at least twice the largest size
+    factor = min(image.size) // (2 * largest)
+    if factor > 1:
+        image = image.reduce(factor)
+    image = ImageOps.exif_transpose(image)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    return image
+
+
+def render_thumbnails(picture):
+    """
+        Yields (size, extension, bytes) for every thumbnail of `picture`, a
+        file object
+    """
+
+    image = _open(picture)
+    for size, pixels in sorted(THUMBNAIL_SIZES.items(), key=lambda item: -item[1]):
+        # every size is resampled from the previous, larger one
+        image.thumbnail((pixels, pixels), Image.LANCZOS, reducing_gap=3.0)
+        for extension, (image_format, options) in THUMBNAIL_FORMATS.items():
+            output = io.BytesIO()
+            image.save(output, image_format, **options)
+            yield size, extension, output.getvalue()
+
+
+def generate_thumbnails(profile):
+    """
+        Renders and stores the thumbnails of the profile's picture, returns
+        {size: {extension: name}}
+    """
+
+    thumbnails = {}
+    with profile.picture.open('rb') as picture:
+        for size, extension, content in render_thumbnails(picture):
+            name = thumbnail_name(profile.pk, size, extension)
+            # only a storage keeping the name can hold the previous thumbnail
+            if default_storage.exists(name):
+                default_storage.delete(name)
+            thumbnails.setdefault(size, {})[extension] = default_storage.save(name, ContentFile(content))
+    return thumbnails
+
+
+def delete_thumbnails(thumbnails):
+    for names in json.loads(thumbnails or '{}').values():
+        for name in names.values():
+            default_storage.delete(name)
@@ -1,5 +1,5 @@
 from django.urls import path, include
-from .views import ProfileViewSet, SearchForProfiles
+from .views import ProfileViewSet, SearchForProfiles, ProfileAutocomplete
 from rest_framework import routers
 
 router = routers.DefaultRouter()
@@ -11,5 +11,6 @@ app_name = 'profile'
 urlpatterns = [
     path('', include(router.urls)),
     path('profile_search/', SearchForProfiles.as_view()),
+    path('profile_autocomplete/', ProfileAutocomplete.as_view()),
 
 ]
\ No newline at end of file
@@ -1,18 +1,19 @@
 from rest_framework import viewsets, mixins, permissions, status
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.decorators import action
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from accounts.authentication import CachedJWTAuthentication
+from profiles.autocomplete import DEFAULT_LIMIT, get_autocomplete
 from profiles.models import Profile
 from profiles.serializers import ProfileSerializer, SearchProfileSerializer
 
 
 class ProfileViewSet(viewsets.GenericViewSet,
                      mixins.CreateModelMixin):
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedJWTAuthentication,)
     permission_classes = (IsAdminUser,)
     serializer_class = ProfileSerializer
     queryset = Profile.objects.all()
@@ -23,23 +24,27 @@ class ProfileViewSet(viewsets.GenericViewSet,
     @action(detail=False, methods=['get', 'put', 'patch', 'delete'], permission_classes=[permissions.IsAuthenticated])
     def me(self, request):
 
-        profile = Profile.objects.get(user=request.user)
+        profile = request.user.profile
 
         if request.method == 'GET':
-            serializer = ProfileSerializer(profile)
+            serializer = ProfileSerializer(profile, context={'request': request})
             return Response(serializer.data, status=status.HTTP_200_OK)
 
+        # the authenticated user's profile may come from the cache, saving
+        # it would write back stale columns
+        profile = Profile.objects.get(pk=profile.pk)
+
         if request.method == 'PUT':
             serializer = ProfileSerializer(data=request.data)
             serializer.is_valid(raise_exception=True)
-            serializer.update(instance=profile, validated_data=serializer.validated_data)
-            return Response(serializer.validated_data, status=status.HTTP_200_OK)
+            profile = serializer.update(instance=profile, validated_data=serializer.validated_data)
+            return Response(ProfileSerializer(profile, context={'request': request}).data, status=status.HTTP_200_OK)
 
         if request.method == 'PATCH':
             serializer = ProfileSerializer(data=request.data, partial=True)
             serializer.is_valid(raise_exception=True)
-            serializer.update(instance=profile, validated_data=serializer.validated_data)
-            return Response(serializer.validated_data, status=status.HTTP_200_OK)
+            profile = serializer.update(instance=profile, validated_data=serializer.validated_data)
+            return Response(ProfileSerializer(profile, context={'request': request}).data, status=status.HTTP_200_OK)
 
 
 class SearchForProfiles(APIView):
@@ -76,17 +81,39 @@ class SearchForProfiles(APIView):
     def paginate_qs(self, queryset):
         page = self.paginate_queryset(queryset)
         if page is not None:
-            serializer = SearchProfileSerializer(page, many=True)
+            serializer = SearchProfileSerializer(page, many=True, context={'request': self.request})
             return self.get_paginated_response(serializer.data)
-        serializer = SearchProfileSerializer(queryset, many=True)
+        serializer = SearchProfileSerializer(queryset, many=True, context={'request': self.request})
         return Response(serializer.data, status=status.HTTP_200_OK)
 
     def get(self, request):
-        first_name = request.query_params.get('first_name', None)
-        last_name = request.query_params.get('last_name', None)
-
-        s1_profiles = Profile.objects.filter(first_name=first_name).order_by('-id')
-        if last_name:
-            s2_profiles = s1_profiles.filter(last_name=last_name)
-            self.paginate_qs(s2_profiles)
-        self.paginate_qs(s1_profiles)
+        """
+            Takes a query_param (q), or the older first_name and last_name
+            ones, and returns the matching profiles best match first
+        """
+
+        term = request.query_params.get('q', None)
+        if term is None:
+            term = ' '.join(filter(None, (request.query_params.get('first_name', None),
+                                          request.query_params.get('last_name', None))))
+
+        return self.paginate_qs(Profile.objects.search(term))
+
+
+class ProfileAutocomplete(APIView):
+    """
+        Takes query_params (q) and (limit) and returns the profiles whose
+        first or last name starts with q, the user's friends first
+    """
+
+    permission_classes = [permissions.IsAuthenticated]
+    max_limit = 25
+
+    def get(self, request):
+        try:
+            limit = min(int(request.query_params.get('limit', DEFAULT_LIMIT)), self.max_limit)
+        except ValueError:
+            limit = DEFAULT_LIMIT
+        results = get_autocomplete().suggest(request.query_params.get('q', ''),
+                                             viewer_id=request.user.profile.pk, limit=max(limit, 1))
+        return Response(results, status=status.HTTP_200_OK)
@@ -0,0 +1,18 @@
+# Generated by Django 3.0.8 on 2026-10-18 18:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stories', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='story',
+            name='expiration_date',
+            field=models.DateTimeField(db_index=True),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 3.0.8 on 2026-10-18 18:18
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0001_initial'),
+        ('stories', '0002_story_expiration_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoryView',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('viewed_at', models.DateTimeField()),
+                ('story', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='views', to='stories.Story')),
+                ('viewer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='profiles.Profile')),
+            ],
+            options={
+                'unique_together': {('story', 'viewer')},
+            },
+        ),
+    ]
@@ -1,24 +1,60 @@
 import datetime
+from collections import Counter
 
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
 
 from profiles.models import Profile
+from . import tray
 
 
-class StoryManager(models.Manager):
+class StoryQuerySet(models.QuerySet):
+    def active(self):
+        return self.filter(expiration_date__gte=timezone.now())
+
+    def expired(self):
+        return self.filter(expiration_date__lt=timezone.now())
+
+    def delete_expired(self, batch_size=1000):
+        """
+            Deletes the expired stories and their view receipts batch_size
+            stories at a time, so that no single statement holds its locks
+            for long. Returns how many rows of each model were deleted.
+        """
+
+        deleted = Counter()
+        while True:
+            batch = list(self.expired().values_list('pk', flat=True)[:batch_size])
+            if not batch:
+                return deleted
+            _, per_model = self.model._base_manager.filter(pk__in=batch).delete()
+            deleted.update(per_model)
+
+
+class StoryManager(models.Manager.from_queryset(StoryQuerySet)):
+    """
+        Only returns the stories that did not expire yet, the expiry sweep
+        deletes the others from time to time
+    """
+
+    def get_queryset(self):
+        return super().get_queryset().active()
+
     def create_story(self, user, text, *args, **kwargs):
         expiration_date = timezone.now() + datetime.timedelta(days=1)
-        return Story.objects.create(owner=user, text=text, expiration_date=expiration_date, *args, **kwargs)
+        story = Story.objects.create(owner=user, text=text, expiration_date=expiration_date, *args, **kwargs)
+        transaction.on_commit(lambda: tray.publish(story))
+        return story
 
 
 class Story(models.Model):
     owner = models.ForeignKey(Profile, on_delete=models.CASCADE)
     text = models.CharField(max_length=300)
     created_at = models.DateTimeField(auto_now_add=True)
-    expiration_date = models.DateTimeField()
+    expiration_date = models.DateTimeField(db_index=True)
 
     objects = StoryManager()
+    all_objects = models.Manager.from_queryset(StoryQuerySet)()
 
     @property
     def full_name(self):
@@ -26,3 +62,20 @@ class Story(models.Model):
 
     def __str__(self):
         return self.owner.full_name + ' Story'
+
+
+class StoryView(models.Model):
+    """
+        Receipt of a profile having viewed a story, written in batches by
+        stories.tasks.flush_story_views
+    """
+
+    story = models.ForeignKey(Story, on_delete=models.CASCADE, related_name='views')
+    viewer = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='+')
+    viewed_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('story', 'viewer')
+
+    def __str__(self):
+        return '{} viewed story {}'.format(self.viewer_id, self.story_id)
@@ -0,0 +1,82 @@
+"""
+Story view receipts.
+
+Recording a view is one SADD on the story's viewer set, which expires with
+the story. Only the first view of a profile is appended to a buffer list,
+which flush_views drains into StoryView with bulk inserts. The size of the
+viewer set is the view count of the story.
+
+The buffer is read before it is written to the database and trimmed only
+once the insert committed, a failed flush leaves the views to the next
+one.
+"""
+
+import time
+from datetime import datetime, timezone
+
+from django.db import transaction
+
+from app.stores import get_store
+
+VIEWS_BUFFER_KEY = 'stories:views:buffer'
+
+
+def viewers_key(story_id):
+    return 'stories:viewers:{}'.format(story_id)
+
+
+def record_view(story, viewer_id):
+    """
+        Records that `viewer_id` viewed `story`, returns whether it is the
+        first time they did
+    """
+
+    store = get_store()
+    first_view = store.sadd(viewers_key(story.pk), viewer_id, expire_at=story.expiration_date.timestamp())
+    if first_view:
+        store.rpush(VIEWS_BUFFER_KEY, '{}:{}:{}'.format(story.pk, viewer_id, time.time()))
+    return first_view
+
+
+def view_counts(story_ids):
+    """
+        Number of profiles that viewed each story, as {story_id: count}
+    """
+
+    story_ids = list(story_ids)
+    counts = get_store().scard_many(viewers_key(story_id) for story_id in story_ids)
+    return {story_id: counts[viewers_key(story_id)] for story_id in story_ids}
+
+
+def flush_views(batch_size=1000):
+    """
+        Drains the view buffer into StoryView, returns how many views were
+        read from it. Views of stories or profiles deleted in the meantime
+        are dropped.
+    """
+
+    from profiles.models import Profile
+    from .models import Story, StoryView
+
+    store = get_store()
+    flushed = 0
+    while True:
+        entries = store.lrange(VIEWS_BUFFER_KEY, 0, batch_size - 1)
+        if not entries:
+            return flushed
+
+        views = []
+        for entry in entries:
+            story_id, viewer_id, viewed_at = entry.split(':')
+            views.append(StoryView(story_id=int(story_id), viewer_id=int(viewer_id),
+                                   viewed_at=datetime.fromtimestamp(float(viewed_at), tz=timezone.utc)))
+        stories = set(Story.all_objects.filter(pk__in={view.story_id for view in views})
+                      .values_list('pk', flat=True))
+        viewers = set(Profile.objects.filter(pk__in={view.viewer_id for view in views})
+                      .values_list('pk', flat=True))
+        with transaction.atomic():
+            StoryView.objects.bulk_create([view for view in views
+                                           if view.story_id in stories and view.viewer_id in viewers],
+                                          batch_size=batch_size, ignore_conflicts=True)
+        if store.ltrim_if(VIEWS_BUFFER_KEY, len(entries), entries[0]):
+            flushed += len(entries)
@@ -1,6 +1,6 @@
 from rest_framework import serializers
 
-from .models import Story
+from .models import Story, StoryView
 
 
 class StorySerializer(serializers.ModelSerializer):
@@ -14,3 +14,11 @@ class StorySerializer(serializers.ModelSerializer):
         user = self.context.get('request').user.profile
         story = Story.objects.create_story(user=user, **validated_data)
         return story
+
+
+class StoryViewSerializer(serializers.ModelSerializer):
+    viewer_name = serializers.ReadOnlyField(source='viewer.full_name')
+
+    class Meta:
+        model = StoryView
+        fields = ('viewer', 'viewer_name', 'viewed_at')
@@ -1,17 +1,35 @@
+import time
+
 from celery.utils.log import get_task_logger
 from celery.schedules import crontab
 from celery.task import periodic_task
-from django.utils import timezone
 
-from stories.models import Story
+from stories.models import Story, StoryView
+from stories.receipts import flush_views
 logger = get_task_logger(__name__)
 
 
-@periodic_task(run_every=(crontab(minute='*/2')), name="some_task", ignore_result=True)
-def delete_expired_stories():
-    stories = Story.objects.all()
-    for story in stories:
-        if story.expiration_date < timezone.now():
-            story.delete()
+@periodic_task(run_every=(crontab(minute='*/15')), name="delete_expired_stories", ignore_result=True)
+def delete_expired_stories(batch_size=1000):
+    """
+        Expired stories are already hidden by Story.objects, this only
+        reclaims their rows
+    """
+
+    started = time.monotonic()
+    deleted = Story.all_objects.delete_expired(batch_size=batch_size)
+    duration = time.monotonic() - started
+    stories, receipts = deleted[Story._meta.label], deleted[StoryView._meta.label]
+    logger.info("deleted %s expired stories and %s view receipts in %.3fs", stories, receipts, duration)
+    return {'deleted': stories, 'receipts': receipts, 'duration': duration}
+
+
+@periodic_task(run_every=(crontab(minute='*')), name="flush_story_views", ignore_result=True)
+def flush_story_views(batch_size=1000):
+    """
+        Writes the buffered story views to StoryView
+    """
 
-    return "completed deleting story at {}".format(timezone.now())
+    written = flush_views(batch_size=batch_size)
+    logger.info("flushed %s story views", written)
+    return written
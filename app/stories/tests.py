@@ -1,3 +1,182 @@
+import time
+from datetime import datetime, timedelta
+from unittest import mock
+
+from django.core.cache import cache
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from accounts.models import User
+from app.stores import LocMemStore
+from friendship.cache import LOCAL_CACHE_SIZE, LRUCache, get_friend_ids
+from friendship.models import Friendship
+from profiles.models import Profile
+from . import tray
+from .models import Story, StoryView
+from .receipts import flush_views, record_view, view_counts
+from .tasks import delete_expired_stories, flush_story_views
+
+
+def create_profile(email, first_name='John', last_name='Doe'):
+    user = User.objects.create_user(email=email, password='password')
+    return Profile.objects.create(user=user, first_name=first_name, last_name=last_name,
+                                  birthday=datetime(1990, 1, 1).date(), gender='M')
+
+
+def client_for(profile):
+    client = APIClient()
+    client.force_authenticate(profile.user)
+    return client
+
+
+def befriend(profile, friend):
+    return Friendship.objects.create(user_one_id=profile, user_two_id=friend, status=Friendship.Status.ACCEPTED)
+
+
+class StoryTestCase(TestCase):
+    """
+        Starts every test with an empty cache, an empty local friend id
+        cache and a fresh in-process store
+    """
+
+    def setUp(self):
+        cache.clear()
+        for target, value in (('app.stores._store', LocMemStore()),
+                              ('friendship.cache._local', LRUCache(LOCAL_CACHE_SIZE))):
+            patcher = mock.patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.owner = create_profile('owner@example.com', first_name='Jane')
+
+    def create_expired_story(self, text='expired'):
+        return Story.all_objects.create(owner=self.owner, text=text,
+                                        expiration_date=timezone.now() - timedelta(hours=1))
+
+
+class StoryExpiryTests(StoryTestCase):
+
+    def test_expired_stories_are_hidden(self):
+        live = Story.objects.create_story(self.owner, 'live')
+        self.create_expired_story()
+        self.assertEqual(list(Story.objects.all()), [live])
+        self.assertEqual(Story.all_objects.count(), 2)
+
+    def test_sweep_deletes_expired_stories_and_their_views(self):
+        live = Story.objects.create_story(self.owner, 'live')
+        viewer = create_profile('viewer@example.com')
+        for _ in range(5):
+            story = self.create_expired_story()
+            StoryView.objects.create(story=story, viewer=viewer, viewed_at=timezone.now())
+        StoryView.objects.create(story=live, viewer=viewer, viewed_at=timezone.now())
+
+        result = delete_expired_stories(batch_size=2)
+        self.assertEqual((result['deleted'], result['receipts']), (5, 5))
+        self.assertEqual(list(Story.all_objects.all()), [live])
+        self.assertEqual(list(StoryView.objects.values_list('story', flat=True)), [live.pk])
+        self.assertEqual(delete_expired_stories()['deleted'], 0)
+
+
+class StoryTrayTests(StoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.profile = create_profile('someone@example.com')
+        self.friend = create_profile('friend@example.com', first_name='Jim')
+        befriend(self.profile, self.owner)
+        befriend(self.friend, self.profile)
+
+    def publish(self, owner, text):
+        # published on commit, which a TestCase never reaches
+        story = Story.objects.create_story(owner, text)
+        tray.publish(story)
+        return story
+
+    def tray(self):
+        response = client_for(self.profile).get('/stories/tray/')
+        self.assertEqual(response.status_code, 200)
+        return [(owner['owner']['full_name'], [story['text'] for story in owner['stories']])
+                for owner in response.json()]
+
+    def test_tray_groups_the_stories_of_friends(self):
+        self.publish(self.owner, 'first')
+        self.publish(self.friend, 'second')
+        self.publish(self.owner, 'third')
+        self.publish(self.profile, 'own')
+        self.publish(create_profile('stranger@example.com'), 'stranger')
+
+        self.assertEqual(self.tray(), [('Jane Doe', ['first', 'third']), ('Jim Doe', ['second'])])
+
+    def test_tray_reads_no_stories_from_the_database(self):
+        self.publish(self.owner, 'first')
+        get_friend_ids(self.profile.pk)
+        # the names of the owners
+        with self.assertNumQueries(1):
+            self.assertEqual(self.tray(), [('Jane Doe', ['first'])])
+
+    def test_tray_leaves_expired_stories_out(self):
+        self.publish(self.owner, 'first')
+        with mock.patch('time.time', return_value=time.time() + 2 * 24 * 60 * 60):
+            self.assertEqual(self.tray(), [])
+
+
+class StoryViewTests(StoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.story = Story.objects.create_story(self.owner, 'story')
+        self.viewers = [create_profile('viewer{}@example.com'.format(index)) for index in range(2)]
+        for viewer in self.viewers:
+            befriend(viewer, self.owner)
+
+    def set_eager(self, eager):
+        # the CELERY_ namespaced settings win over the plain option names
+        conf = flush_story_views.app.conf
+        self.addCleanup(conf.__setitem__, 'CELERY_TASK_ALWAYS_EAGER', conf.task_always_eager)
+        conf['CELERY_TASK_ALWAYS_EAGER'] = eager
+
+    def view(self, profile, story=None):
+        return client_for(profile).post('/stories/{}/view/'.format((story or self.story).pk))
+
+    def test_views_are_buffered_until_flushed(self):
+        first, second = self.viewers
+        self.assertTrue(record_view(self.story, first.pk))
+        self.assertFalse(record_view(self.story, first.pk))
+        self.assertTrue(record_view(self.story, second.pk))
+
+        self.assertEqual(view_counts([self.story.pk]), {self.story.pk: 2})
+        self.assertFalse(StoryView.objects.exists())
+        self.assertEqual(flush_views(), 2)
+        self.assertEqual(set(StoryView.objects.values_list('viewer', flat=True)), {first.pk, second.pk})
+        self.assertEqual(flush_views(), 0)
+
+    def test_flush_drops_views_of_deleted_profiles(self):
+        first, second = self.viewers
+        record_view(self.story, first.pk)
+        record_view(self.story, second.pk)
+        second.delete()
+
+        self.assertEqual(flush_views(), 2)
+        self.assertEqual(list(StoryView.objects.values_list('viewer', flat=True)), [first.pk])
+
+    def test_view_endpoint(self):
+        self.set_eager(True)
+        first, second = self.viewers
+        for profile in (first, first, second, self.owner):
+            self.assertEqual(self.view(profile).status_code, 204)
+        self.assertEqual(self.view(create_profile('stranger@example.com')).status_code, 404)
+
+        # flushed right away, no beat runs while tasks are eager
+        self.assertEqual(StoryView.objects.filter(story=self.story).count(), 2)
+        response = client_for(self.owner).get('/stories/{}/viewers/'.format(self.story.pk))
+        self.assertEqual(response.json()['view_count'], 2)
+        self.assertEqual([view['viewer'] for view in response.json()['results']], [second.pk, first.pk])
+        self.assertEqual(client_for(first).get('/stories/{}/viewers/'.format(self.story.pk)).status_code, 404)
 
-# Create your tests here.
+    def test_view_endpoint_leaves_the_flush_to_the_beat(self):
+        self.set_eager(False)
+        with mock.patch.object(flush_story_views, 'delay') as delay:
+            self.assertEqual(self.view(self.viewers[0]).status_code, 204)
+        delay.assert_not_called()
+        self.assertFalse(StoryView.objects.exists())
+        self.assertEqual(view_counts([self.story.pk]), {self.story.pk: 1})
@@ -0,0 +1,56 @@
+"""
+Stories tray.
+
+Every profile with live stories owns a sorted set of them, scored by the
+story expiration date and holding everything the tray shows of a story,
+so reading the tray never touches the Story table. The set expires with
+its last story, and expired members are trimmed whenever a story is added.
+"""
+
+import json
+import time
+
+from app.stores import get_store
+from friendship.cache import get_friend_ids
+
+
+def stories_key(profile_id):
+    return 'stories:{}'.format(profile_id)
+
+
+def publish(story):
+    """
+        Add `story` to its owner's set
+    """
+
+    store = get_store()
+    key = stories_key(story.owner_id)
+    expire_at = story.expiration_date.timestamp()
+    member = json.dumps({
+        'id': story.pk,
+        'text': story.text,
+        'created_at': story.created_at.isoformat(),
+        'expiration_date': story.expiration_date.isoformat(),
+    }, sort_keys=True)
+    store.zremrangebyscore(key, time.time())
+    store.zadd_many([key], member, expire_at, expire_at=expire_at)
+
+
+def read_tray(profile_id):
+    """
+        Live stories of the friends of `profile_id` as a list of
+        (owner_id, stories) pairs. Owners with the most recent story come
+        first, and the stories of an owner are ordered oldest first.
+    """
+
+    owners = {stories_key(friend_id): friend_id for friend_id in get_friend_ids(profile_id)}
+    if not owners:
+        return []
+
+    sets = get_store().zrevrangebyscore_many(owners, time.time())
+    # every story lives as long, so the latest expiration is the latest story
+    latest_first = sorted(sets.items(), key=lambda item: item[1][0][1], reverse=True)
+    return [
+        (owners[key], [json.loads(member) for member, _ in reversed(members)])
+        for key, members in latest_first
+    ]
@@ -1,6 +1,9 @@
 from django.urls import path
-from .views import StoryCreateAPI
+from .views import StoryCreateAPI, StoryTrayAPI, StoryViewAPI, StoryViewersAPI
 
 urlpatterns = [
     path('create_story/', StoryCreateAPI.as_view(), name='create_story'),
+    path('tray/', StoryTrayAPI.as_view(), name='stories_tray'),
+    path('<int:pk>/view/', StoryViewAPI.as_view(), name='view_story'),
+    path('<int:pk>/viewers/', StoryViewersAPI.as_view(), name='story_viewers'),
 ]
@@ -1,16 +1,23 @@
+from django.shortcuts import get_object_or_404
 from rest_framework import generics, status
+from rest_framework.exceptions import NotFound
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
-from rest_framework_simplejwt.authentication import JWTAuthentication
 
-from .models import Story
-from .serializers import StorySerializer
+from accounts.authentication import CachedJWTAuthentication
+from friendship.cache import are_friends
+from profiles.models import Profile
+from .models import Story, StoryView
+from .receipts import record_view, view_counts
+from .serializers import StorySerializer, StoryViewSerializer
+from .tasks import flush_story_views
+from .tray import read_tray
 
 
 class StoryCreateAPI(generics.CreateAPIView):
     queryset = Story.objects.all()
     serializer_class = StorySerializer
-    authentication_classes = (JWTAuthentication,)
+    authentication_classes = (CachedJWTAuthentication,)
     permission_classes = (IsAuthenticated,)
 
     def post(self, request, *args, **kwargs):
@@ -18,3 +25,64 @@ class StoryCreateAPI(generics.CreateAPIView):
         serializer.is_valid(raise_exception=True)
         serializer.save()
         return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+
+class StoryTrayAPI(generics.GenericAPIView):
+    """
+        Live stories of the user's friends grouped by owner, the owner with
+        the most recent story first
+    """
+
+    authentication_classes = (CachedJWTAuthentication,)
+    permission_classes = (IsAuthenticated,)
+
+    def get(self, request, *args, **kwargs):
+        tray = read_tray(request.user.profile.pk)
+        owners = Profile.objects.only('first_name', 'last_name').in_bulk([owner_id for owner_id, _ in tray])
+        return Response([
+            {'owner': {'id': owner_id, 'full_name': owners[owner_id].full_name}, 'stories': stories}
+            for owner_id, stories in tray if owner_id in owners
+        ], status=status.HTTP_200_OK)
+
+
+class StoryViewAPI(generics.GenericAPIView):
+    """
+        Records that the user viewed a story of one of their friends, the
+        owner's own views are not counted
+    """
+
+    authentication_classes = (CachedJWTAuthentication,)
+    permission_classes = (IsAuthenticated,)
+
+    def post(self, request, pk, *args, **kwargs):
+        story = get_object_or_404(Story.objects.only('owner', 'expiration_date'), pk=pk)
+        profile_id = request.user.profile.pk
+        if story.owner_id == profile_id:
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        if not are_friends(profile_id, story.owner_id):
+            raise NotFound()
+
+        if record_view(story, profile_id) and flush_story_views.app.conf.task_always_eager:
+            # no beat runs the periodic flush then, see the development settings
+            flush_story_views.delay()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class StoryViewersAPI(generics.ListAPIView):
+    """
+        Profiles that viewed one of the user's stories, most recent first.
+        view_count also includes the views that were not flushed yet.
+    """
+
+    authentication_classes = (CachedJWTAuthentication,)
+    permission_classes = (IsAuthenticated,)
+    serializer_class = StoryViewSerializer
+
+    def get_queryset(self):
+        return StoryView.objects.filter(story_id=self.kwargs['pk']).select_related('viewer').order_by('-viewed_at')
+
+    def list(self, request, *args, **kwargs):
+        story = get_object_or_404(Story.objects.only('owner'), pk=self.kwargs['pk'], owner=request.user.profile)
+        response = super().list(request, *args, **kwargs)
+        response.data['view_count'] = view_counts([story.pk])[story.pk]
+        return response